@@ -3,6 +3,7 @@ API FastAPI Gateway Distribuído
 Porta: 8002
 """
 
+import asyncio
 import sys
 from pathlib import Path
 
@@ -14,9 +15,13 @@ sys.path.insert(0, str(PROJECT_ROOT))
 sys.path.insert(0, str(BASE_DIR / "generated"))
 
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import Optional
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Optional, List
 from rag_client import get_client
+from transport_bench import TRANSPORT_SERVICES, configured_addresses, run_transport_benchmark
+from shared.sse import format_sse
+from shared.admission import AdmissionRejected
 
 app = FastAPI(title="RAG Distributed Gateway", version="1.0.0")
 
@@ -30,16 +35,47 @@ class IngestRequest(BaseModel):
     directory_path: str
 
 
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    top_k: Optional[int] = 5
+
+
+class TransportBenchmarkRequest(BaseModel):
+    service: str = "embedding"
+    requests: int = Field(500, ge=1, le=20000)
+    concurrency: int = Field(1, ge=1, le=64)
+
+
 @app.get("/")
-def root():
+async def root():
     return {"message": "RAG Distributed Gateway", "mode": "distributed"}
 
 
+@app.on_event("startup")
+async def startup():
+    # Canais grpc.aio criados no event loop do servidor, antes do primeiro request
+    get_client()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await get_client().close()
+
+
+@app.get("/ready")
+async def ready():
+    """Readiness: todos os serviços gRPC aquecidos (SERVING)"""
+    services = await get_client().check_ready()
+    if any(status != "SERVING" for status in services.values()):
+        raise HTTPException(status_code=503, detail={"ready": False, "services": services})
+    return {"ready": True, "services": services}
+
+
 @app.get("/health")
-def health():
+async def health():
     try:
         client = get_client()
-        stats = client.get_stats()
+        stats = await client.get_stats()
         return {
             "status": "healthy",
             "mode": "distributed",
@@ -49,30 +85,108 @@ def health():
         return {"status": "unhealthy", "mode": "distributed"}
 
 
+def overloaded(error: AdmissionRejected) -> HTTPException:
+    """Sobrecarga do LLM Service: HTTP 429 com Retry-After"""
+    return HTTPException(
+        status_code=429,
+        detail=str(error),
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+
 @app.post("/query")
-def query(request: QueryRequest):
+async def query(request: QueryRequest):
     try:
         client = get_client()
-        result = client.answer(request.query, request.top_k)
+        result = await client.answer(request.query, request.top_k)
         return result
+    except AdmissionRejected as e:
+        raise overloaded(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/query/stream")
+async def query_stream(request: QueryRequest):
+    client = get_client()
+    events = client.answer_stream(request.query, request.top_k)
+    try:
+        # A admissão acontece antes do primeiro evento: recusa vira 429, não um stream 200
+        first = await anext(events)
+    except AdmissionRejected as e:
+        raise overloaded(e)
+    
+    async def stream():
+        yield format_sse(first)
+        async for event in events:
+            yield format_sse(event)
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/search/batch")
+async def search_batch(request: BatchSearchRequest):
+    try:
+        client = get_client()
+        results = await client.search_many(request.queries, request.top_k)
+        return {"results": [
+            {"query": query, "documents": documents}
+            for query, documents in zip(request.queries, results)
+        ]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/ingest")
-def ingest(request: IngestRequest):
+@app.post("/ingest", status_code=202)
+async def ingest(request: IngestRequest):
+    """Agenda a ingestão em segundo plano; progresso em GET /ingest/{job_id}"""
     try:
         client = get_client()
-        result = client.ingest_documents(directory_path=request.directory_path)
-        return result
+        return await client.start_ingest(request.directory_path)
+    except (FileNotFoundError, NotADirectoryError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/ingest")
+async def ingest_jobs():
+    # Estado dos jobs em disco: leitura fora do event loop
+    return {"jobs": await asyncio.to_thread(get_client().jobs.list)}
+
+
+@app.get("/ingest/{job_id}")
+async def ingest_job(job_id: str):
+    job = await asyncio.to_thread(get_client().jobs.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job de ingestão não encontrado: {job_id}")
+    return job
+
+
+@app.post("/benchmark/transport")
+async def benchmark_transport(request: TransportBenchmarkRequest):
+    """Latência de um RPC pequeno via TCP loopback vs socket Unix (endereços configurados no gateway)"""
+    if request.service not in TRANSPORT_SERVICES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Serviço inválido: {request.service} (use {', '.join(TRANSPORT_SERVICES)})"
+        )
+    return await run_transport_benchmark(
+        request.service,
+        configured_addresses(request.service),
+        requests=request.requests,
+        concurrency=request.concurrency
+    )
+
+
 @app.get("/stats")
-def stats():
+async def stats():
     client = get_client()
-    return client.get_stats()
+    return await client.get_stats()
 
 
 if __name__ == "__main__":
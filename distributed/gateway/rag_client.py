@@ -2,10 +2,14 @@
 Cliente gRPC para RAG Distribuído
 """
 
+import asyncio
+import collections
 import grpc
 import sys
+import time
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
+import numpy as np
 import os
 
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
@@ -16,39 +20,95 @@ from generated import (
     vector_service_pb2, vector_service_pb2_grpc,
     llm_service_pb2, llm_service_pb2_grpc
 )
-from shared.ingest import process_documents_for_ingestion
+from grpc_health.v1 import health_pb2
+from shared.ingest import collect_files, iter_incremental_batches, source_key
 from shared.path_utils import resolve_directory_path
+from shared.metrics import Histogram, LATENCY_BUCKETS, unflatten_metrics
+from shared.prompt import build_prompt, format_sources
+from shared.context import ContextPacker
+from shared.packing import unpack_matrix
+from shared.llm import GENERATION_ERROR
+from shared.semantic_cache import SemanticCache
+from shared.singleflight import AsyncSingleFlight
+from shared.admission import AdmissionRejected, RETRY_AFTER_METADATA_KEY
+from shared.query_cache import normalize_query
+from shared.grpc_options import ChannelPool, service_addresses
+from shared.jobs import IngestJob, JobRegistry, PriorityGate
+from resilience import ResilientCaller
 
 
 class RAGDistributedClient:
-    """Cliente para pipeline RAG distribuído via gRPC"""
+    """Cliente assíncrono (grpc.aio) para pipeline RAG distribuído"""
     
     def __init__(self):
         print("\n" + "="*60)
         print("INICIALIZANDO CLIENTE gRPC DISTRIBUÍDO")
         print("="*60)
         
-        # Conectar aos serviços gRPC
-        self.embedding_channel = grpc.insecure_channel('localhost:50051')
-        self.vector_channel = grpc.insecure_channel('localhost:50052')
-        self.llm_channel = grpc.insecure_channel('localhost:50053')
+        # Conectar aos serviços gRPC: vários canais aio por endereço, criados dentro do event loop
+        self.embedding_pool = ChannelPool(
+            service_addresses('EMBEDDING_SERVICE', 'localhost:50051'),
+            embedding_service_pb2_grpc.EmbeddingServiceStub, aio=True
+        )
+        vector_addresses = service_addresses('VECTOR_SERVICE', 'localhost:50052')
+        self.vector_pool = ChannelPool(vector_addresses, vector_service_pb2_grpc.VectorServiceStub, aio=True)
+        # A ingestão escreve pela primeira réplica; as demais são somente leitura (--read-only,
+        # acompanham o índice NumPy da primária) ou usam o mesmo servidor Chroma
+        self.vector_write_pool = self.vector_pool
+        if len(vector_addresses) > 1:
+            self.vector_write_pool = ChannelPool(
+                vector_addresses[:1], vector_service_pb2_grpc.VectorServiceStub, aio=True
+            )
+        self.llm_pool = ChannelPool(
+            service_addresses('LLM_SERVICE', 'localhost:50053'),
+            llm_service_pb2_grpc.LLMServiceStub, aio=True
+        )
+        self.pools = {"embedding": self.embedding_pool, "vector": self.vector_pool, "llm": self.llm_pool}
         
-        self.embedding_stub = embedding_service_pb2_grpc.EmbeddingServiceStub(self.embedding_channel)
-        self.vector_stub = vector_service_pb2_grpc.VectorServiceStub(self.vector_channel)
-        self.llm_stub = llm_service_pb2_grpc.LLMServiceStub(self.llm_channel)
+        # Deadline, retries e hedging por RPC
+        self.rpc = ResilientCaller()
         
         self.top_k = int(os.getenv('TOP_K_RESULTS', '5'))
-        self.max_context_length = int(os.getenv('MAX_CONTEXT_LENGTH', '2000'))
+        # EmbedAndSearch no Vector Service: desligado sozinho se o serviço não o implementa
+        self.fused_retrieval = os.getenv('FUSED_RETRIEVAL_ENABLED', 'true').lower() == 'true'
+        self.context_packer = ContextPacker()
+        self.ingest_batch_size = int(os.getenv('INGEST_BATCH_SIZE', '64'))
+        self.ingest_max_in_flight = int(os.getenv('INGEST_MAX_IN_FLIGHT', '4'))
+        
+        # Ingestão em segundo plano, cedendo a vez às consultas
+        self.jobs = JobRegistry("distributed")
+        self.priority = PriorityGate()
+        
+        self.ttft_histogram = Histogram(LATENCY_BUCKETS)
+        self.stream_total_histogram = Histogram(LATENCY_BUCKETS)
         
-        print("   Embedding Service: localhost:50051")
-        print("   Vector Service: localhost:50052")
-        print("   LLM Service: localhost:50053")
+        self.semantic_cache = None
+        if os.getenv('SEMANTIC_CACHE_ENABLED', 'true').lower() == 'true':
+            self.semantic_cache = SemanticCache("distributed")
+        
+        self.single_flight = None
+        if os.getenv('SINGLE_FLIGHT_ENABLED', 'true').lower() == 'true':
+            self.single_flight = AsyncSingleFlight()
+        
+        print(f"   Embedding Service: {', '.join(self.embedding_pool.addresses)}")
+        print(f"   Vector Service: {', '.join(self.vector_pool.addresses)}")
+        print(f"   LLM Service: {', '.join(self.llm_pool.addresses)}")
+        print(f"   Balanceamento: {self.embedding_pool.policy}, "
+              f"{self.embedding_pool.channels_per_address} canais por endereço")
         print("="*60)
         print("CLIENTE gRPC PRONTO!")
         print("="*60 + "\n")
     
-    def ingest_documents(self, file_paths: List[str] = None, 
-                        directory_path: str = None) -> Dict[str, Any]:
+    async def start_ingest(self, directory_path: str) -> Dict[str, Any]:
+        """Agenda a ingestão no event loop e retorna o job (progresso em self.jobs)"""
+        # Acesso ao disco (diretório e estado do job) fora do event loop
+        directory = str(await asyncio.to_thread(resolve_directory_path, directory_path))
+        job = await asyncio.to_thread(self.jobs.create, directory)
+        self.jobs.run_in_loop(job, lambda job: self.ingest_documents(directory_path=directory, progress=job))
+        return job.to_dict()
+    
+    async def ingest_documents(self, file_paths: List[str] = None, 
+                              directory_path: str = None, progress: IngestJob = None) -> Dict[str, Any]:
         """Ingere documentos via gRPC"""
         print("\nIngestão Distribuída (gRPC)")
         
@@ -59,82 +119,198 @@ class RAGDistributedClient:
             except (FileNotFoundError, NotADirectoryError, ValueError) as e:
                 return {"status": "error", "message": str(e)}
         
-        texts, metadatas = process_documents_for_ingestion(file_paths, resolved_directory)
+        files = await asyncio.to_thread(collect_files, file_paths, resolved_directory)
         
-        if not texts:
+        if not files:
             return {"status": "error", "message": "Nenhum documento"}
+        # O progresso grava o estado do job em disco: chamadas do event loop vão para threads
+        if progress is not None:
+            await asyncio.to_thread(progress.set_files_total, len(files))
+        
+        counts = {"added": 0, "updated": 0, "unchanged": 0, "deleted": 0}
+        errors = []
+        loop = asyncio.get_running_loop()
+        
+        async def sync_source_call(request):
+            return await self.rpc.call(
+                "SyncSource", self.vector_write_pool, lambda stub, timeout: stub.SyncSource(request, timeout=timeout)
+            )
+        
+        def sync_source(source, ids, metadatas):
+            # Executado na thread de leitura dos arquivos; o RPC roda no event loop
+            sync_response = asyncio.run_coroutine_threadsafe(sync_source_call(
+                vector_service_pb2.SyncSourceRequest(
+                    source=source,
+                    ids=ids,
+                    metadatas=[
+                        vector_service_pb2.Metadata(data={str(k): str(v) for k, v in meta.items()})
+                        for meta in metadatas
+                    ]
+                )
+            ), loop).result()
+            counts["updated"] += sync_response.updated
+            counts["unchanged"] += sync_response.unchanged
+            counts["deleted"] += sync_response.deleted
+            if progress is not None:
+                progress.file_done()
+            return list(sync_response.missing)
+        
+        # Só chunks novos ou alterados seguem para o embedding
+        batches = iter_incremental_batches(files, sync_source, self.ingest_batch_size)
+        
+        # Lotes já enviados ao embedding e ainda não repassados ao vector store
+        in_flight = asyncio.Semaphore(self.ingest_max_in_flight)
+        pending = collections.deque()
+        to_store = asyncio.Queue()
+        
+        async def embed_requests():
+            try:
+                while True:
+                    # Leitura e chunking dos arquivos fora do event loop
+                    batch = await asyncio.to_thread(next, batches, None)
+                    if batch is None:
+                        return
+                    await in_flight.acquire()
+                    # Consultas em andamento passam na frente do lote (INGEST_PRIORITY=low)
+                    await self.priority.wait_background_async()
+                    pending.append(batch)
+                    yield embedding_service_pb2.EmbedTextsRequest(texts=batch[0], packed=True)
+            except Exception as e:
+                # O grpc.aio apenas cancela a chamada; o erro fica para o chamador
+                errors.append(e)
+                raise
+        
+        async def add_requests():
+            while True:
+                request = await to_store.get()
+                if request is None:
+                    return
+                yield request
+                in_flight.release()
+                if progress is not None:
+                    await asyncio.to_thread(progress.add_written, len(request.texts))
         
         try:
-            # 1. Gerar embeddings via gRPC
-            print(f"[gRPC] Gerando embeddings...")
-            embed_request = embedding_service_pb2.EmbedTextsRequest(texts=texts)
-            embed_response = self.embedding_stub.EmbedTexts(embed_request)
-            embeddings = [list(emb.values) for emb in embed_response.embeddings]
-            print(f"   {len(embeddings)} embeddings recebidos")
+            # 1. Embeddings e escrita no vector store em paralelo (streaming gRPC)
+            print(f"[gRPC] Ingestão em streaming (lotes de {self.ingest_batch_size})...")
+            # Streams presos a uma réplica; escritas sempre pela réplica primária do Vector Service
+            with self.vector_write_pool.lease() as vector_stub, self.embedding_pool.lease() as embedding_stub:
+                add_call = vector_stub.AddDocumentsStream(
+                    add_requests(), timeout=self.rpc.timeout("AddDocumentsStream")
+                )
+                embed_call = embedding_stub.EmbedTextsStream(
+                    embed_requests(), timeout=self.rpc.timeout("EmbedTextsStream")
+                )
+                
+                async def store():
+                    try:
+                        return await add_call
+                    except grpc.RpcError:
+                        # Falha no vector store interrompe o envio de novos lotes
+                        embed_call.cancel()
+                        raise
+                
+                add_task = asyncio.ensure_future(store())
+                
+                chunks_embedded = 0
+                try:
+                    async for embed_response in embed_call:
+                        texts, metadatas, ids = pending.popleft()
+                        matrix = embed_response.matrix
+                        
+                        # Os bytes seguem adiante sem decodificação no gateway
+                        metadata_messages = [
+                            vector_service_pb2.Metadata(
+                                data={str(k): str(v) for k, v in meta.items()}
+                            ) for meta in metadatas
+                        ]
+                        to_store.put_nowait(vector_service_pb2.AddDocumentsRequest(
+                            texts=texts,
+                            ids=ids,
+                            metadatas=metadata_messages,
+                            matrix=vector_service_pb2.EmbeddingMatrix(
+                                data=matrix.data, rows=matrix.rows, dim=matrix.dim
+                            )
+                        ))
+                        chunks_embedded += matrix.rows
+                        if progress is not None:
+                            await asyncio.to_thread(progress.add_embedded, matrix.rows)
+                        print(f"   {chunks_embedded} embeddings recebidos")
+                except asyncio.CancelledError:
+                    # Chamada cancelada por erro na leitura ou no vector store (tratados abaixo)
+                    if not errors and not add_task.done():
+                        raise
+                finally:
+                    to_store.put_nowait(None)
+                
+                if errors:
+                    raise errors[0]
+                
+                # 2. Aguarda o vector store confirmar todos os lotes
+                add_response = await add_task
+                counts["added"] = add_response.documents_added
+                total_documents = add_response.total_documents
             
-            # 2. Adicionar ao vector store via gRPC
-            print(f"[gRPC] Adicionando ao vector store...")
+            # 3. Remove fontes que saíram do diretório
+            if resolved_directory:
+                prune_request = vector_service_pb2.PruneSourcesRequest(
+                    directory=resolved_directory,
+                    keep_sources=[source_key(f) for f in files]
+                )
+                prune_response = await self.rpc.call(
+                    "PruneSources", self.vector_write_pool, lambda stub, timeout: stub.PruneSources(prune_request, timeout=timeout)
+                )
+                counts["deleted"] += prune_response.deleted
+                if prune_response.deleted:
+                    total_documents = (await self._get_count()).count
             
-            embedding_messages = [vector_service_pb2.Embedding(values=emb) for emb in embeddings]
-            metadata_messages = [
-                vector_service_pb2.Metadata(
-                    data={str(k): str(v) for k, v in meta.items()}
-                ) for meta in metadatas
-            ]
-            
-            add_request = vector_service_pb2.AddDocumentsRequest(
-                texts=texts,
-                embeddings=embedding_messages,
-                metadatas=metadata_messages
-            )
-            add_response = self.vector_stub.AddDocuments(add_request)
+            if counts["added"] or counts["updated"] or counts["deleted"]:
+                await self._invalidate_answers()
             
-            print(f"   {add_response.documents_added} documentos adicionados")
+            print(f"   Ingestão: {counts}")
             
             return {
                 "status": "success",
-                "chunks_added": add_response.documents_added,
-                "total_documents": add_response.total_documents
+                "chunks_added": counts["added"],
+                "chunks_updated": counts["updated"],
+                "chunks_unchanged": counts["unchanged"],
+                "chunks_deleted": counts["deleted"],
+                "total_documents": total_documents
             }
         except grpc.RpcError as e:
-            return {"status": "error", "message": f"gRPC Error: {e.code()}"}
+            # Ingestão parcial pode ter alterado a base
+            await self._invalidate_answers()
+            return {"status": "error", "message": f"gRPC Error: {e.code()}"
+                    + (f" ({e.details()})" if e.details() else "")}
         except Exception as e:
+            await self._invalidate_answers()
             return {"status": "error", "message": str(e)}
     
-    def answer(self, query: str, top_k: int = None) -> Dict[str, Any]:
-        """Responde pergunta via gRPC"""
+    async def answer(self, query: str, top_k: int = None) -> Dict[str, Any]:
+        """Responde pergunta (consultas idênticas simultâneas compartilham a execução)"""
         if top_k is None:
             top_k = self.top_k
+        if self.single_flight is None:
+            return await self._answer(query, top_k)
         
+        result, coalesced = await self.single_flight.do(
+            (normalize_query(query), top_k),
+            lambda: self._answer(query, top_k)
+        )
+        if coalesced:
+            return {**result, "query": query, "coalesced": True}
+        return result
+    
+    async def _answer(self, query: str, top_k: int) -> Dict[str, Any]:
+        """Responde pergunta via gRPC"""
         print("\n" + "="*60)
         print(f"QUERY DISTRIBUÍDA (gRPC): {query}")
         print("="*60)
         
         try:
-            # 1. Gerar embedding da query via gRPC
-            print(f"[gRPC] Gerando embedding...")
-            embed_request = embedding_service_pb2.EmbedQueryRequest(text=query)
-            embed_response = self.embedding_stub.EmbedQuery(embed_request)
-            query_embedding = list(embed_response.embedding)
-            print(f"   Embedding gerado")
-            
-            # 2. Buscar documentos via gRPC
-            print(f"[gRPC] Buscando documentos...")
-            search_request = vector_service_pb2.SearchRequest(
-                query_embedding=query_embedding,
-                top_k=top_k
-            )
-            search_response = self.vector_stub.Search(search_request)
-            
-            documents = []
-            for doc in search_response.documents:
-                documents.append({
-                    'text': doc.text,
-                    'metadata': dict(doc.metadata),
-                    'score': doc.score
-                })
-            
-            print(f"   {len(documents)} documentos encontrados")
+            # 1-2. Embedding da query e busca de documentos via gRPC
+            with self.priority.interactive():
+                query_embedding, documents = await self._retrieve(query, top_k)
             
             if not documents:
                 return {
@@ -145,48 +321,40 @@ class RAGDistributedClient:
                     "mode": "distributed"
                 }
             
-            # 3. Construir prompt
-            context_parts = []
-            for doc in documents:
-                source = doc['metadata'].get('source', 'Desconhecido')
-                context_parts.append(f"[Fonte: {source}]\n{doc['text']}")
+            sources = format_sources(documents)
+            chunk_ids = [doc['id'] for doc in documents]
             
-            context = "\n\n---\n\n".join(context_parts)
-            if len(context) > self.max_context_length:
-                context = context[:self.max_context_length] + "..."
+            # 3. Pergunta equivalente sobre os mesmos chunks já respondida
+            cached = await self._lookup_answer(query_embedding, chunk_ids)
+            if cached is not None:
+                return {
+                    "query": query,
+                    "answer": cached["answer"],
+                    "sources": sources,
+                    "context_used": len(documents),
+                    "mode": "distributed",
+                    "architecture": "microservices (gRPC)",
+                    "cached": True,
+                    "cache_similarity": cached["similarity"]
+                }
             
-            prompt = f"""Você é um assistente de onboarding corporativo.
-
-CONTEXTO:
-{context}
-
-PERGUNTA: {query}
-
-INSTRUÇÕES:
-- Use APENAS as informações do contexto
-- Seja claro e objetivo
-- Cite as fontes
-
-RESPOSTA:"""
+            # 4. Construir prompt (chunks inteiros dentro do orçamento de tokens)
+            context, context_info = self.context_packer.pack(documents)
+            prompt = build_prompt(query, context)
+            prompt_tokens = self.context_packer.observe_prompt(prompt)
             
-            # 4. Gerar resposta via gRPC
+            # 5. Gerar resposta via gRPC
             print(f"[gRPC] Gerando resposta...")
             generate_request = llm_service_pb2.GenerateRequest(
                 prompt=prompt,
                 temperature=0.7
             )
-            generate_response = self.llm_stub.Generate(generate_request)
+            generate_response = await self.rpc.call(
+                "Generate", self.llm_pool, lambda stub, timeout: stub.Generate(generate_request, timeout=timeout)
+            )
             answer_text = generate_response.text
             print(f"   Resposta gerada")
-            
-            # 5. Preparar resposta
-            sources = []
-            for doc in documents:
-                sources.append({
-                    'source': doc['metadata'].get('source', 'Desconhecido'),
-                    'score': round(doc['score'], 4),
-                    'excerpt': doc['text'][:150] + "..."
-                })
+            await self._store_answer(query_embedding, chunk_ids, answer_text)
             
             print("="*60)
             print("RESPOSTA GERADA (DISTRIBUÍDO - gRPC)")
@@ -198,10 +366,15 @@ RESPOSTA:"""
                 "sources": sources,
                 "context_used": len(documents),
                 "mode": "distributed",
-                "architecture": "microservices (gRPC)"
+                "architecture": "microservices (gRPC)",
+                "prompt_tokens": prompt_tokens,
+                "context_tokens": context_info["context_tokens"],
+                "cached": False
             }
         
         except grpc.RpcError as e:
+            if e.code() == grpc.StatusCode.RESOURCE_EXHAUSTED:
+                raise self._admission_error(e)
             return {
                 "query": query,
                 "answer": f"Erro gRPC: {e.code()}",
@@ -218,24 +391,312 @@ RESPOSTA:"""
                 "mode": "distributed"
             }
     
-    def get_stats(self) -> Dict[str, Any]:
-        """Retorna estatísticas via gRPC"""
+    async def answer_stream(self, query: str, top_k: int = None) -> AsyncIterator[Dict[str, Any]]:
+        """Responde pergunta em eventos: fontes primeiro, depois tokens (GenerateStream)
+        
+        A admissão no LLM Service é confirmada antes do primeiro evento: sobrecarga
+        levanta AdmissionRejected na primeira iteração, antes de o stream começar.
+        """
+        if top_k is None:
+            top_k = self.top_k
+        
+        started_at = time.perf_counter()
+        print(f"\nQUERY DISTRIBUÍDA (gRPC, streaming): {query}")
+        
+        # Depois dos headers 200 toda falha vira um evento de erro, nunca um stream truncado
         try:
-            count_request = vector_service_pb2.CountRequest()
-            count_response = self.vector_stub.GetCount(count_request)
-            
-            return {
-                "total_documents": count_response.count,
-                "mode": "distributed (gRPC)"
+            with self.priority.interactive():
+                query_embedding, documents = await self._retrieve(query, top_k)
+            sources_event = {"event": "sources", "data": {
+                "query": query,
+                "sources": format_sources(documents),
+                "context_used": len(documents),
+                "mode": "distributed"
+            }}
+            chunk_ids = [doc['id'] for doc in documents]
+            cached = await self._lookup_answer(query_embedding, chunk_ids) if documents else None
+            if documents and cached is None:
+                context, _ = self.context_packer.pack(documents)
+                prompt = build_prompt(query, context)
+                prompt_tokens = self.context_packer.observe_prompt(prompt)
+        except grpc.RpcError as e:
+            yield {"event": "error", "data": {"message": f"Erro gRPC: {e.code()}"}}
+            return
+        except Exception as e:
+            print(f"Erro ao preparar a resposta (streaming): {e}")
+            yield {"event": "error", "data": {"message": f"Erro: {e}"}}
+            return
+        
+        if not documents:
+            yield sources_event
+            yield {"event": "token", "data": {"text": "Nenhum documento encontrado"}}
+            yield {"event": "done", "data": {"total_time": time.perf_counter() - started_at}}
+            return
+        
+        if cached is not None:
+            yield sources_event
+            yield {"event": "token", "data": {"text": cached["answer"]}}
+            yield {"event": "done", "data": {
+                "total_time": time.perf_counter() - started_at,
+                "cached": True
+            }}
+            return
+        
+        generate_request = llm_service_pb2.GenerateRequest(prompt=prompt, temperature=0.7)
+        
+        time_to_first_token = None
+        tokens = []
+        with self.llm_pool.lease() as llm_stub:
+            stream = llm_stub.GenerateStream(generate_request, timeout=self.rpc.timeout("GenerateStream"))
+            try:
+                # O LLM Service envia um chunk vazio ao admitir a geração; a recusa
+                # (RESOURCE_EXHAUSTED) chega aqui, antes de qualquer evento
+                try:
+                    chunk = await stream.read()
+                except grpc.RpcError as e:
+                    if e.code() == grpc.StatusCode.RESOURCE_EXHAUSTED:
+                        raise self._admission_error(e)
+                    raise
+                
+                yield sources_event
+                while chunk is not grpc.aio.EOF and not chunk.done:
+                    if chunk.text:
+                        if time_to_first_token is None:
+                            time_to_first_token = time.perf_counter() - started_at
+                            self.ttft_histogram.observe(time_to_first_token)
+                        tokens.append(chunk.text)
+                        yield {"event": "token", "data": {"text": chunk.text}}
+                    chunk = await stream.read()
+            except AdmissionRejected:
+                raise
+            except grpc.RpcError as e:
+                yield {"event": "error", "data": {"message": f"Erro gRPC: {e.code()}"}}
+                return
+            except Exception as e:
+                print(f"Erro no streaming do LLM: {e}")
+                yield {"event": "error", "data": {"message": f"Erro: {e}"}}
+                return
+            finally:
+                # Cliente desconectado no meio do stream: libera o LLM Service
+                stream.cancel()
+        
+        total_time = time.perf_counter() - started_at
+        self.stream_total_histogram.observe(total_time)
+        try:
+            await self._store_answer(query_embedding, chunk_ids, "".join(tokens))
+        except Exception as e:
+            # A resposta já foi entregue; só o cache fica sem ela
+            print(f"Erro ao guardar a resposta no cache semântico: {e}")
+        yield {"event": "done", "data": {
+            "time_to_first_token": time_to_first_token,
+            "total_time": total_time,
+            "prompt_tokens": prompt_tokens,
+            "cached": False
+        }}
+    
+    async def _retrieve(self, query: str, top_k: int) -> Tuple[np.ndarray, List[Dict[str, Any]]]:
+        """Embedding da query + busca vetorial via gRPC"""
+        if self.fused_retrieval:
+            try:
+                return await self._embed_and_search(query, top_k)
+            except grpc.RpcError as e:
+                if e.code() != grpc.StatusCode.UNIMPLEMENTED:
+                    raise
+                print("   Vector Service sem EmbedAndSearch; usando EmbedQuery + Search")
+                self.fused_retrieval = False
+        
+        print(f"[gRPC] Gerando embedding...")
+        embed_request = embedding_service_pb2.EmbedQueryRequest(text=query, packed=True)
+        embed_response = await self.rpc.call(
+            "EmbedQuery", self.embedding_pool, lambda stub, timeout: stub.EmbedQuery(embed_request, timeout=timeout)
+        )
+        query_matrix = embed_response.matrix
+        
+        print(f"[gRPC] Buscando documentos...")
+        search_request = vector_service_pb2.SearchRequest(
+            top_k=top_k,
+            query_matrix=vector_service_pb2.EmbeddingMatrix(
+                data=query_matrix.data, rows=query_matrix.rows, dim=query_matrix.dim
+            )
+        )
+        search_response = await self.rpc.call(
+            "Search", self.vector_pool, lambda stub, timeout: stub.Search(search_request, timeout=timeout)
+        )
+        
+        documents = self._to_documents(search_response.documents)
+        print(f"   {len(documents)} documentos encontrados")
+        query_embedding = unpack_matrix(query_matrix.data, query_matrix.rows, query_matrix.dim)[0]
+        return query_embedding, documents
+    
+    async def _embed_and_search(self, query: str, top_k: int) -> Tuple[np.ndarray, List[Dict[str, Any]]]:
+        """Embedding + busca numa única chamada ao Vector Service"""
+        print(f"[gRPC] Buscando documentos (EmbedAndSearch)...")
+        request = vector_service_pb2.EmbedAndSearchRequest(text=query, top_k=top_k)
+        response = await self.rpc.call(
+            "EmbedAndSearch", self.vector_pool, lambda stub, timeout: stub.EmbedAndSearch(request, timeout=timeout)
+        )
+        documents = self._to_documents(response.documents)
+        print(f"   {len(documents)} documentos encontrados")
+        query_matrix = response.query_matrix
+        query_embedding = unpack_matrix(query_matrix.data, query_matrix.rows, query_matrix.dim)[0]
+        return query_embedding, documents
+    
+    @staticmethod
+    def _to_documents(documents) -> List[Dict[str, Any]]:
+        return [
+            {
+                'id': doc.id,
+                'text': doc.text,
+                'metadata': dict(doc.metadata),
+                'score': doc.score
             }
-        except:
+            for doc in documents
+        ]
+    
+    async def _lookup_answer(self, query_embedding: np.ndarray, chunk_ids: List[str]) -> Optional[Dict[str, Any]]:
+        """Consulta o cache semântico de respostas"""
+        if self.semantic_cache is None:
+            return None
+        # Fora do event loop: busca por similaridade sob o lock do cache
+        cached = await asyncio.to_thread(self.semantic_cache.lookup, query_embedding, chunk_ids)
+        if cached is not None:
+            print(f"   Cache semântico: hit (similaridade {cached['similarity']:.3f})")
+        return cached
+    
+    async def _store_answer(self, query_embedding: np.ndarray, chunk_ids: List[str], answer_text: str) -> None:
+        """Guarda resposta no cache semântico (falhas de geração não são guardadas)"""
+        if self.semantic_cache is not None and answer_text and not answer_text.startswith(GENERATION_ERROR):
+            await asyncio.to_thread(self.semantic_cache.put, query_embedding, chunk_ids, answer_text)
+    
+    @staticmethod
+    def _admission_error(error: grpc.RpcError) -> AdmissionRejected:
+        """RESOURCE_EXHAUSTED do LLM Service -> AdmissionRejected (HTTP 429)"""
+        retry_after = 1
+        for key, value in error.trailing_metadata() or ():
+            if key == RETRY_AFTER_METADATA_KEY:
+                retry_after = int(value)
+        return AdmissionRejected(error.details() or "LLM Service sobrecarregado", retry_after)
+    
+    async def _invalidate_answers(self) -> None:
+        if self.semantic_cache is not None:
+            await asyncio.to_thread(self.semantic_cache.clear)
+    
+    async def search_many(self, queries: List[str], top_k: int = None) -> List[List[Dict[str, Any]]]:
+        """Busca em lote via gRPC: EmbedQueries + BatchSearch (2 round-trips para N queries)"""
+        if top_k is None:
+            top_k = self.top_k
+        
+        embed_request = embedding_service_pb2.EmbedTextsRequest(texts=queries, packed=True)
+        with self.priority.interactive():
+            embed_response = await self.rpc.call(
+                "EmbedQueries", self.embedding_pool, lambda stub, timeout: stub.EmbedQueries(embed_request, timeout=timeout)
+            )
+            matrix = embed_response.matrix
+            
+            search_request = vector_service_pb2.BatchSearchRequest(
+                top_k=top_k,
+                query_matrix=vector_service_pb2.EmbeddingMatrix(
+                    data=matrix.data, rows=matrix.rows, dim=matrix.dim
+                )
+            )
+            search_response = await self.rpc.call(
+                "BatchSearch", self.vector_pool, lambda stub, timeout: stub.BatchSearch(search_request, timeout=timeout)
+            )
+        
+        return [
+            [
+                {
+                    'text': doc.text,
+                    'metadata': dict(doc.metadata),
+                    'score': doc.score,
+                    'rank': rank + 1
+                }
+                for rank, doc in enumerate(result.documents)
+            ]
+            for result in search_response.results
+        ]
+    
+    async def get_stats(self) -> Dict[str, Any]:
+        """Retorna estatísticas via gRPC (consultas aos serviços em paralelo)"""
+        count_response, embedding_response, llm_response = await asyncio.gather(
+            self._get_count(),
+            self.rpc.call("EmbeddingGetStats", self.embedding_pool, lambda stub, timeout: stub.GetStats(
+                embedding_service_pb2.StatsRequest(), timeout=timeout
+            )),
+            self.rpc.call("LlmGetStats", self.llm_pool, lambda stub, timeout: stub.GetStats(
+                llm_service_pb2.StatsRequest(), timeout=timeout
+            )),
+            return_exceptions=True
+        )
+        
+        if isinstance(count_response, Exception):
             return {"total_documents": 0, "mode": "distributed (gRPC - error)"}
+        
+        stats = {
+            "total_documents": count_response.count,
+            "mode": "distributed (gRPC)"
+        }
+        
+        stats["streaming"] = {
+            "time_to_first_token_s": self.ttft_histogram.get_stats(),
+            "total_time_s": self.stream_total_histogram.get_stats()
+        }
+        
+        stats["context"] = self.context_packer.get_stats()
+        stats["fused_retrieval"] = self.fused_retrieval
+        stats["rpc"] = self.rpc.get_stats()
+        stats["channels"] = {name: pool.get_stats() for name, pool in self.pools.items()}
+        
+        if self.semantic_cache is None:
+            stats["semantic_cache"] = {"enabled": False}
+        else:
+            stats["semantic_cache"] = {"enabled": True, **self.semantic_cache.get_stats()}
+        
+        if self.single_flight is None:
+            stats["single_flight"] = {"enabled": False}
+        else:
+            stats["single_flight"] = {"enabled": True, **self.single_flight.get_stats()}
+        
+        stats["ingest_priority"] = self.priority.get_stats()
+        
+        for name, response in (("embedding_service", embedding_response), ("llm_service", llm_response)):
+            if isinstance(response, grpc.RpcError):
+                stats[name] = {"error": str(response.code())}
+            elif isinstance(response, Exception):
+                stats[name] = {"error": str(response)}
+            else:
+                stats[name] = unflatten_metrics(dict(response.metrics))
+        
+        return stats
+    
+    async def _get_count(self):
+        return await self.rpc.call(
+            "GetCount", self.vector_pool, lambda stub, timeout: stub.GetCount(vector_service_pb2.CountRequest(), timeout=timeout)
+        )
+    
+    async def check_ready(self, timeout: float = 2.0) -> Dict[str, str]:
+        """Estado de readiness de cada serviço (SERVING após o warm-up)"""
+        async def check(stub):
+            try:
+                response = await stub.Check(health_pb2.HealthCheckRequest(), timeout=timeout)
+                return health_pb2.HealthCheckResponse.ServingStatus.Name(response.status)
+            except grpc.RpcError as e:
+                return str(e.code().name)
+        
+        async def check_service(pool):
+            # Serviço pronto se alguma réplica está SERVING
+            statuses = await asyncio.gather(*(check(replica.health_stub) for replica in pool.replicas))
+            return "SERVING" if "SERVING" in statuses else statuses[0]
+        
+        statuses = await asyncio.gather(*(check_service(pool) for pool in self.pools.values()))
+        return dict(zip(self.pools, statuses))
     
-    def close(self):
-        """Fecha canais gRPC"""
-        self.embedding_channel.close()
-        self.vector_channel.close()
-        self.llm_channel.close()
+    async def close(self):
+        """Fecha canais gRPC e grava o cache semântico"""
+        pools = {*self.pools.values(), self.vector_write_pool}
+        await asyncio.gather(*(pool.aclose() for pool in pools))
+        if self.semantic_cache is not None:
+            await asyncio.to_thread(self.semantic_cache.close)
 
 
 # Singleton
@@ -0,0 +1,228 @@
+"""
+Deadlines, retries e hedging das chamadas gRPC do gateway
+"""
+
+import asyncio
+import os
+import random
+import re
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import grpc
+
+from shared.grpc_options import ChannelPool
+
+# RPC: (deadline em segundos, retries, hedging); 0 = sem deadline
+DEFAULT_POLICIES = {
+    "EmbedQuery": (2, 2, True),
+    "Search": (2, 2, True),
+    "EmbedAndSearch": (3, 2, True),
+    "EmbedQueries": (10, 2, False),
+    "BatchSearch": (10, 2, False),
+    "GetCount": (2, 2, False),
+    "EmbeddingGetStats": (2, 1, False),
+    "LlmGetStats": (2, 1, False),
+    "Generate": (120, 0, False),
+    "GenerateStream": (120, 0, False),
+    "SyncSource": (30, 0, False),
+    "PruneSources": (30, 0, False),
+    "EmbedTextsStream": (3600, 0, False),
+    "AddDocumentsStream": (3600, 0, False),
+}
+
+# Falhas transitórias; os RPCs com retries > 0 são idempotentes
+RETRYABLE_CODES = (grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED)
+
+
+def _env_name(rpc: str) -> str:
+    """EmbedAndSearch -> EMBED_AND_SEARCH"""
+    return re.sub(r'(?<!^)(?=[A-Z])', '_', rpc).upper()
+
+
+class HedgeBudget:
+    """Token bucket: cada chamada rende uma fração de token, cada hedge gasta um inteiro"""
+    
+    def __init__(self, ratio: float, burst: float):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = 0.0
+        self.throttled = 0
+    
+    def on_call(self) -> None:
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+    
+    def try_acquire(self) -> bool:
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        # Sem saldo (ex.: réplicas todas lentas): não duplica a carga
+        self.throttled += 1
+        return False
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "percent": round(self.ratio * 100, 2),
+            "burst": self.burst,
+            "tokens": round(self.tokens, 2),
+            "throttled": self.throttled
+        }
+
+
+class CallPolicy:
+    """Deadline, retries e hedging de um RPC (GRPC_<RPC>_TIMEOUT, _RETRIES, _HEDGE)"""
+    
+    def __init__(self, rpc: str, timeout: float, retries: int, hedge: bool, latency_window: int):
+        prefix = f"GRPC_{_env_name(rpc)}"
+        self.rpc = rpc
+        self.timeout = float(os.getenv(f"{prefix}_TIMEOUT", str(timeout))) or None
+        self.retries = int(os.getenv(f"{prefix}_RETRIES", str(retries)))
+        self.hedge = os.getenv(f"{prefix}_HEDGE", str(hedge)).lower() == 'true'
+        
+        self.latencies = deque(maxlen=latency_window)
+        self.calls = 0
+        self.failures = 0
+        self.retried = 0
+        self.deadline_exceeded = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+    
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Percentil das latências recentes com sucesso (None sem amostras)"""
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[int(fraction * (len(ordered) - 1))]
+    
+    def get_stats(self) -> Dict[str, Any]:
+        p50 = self.percentile(0.5)
+        p95 = self.percentile(0.95)
+        return {
+            "timeout_s": self.timeout or 0,
+            "retries": self.retries,
+            "hedge": self.hedge,
+            "calls": self.calls,
+            "failures": self.failures,
+            "retried": self.retried,
+            "deadline_exceeded": self.deadline_exceeded,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "p50_ms": round(p50 * 1000, 3) if p50 is not None else 0,
+            "p95_ms": round(p95 * 1000, 3) if p95 is not None else 0
+        }
+
+
+class ResilientCaller:
+    """Executa RPCs unários com deadline, retries com jitter e hedging no p95"""
+    
+    def __init__(self, hedging_enabled: bool = None, backoff_ms: float = None,
+                 max_backoff_ms: float = None, hedge_min_samples: int = None,
+                 latency_window: int = None, hedge_budget_percent: float = None,
+                 hedge_burst: float = None):
+        if hedging_enabled is None:
+            hedging_enabled = os.getenv('GRPC_HEDGING_ENABLED', 'false').lower() == 'true'
+        if backoff_ms is None:
+            backoff_ms = float(os.getenv('GRPC_RETRY_BACKOFF_MS', '50'))
+        if max_backoff_ms is None:
+            max_backoff_ms = float(os.getenv('GRPC_RETRY_MAX_BACKOFF_MS', '1000'))
+        if hedge_min_samples is None:
+            hedge_min_samples = int(os.getenv('GRPC_HEDGE_MIN_SAMPLES', '20'))
+        if latency_window is None:
+            latency_window = int(os.getenv('GRPC_LATENCY_WINDOW', '500'))
+        if hedge_budget_percent is None:
+            hedge_budget_percent = float(os.getenv('GRPC_HEDGE_BUDGET_PERCENT', '5'))
+        if hedge_burst is None:
+            hedge_burst = float(os.getenv('GRPC_HEDGE_BURST', '3'))
+        
+        self.hedging_enabled = hedging_enabled
+        self.backoff = backoff_ms / 1000
+        self.max_backoff = max_backoff_ms / 1000
+        self.hedge_min_samples = hedge_min_samples
+        # Hedges limitados a uma fração das chamadas (somando todos os RPCs)
+        self.hedge_budget = HedgeBudget(hedge_budget_percent / 100, hedge_burst)
+        self.policies = {
+            rpc: CallPolicy(rpc, *defaults, latency_window=latency_window)
+            for rpc, defaults in DEFAULT_POLICIES.items()
+        }
+    
+    def timeout(self, rpc: str) -> Optional[float]:
+        """Deadline do RPC (chamadas em streaming aplicam só o deadline)"""
+        return self.policies[rpc].timeout
+    
+    async def call(self, rpc: str, pool: ChannelPool,
+                   invoke: Callable[[Any, Optional[float]], Awaitable[Any]]) -> Any:
+        """Executa invoke(stub, timeout) numa réplica do pool aplicando a política do RPC"""
+        policy = self.policies[rpc]
+        policy.calls += 1
+        self.hedge_budget.on_call()
+        
+        for attempt in range(policy.retries + 1):
+            try:
+                return await self._attempt(policy, pool, invoke)
+            except grpc.RpcError as e:
+                if e.code() == grpc.StatusCode.DEADLINE_EXCEEDED:
+                    policy.deadline_exceeded += 1
+                if e.code() not in RETRYABLE_CODES or attempt == policy.retries:
+                    policy.failures += 1
+                    raise
+                
+                # Backoff exponencial com jitter completo: réplicas não voltam em sincronia
+                policy.retried += 1
+                delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+                print(f"   {rpc} falhou ({e.code().name}); nova tentativa em {delay * 1000:.0f}ms")
+                await asyncio.sleep(delay)
+    
+    async def _attempt(self, policy: CallPolicy, pool: ChannelPool, invoke) -> Any:
+        hedge_delay = None
+        # Com uma única réplica disponível a cópia cairia no mesmo servidor lento
+        if (self.hedging_enabled and policy.hedge and len(policy.latencies) >= self.hedge_min_samples
+                and pool.available_count() > 1):
+            hedge_delay = policy.percentile(0.95)
+        
+        if hedge_delay is None:
+            return await self._timed(policy, pool, invoke)
+        
+        first = asyncio.ensure_future(self._timed(policy, pool, invoke))
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            if not done and self.hedge_budget.try_acquire():
+                # Sem resposta no p95: cópia para outra réplica; vale a que responder antes
+                policy.hedged += 1
+                tasks.add(asyncio.ensure_future(self._timed(policy, pool, invoke)))
+            
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            policy.hedge_wins += 1
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            # Cancela a cópia perdedora (ou as duas, se o chamador desistiu)
+            for task in tasks:
+                task.cancel()
+    
+    @staticmethod
+    async def _timed(policy: CallPolicy, pool: ChannelPool, invoke) -> Any:
+        with pool.lease() as stub:
+            started_at = time.perf_counter()
+            response = await invoke(stub, policy.timeout)
+            policy.latencies.append(time.perf_counter() - started_at)
+            return response
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Métricas por RPC (apenas os já chamados)"""
+        return {
+            "hedging_enabled": self.hedging_enabled,
+            "hedge_budget": self.hedge_budget.get_stats(),
+            "by_rpc": {
+                rpc: policy.get_stats()
+                for rpc, policy in self.policies.items()
+                if policy.calls
+            }
+        }
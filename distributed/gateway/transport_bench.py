@@ -0,0 +1,121 @@
+"""
+Benchmark de transporte gRPC (TCP vs socket Unix) com mensagens pequenas
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, Dict, List
+
+import grpc
+from grpc_health.v1 import health_pb2, health_pb2_grpc
+
+from generated import (
+    embedding_service_pb2, embedding_service_pb2_grpc,
+    vector_service_pb2, vector_service_pb2_grpc
+)
+from shared.grpc_options import create_channel, service_addresses, unix_socket_path
+
+BENCHMARK_TEXT = "benchmark de transporte"
+
+
+async def _embed_query(channel, timeout):
+    # Texto fixo: depois do aquecimento sai do cache de queries, só o transporte pesa
+    stub = embedding_service_pb2_grpc.EmbeddingServiceStub(channel)
+    await stub.EmbedQuery(embedding_service_pb2.EmbedQueryRequest(text=BENCHMARK_TEXT, packed=True), timeout=timeout)
+
+
+async def _get_count(channel, timeout):
+    stub = vector_service_pb2_grpc.VectorServiceStub(channel)
+    await stub.GetCount(vector_service_pb2.CountRequest(), timeout=timeout)
+
+
+async def _health_check(channel, timeout):
+    stub = health_pb2_grpc.HealthStub(channel)
+    await stub.Check(health_pb2.HealthCheckRequest(), timeout=timeout)
+
+
+# Serviço: (porta padrão, RPC medido, chamada)
+TRANSPORT_SERVICES = {
+    "embedding": (50051, "EmbedQuery", _embed_query),
+    "vector": (50052, "GetCount", _get_count),
+    "llm": (50053, "Health.Check", _health_check),
+}
+
+
+def configured_addresses(service: str) -> Dict[str, str]:
+    """Endereços TCP e Unix do serviço na configuração do gateway (nunca vindos da requisição)"""
+    port = TRANSPORT_SERVICES[service][0]
+    prefix = f"{service.upper()}_SERVICE"
+    addresses = service_addresses(prefix, f"localhost:{port}")
+    tcp = next((address for address in addresses if not unix_socket_path(address)), f"localhost:{port}")
+    uds = next(
+        (address for address in addresses if unix_socket_path(address)),
+        os.getenv(f'{prefix}_UDS_ADDRESS', f"unix:/tmp/rag-{service}.sock")
+    )
+    return {"tcp": tcp, "uds": uds}
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[int(fraction * (len(ordered) - 1))]
+
+
+async def _measure(address: str, call, requests: int, concurrency: int, warmup: int) -> Dict[str, Any]:
+    # Canal dedicado (uma conexão): mede só o salto, sem o pool do gateway
+    channel = create_channel(address, aio=True)
+    try:
+        for _ in range(warmup):
+            await call(channel, 5)
+        
+        latencies = []
+        
+        async def worker(count: int):
+            for _ in range(count):
+                started_at = time.perf_counter()
+                await call(channel, 5)
+                latencies.append(time.perf_counter() - started_at)
+        
+        shares = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+        started_at = time.perf_counter()
+        await asyncio.gather(*(worker(count) for count in shares if count))
+        elapsed = time.perf_counter() - started_at
+        
+        return {
+            "address": address,
+            "requests": len(latencies),
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+            "p50_ms": round(_percentile(latencies, 0.5) * 1000, 3),
+            "p95_ms": round(_percentile(latencies, 0.95) * 1000, 3),
+            "p99_ms": round(_percentile(latencies, 0.99) * 1000, 3),
+            "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed > 0 else 0
+        }
+    except grpc.RpcError as e:
+        return {"address": address, "error": f"{e.code().name}: {e.details()}"}
+    finally:
+        await channel.close()
+
+
+async def run_transport_benchmark(service: str, addresses: Dict[str, str], requests: int = 500,
+                                  concurrency: int = 1, warmup: int = 20) -> Dict[str, Any]:
+    """Mede o mesmo RPC pequeno em cada transporte (um por vez, para não disputarem CPU)"""
+    _, rpc, call = TRANSPORT_SERVICES[service]
+    requests = max(1, requests)
+    concurrency = max(1, min(concurrency, requests))
+    
+    transports = {}
+    for transport, address in addresses.items():
+        transports[transport] = await _measure(address, call, requests, concurrency, warmup)
+    
+    result = {
+        "service": service,
+        "rpc": rpc,
+        "requests": requests,
+        "concurrency": concurrency,
+        "transports": transports
+    }
+    tcp, uds = transports.get("tcp", {}), transports.get("uds", {})
+    if tcp.get("p50_ms") and uds.get("p50_ms"):
+        result["uds_speedup_p50"] = round(tcp["p50_ms"] / uds["p50_ms"], 2)
+        result["uds_speedup_throughput"] = round(uds["throughput_rps"] / tcp["throughput_rps"], 2)
+    return result
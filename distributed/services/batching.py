@@ -0,0 +1,99 @@
+"""
+Micro-batching de requisições concorrentes
+"""
+
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from shared.metrics import Histogram
+
+
+class _PendingItem:
+    """Item aguardando processamento em lote"""
+    
+    def __init__(self, item: Any):
+        self.item = item
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """Agrupa chamadas concorrentes numa janela (tamanho máximo / espera máxima)"""
+    
+    def __init__(self, process_batch: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        
+        self.batch_size_histogram = Histogram([1, 2, 4, 8, 16, 32, 64, 128])
+        self.queue_wait_histogram = Histogram([0.5, 1, 2, 5, 10, 25, 50, 100, 250])
+        
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+    
+    def submit(self, item: Any) -> Any:
+        """Enfileira item e bloqueia até o resultado do lote"""
+        pending = _PendingItem(item)
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+    
+    def _collect_batch(self) -> List[_PendingItem]:
+        first = self._queue.get()
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait
+        
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    # Janela fechada: só aproveita o que já está na fila
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+    
+    def _run(self) -> None:
+        while True:
+            batch = self._collect_batch()
+            started_at = time.perf_counter()
+            
+            self.batch_size_histogram.observe(len(batch))
+            for pending in batch:
+                self.queue_wait_histogram.observe((started_at - pending.enqueued_at) * 1000)
+            
+            try:
+                results = self.process_batch([pending.item for pending in batch])
+                for pending, result in zip(batch, results):
+                    pending.result = result
+            except Exception as e:
+                for pending in batch:
+                    pending.error = e
+            
+            for pending in batch:
+                pending.done.set()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Histogramas de tamanho de lote e espera na fila (ms)"""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "pending": self._queue.qsize(),
+            "batch_size": self.batch_size_histogram.get_stats(),
+            "queue_wait_ms": self.queue_wait_histogram.get_stats()
+        }
@@ -1,10 +1,11 @@
 """
 Embedding Service gRPC
-Porta: 50051
+Porta padrão: 50051 (--port/--address: réplicas e sockets Unix; --workers: vários processos)
 """
 
 import grpc
 from concurrent import futures
+import os
 import sys
 from pathlib import Path
 
@@ -14,32 +15,86 @@ sys.path.insert(0, str(Path(__file__).parent.parent / "generated"))
 
 from generated import embedding_service_pb2, embedding_service_pb2_grpc
 from shared.embeddings import EmbeddingModel
+from shared.metrics import flatten_metrics
+from shared.packing import pack_matrix
+from shared.workers import WorkerSupervisor, pin_worker
+from shared.grpc_options import (
+    add_ports, bind_addresses, compression, serve_arguments, server_options, unix_socket_path
+)
+from batching import MicroBatcher
+from health import add_health_service, warm_up_and_serve
+
+SERVICE_NAME = embedding_service_pb2.DESCRIPTOR.services_by_name['EmbeddingService'].full_name
 
 
 class EmbeddingServicer(embedding_service_pb2_grpc.EmbeddingServiceServicer):
-    def __init__(self):
+    def __init__(self, process: dict = None):
+        self.process = process or {}
         self.model = EmbeddingModel()
+        
+        self.batcher = None
+        if os.getenv('EMBED_BATCHING_ENABLED', 'true').lower() == 'true':
+            self.batcher = MicroBatcher(
+                self.model.embed_queries,
+                max_batch_size=int(os.getenv('EMBED_BATCH_MAX_SIZE', '32')),
+                max_wait_ms=float(os.getenv('EMBED_BATCH_MAX_WAIT_MS', '5'))
+            )
         print("Embedding Service inicializado.")
     
+    def warmup(self):
+        self.model.warmup()
+    
     def EmbedQuery(self, request, context):
         try:
             print(f"Recebida EmbedQuery: {request.text[:50]}...")
-            embedding = self.model.embed_query(request.text)
+            embedding = self.model.get_cached_query(request.text)
+            if embedding is None:
+                if self.batcher is not None:
+                    embedding = self.batcher.submit(request.text)
+                else:
+                    embedding = self.model.embed_queries([request.text])[0]
+                self.model.store_query(request.text, embedding)
+            
+            if request.packed:
+                data, rows, dim = pack_matrix(embedding)
+                return embedding_service_pb2.EmbedQueryResponse(
+                    matrix=embedding_service_pb2.EmbeddingMatrix(data=data, rows=rows, dim=dim)
+                )
             return embedding_service_pb2.EmbedQueryResponse(embedding=embedding)
         except Exception as e:
             print(f"Erro ao processar EmbedQuery: {e}")
             context.set_code(grpc.StatusCode.INTERNAL)
             return embedding_service_pb2.EmbedQueryResponse()
     
+    def EmbedQueries(self, request, context):
+        try:
+            queries = list(request.texts)
+            print(f"Recebida EmbedQueries com {len(queries)} queries")
+            embeddings = self.model.embed_queries_cached(queries)
+            data, rows, dim = pack_matrix(embeddings)
+            return embedding_service_pb2.EmbedTextsResponse(
+                matrix=embedding_service_pb2.EmbeddingMatrix(data=data, rows=rows, dim=dim)
+            )
+        except Exception as e:
+            print(f"Erro ao processar EmbedQueries: {e}")
+            context.set_code(grpc.StatusCode.INTERNAL)
+            return embedding_service_pb2.EmbedTextsResponse()
+    
     def EmbedTexts(self, request, context):
         try:
             texts = list(request.texts)
             print(f"Recebida EmbedTexts com {len(texts)} textos")
-            embeddings = self.model.embed_texts(texts)
+            embeddings = self.model.embed_texts_array(texts)
+            
+            if request.packed:
+                data, rows, dim = pack_matrix(embeddings)
+                return embedding_service_pb2.EmbedTextsResponse(
+                    matrix=embedding_service_pb2.EmbeddingMatrix(data=data, rows=rows, dim=dim)
+                )
             
             embedding_messages = [
                 embedding_service_pb2.Embedding(values=emb)
-                for emb in embeddings
+                for emb in embeddings.tolist()
             ]
             
             return embedding_service_pb2.EmbedTextsResponse(embeddings=embedding_messages)
@@ -47,22 +102,104 @@ class EmbeddingServicer(embedding_service_pb2_grpc.EmbeddingServiceServicer):
             print(f"Erro ao processar EmbedTexts: {e}")
             context.set_code(grpc.StatusCode.INTERNAL)
             return embedding_service_pb2.EmbedTextsResponse()
+    
+    def EmbedTextsStream(self, request_iterator, context):
+        try:
+            for request in request_iterator:
+                texts = list(request.texts)
+                print(f"Recebido lote EmbedTextsStream com {len(texts)} textos")
+                embeddings = self.model.embed_texts_array(texts)
+                data, rows, dim = pack_matrix(embeddings)
+                yield embedding_service_pb2.EmbedTextsResponse(
+                    matrix=embedding_service_pb2.EmbeddingMatrix(data=data, rows=rows, dim=dim)
+                )
+        except Exception as e:
+            print(f"Erro ao processar EmbedTextsStream: {e}")
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(str(e))
+    
+    def GetStats(self, request, context):
+        try:
+            stats = {
+                "embedding_cache": self.model.get_cache_stats(),
+                "query_cache": self.model.get_query_cache_stats()
+            }
+            if self.batcher is not None:
+                stats["query_batching"] = self.batcher.get_stats()
+            if self.process:
+                # Com vários workers cada chamada vê as métricas de um processo
+                stats["process"] = {
+                    "worker": self.process["worker"],
+                    "pid": self.process["pid"],
+                    "cpus": len(self.process["cpus"]),
+                    "torch_threads": self.process["torch_threads"]
+                }
+            return embedding_service_pb2.StatsResponse(metrics=flatten_metrics(stats))
+        except Exception as e:
+            print(f"Erro ao processar GetStats: {e}")
+            context.set_code(grpc.StatusCode.INTERNAL)
+            return embedding_service_pb2.StatsResponse()
+
+
+def serve(port: int = None, address: str = None, workers: int = None):
+    if workers is None:
+        workers = int(os.getenv('EMBEDDING_WORKERS', '1'))
+    addresses = bind_addresses('EMBEDDING_SERVICE', port, address, default_port=50051)
+    
+    if workers <= 1:
+        # Processo único: threads do torch só mudam se EMBEDDING_TORCH_THREADS for definido
+        process = pin_worker(0, 1, _torch_threads() or None, affinity=False)
+        _run_server(addresses, process, reuseport=False)
+        return
+    
+    if any(unix_socket_path(item) for item in addresses):
+        raise ValueError("EMBEDDING_WORKERS > 1 exige endereços TCP (SO_REUSEPORT)")
+    # Os workers escutam o mesmo endereço; o kernel distribui as conexões entre eles
+    WorkerSupervisor("Embedding Service", serve_worker, workers, args=(addresses,)).run()
 
 
-def serve():
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+def serve_worker(index: int, workers: int, addresses: list):
+    """Processo worker: fixa CPUs e threads do torch antes de carregar o modelo"""
+    affinity = os.getenv('EMBEDDING_CPU_AFFINITY', 'true').lower() == 'true'
+    process = pin_worker(index, workers, _torch_threads(), affinity)
+    _run_server(addresses, process, reuseport=True)
+
+
+def _torch_threads() -> int:
+    # 0 = padrão do torch (processo único) ou uma thread por CPU do worker
+    return int(os.getenv('EMBEDDING_TORCH_THREADS', '0'))
+
+
+def _run_server(addresses: list, process: dict, reuseport: bool):
+    # Mais threads permitem lotes maiores no micro-batching de EmbedQuery
+    max_workers = int(os.getenv('EMBEDDING_MAX_WORKERS', '32'))
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=max_workers),
+        options=server_options() + [('grpc.so_reuseport', int(reuseport))],
+        compression=compression()
+    )
+    servicer = EmbeddingServicer(process)
     embedding_service_pb2_grpc.add_EmbeddingServiceServicer_to_server(
-        EmbeddingServicer(), server
+        servicer, server
     )
-    server.add_insecure_port('[::]:50051')
+    health_servicer = add_health_service(server, SERVICE_NAME)
+    if reuseport:
+        # Worker novo (ou reiniciado) só passa a receber conexões já aquecido
+        warm_up_and_serve(health_servicer, SERVICE_NAME, servicer.warmup)
+    add_ports(server, addresses)
     server.start()
     
     print("\n" + "="*60)
     print("Embedding Service rodando (gRPC)")
     print("="*60)
-    print("   Porta: 50051")
+    print(f"   Endereços: {', '.join(addresses)}")
+    print(f"   Processo: worker {process['worker']} (pid {process['pid']}), "
+          f"{len(process['cpus'])} CPUs, {process['torch_threads']} threads torch")
     print("="*60 + "\n")
     
+    if not reuseport:
+        warm_up_and_serve(health_servicer, SERVICE_NAME, servicer.warmup)
+    
     try:
         server.wait_for_termination()
     except KeyboardInterrupt:
@@ -70,5 +207,5 @@ def serve():
 
 
 if __name__ == '__main__':
-    serve()
-
+    args = serve_arguments("Embedding Service gRPC", 50051, workers=True)
+    serve(args.port, args.address, args.workers)
@@ -0,0 +1,35 @@
+"""
+Readiness dos serviços gRPC (grpc.health.v1)
+"""
+
+import os
+import time
+from typing import Callable
+
+from grpc_health.v1 import health, health_pb2, health_pb2_grpc
+
+
+def add_health_service(server, service_name: str) -> health.HealthServicer:
+    """Registra o health service com o serviço NOT_SERVING até o fim do warm-up"""
+    health_servicer = health.HealthServicer()
+    health_pb2_grpc.add_HealthServicer_to_server(health_servicer, server)
+    for name in ("", service_name):
+        health_servicer.set(name, health_pb2.HealthCheckResponse.NOT_SERVING)
+    return health_servicer
+
+
+def warm_up_and_serve(health_servicer: health.HealthServicer, service_name: str,
+                      warmup: Callable[[], None]) -> None:
+    """Executa o warm-up (se habilitado) e marca o serviço como SERVING"""
+    if os.getenv('WARMUP_ENABLED', 'true').lower() == 'true':
+        started_at = time.perf_counter()
+        try:
+            warmup()
+            print(f"Warm-up concluído em {time.perf_counter() - started_at:.2f}s")
+        except Exception as e:
+            # Falha no aquecimento não deixa o serviço indisponível para sempre
+            print(f"Erro no warm-up: {e}")
+    
+    for name in ("", service_name):
+        health_servicer.set(name, health_pb2.HealthCheckResponse.SERVING)
+    print(f"{service_name}: pronto (SERVING)")
@@ -1,6 +1,6 @@
 """
 LLM Service gRPC
-Porta: 50053
+Porta padrão: 50053 (--port/--address: réplicas e sockets Unix)
 """
 
 import grpc
@@ -13,39 +13,107 @@ sys.path.insert(0, str(Path(__file__).parent.parent / "generated"))
 
 from generated import llm_service_pb2, llm_service_pb2_grpc
 from shared.llm import OllamaLLM
+from shared.admission import AdmissionController, AdmissionRejected, RETRY_AFTER_METADATA_KEY
+from shared.metrics import flatten_metrics
+from shared.grpc_options import add_ports, bind_addresses, compression, serve_arguments, server_options
+from health import add_health_service, warm_up_and_serve
+
+SERVICE_NAME = llm_service_pb2.DESCRIPTOR.services_by_name['LLMService'].full_name
 
 
 class LLMServicer(llm_service_pb2_grpc.LLMServiceServicer):
     def __init__(self):
         self.llm = OllamaLLM()
+        self.admission = AdmissionController(backends=len(self.llm.pool.endpoints))
         print("LLM Service inicializado.")
     
+    def warmup(self):
+        self.llm.preload()
+    
     def Generate(self, request, context):
         try:
             print(f"Generate solicitado com {len(request.prompt)} caracteres")
             temp = request.temperature if request.temperature > 0 else 0.7
-            text = self.llm.generate(request.prompt, temp)
+            with self.admission.admit():
+                text = self.llm.generate(request.prompt, temp)
             return llm_service_pb2.GenerateResponse(text=text)
+        except AdmissionRejected as e:
+            print(f"Generate recusado: {e}")
+            self._reject(context, e)
+            return llm_service_pb2.GenerateResponse()
         except Exception as e:
             print(f"Erro durante Generate: {e}")
             context.set_code(grpc.StatusCode.INTERNAL)
             return llm_service_pb2.GenerateResponse()
+    
+    def GenerateStream(self, request, context):
+        try:
+            print(f"GenerateStream solicitado com {len(request.prompt)} caracteres")
+            temp = request.temperature if request.temperature > 0 else 0.7
+            with self.admission.admit():
+                # Chunk vazio: geração admitida (o gateway só abre o stream HTTP depois dele)
+                yield llm_service_pb2.GenerateChunk()
+                for token in self.llm.generate_stream(request.prompt, temp):
+                    if not context.is_active():
+                        print("Cliente cancelou GenerateStream")
+                        return
+                    yield llm_service_pb2.GenerateChunk(text=token)
+            yield llm_service_pb2.GenerateChunk(done=True)
+        except AdmissionRejected as e:
+            print(f"GenerateStream recusado: {e}")
+            self._reject(context, e)
+        except Exception as e:
+            print(f"Erro durante GenerateStream: {e}")
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(str(e))
+    
+    def GetStats(self, request, context):
+        try:
+            stats = {
+                "admission": self.admission.get_stats(),
+                "endpoints": self.llm.pool.get_stats()
+            }
+            return llm_service_pb2.StatsResponse(metrics=flatten_metrics(stats))
+        except Exception as e:
+            print(f"Erro ao processar GetStats: {e}")
+            context.set_code(grpc.StatusCode.INTERNAL)
+            return llm_service_pb2.StatsResponse()
+    
+    @staticmethod
+    def _reject(context, error: AdmissionRejected):
+        """Sobrecarga: RESOURCE_EXHAUSTED imediato com sugestão de retry"""
+        context.set_trailing_metadata(((RETRY_AFTER_METADATA_KEY, str(error.retry_after)),))
+        context.set_code(grpc.StatusCode.RESOURCE_EXHAUSTED)
+        context.set_details(str(error))
 
 
-def serve():
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+def serve(port: int = None, address: str = None):
+    addresses = bind_addresses('LLM_SERVICE', port, address, default_port=50053)
+    servicer = LLMServicer()
+    # Threads para as vagas, a fila de espera e respostas rápidas (recusas, GetStats);
+    # além disso o próprio gRPC responde RESOURCE_EXHAUSTED
+    max_workers = servicer.admission.max_concurrency + servicer.admission.max_queue + 4
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=max_workers),
+        maximum_concurrent_rpcs=max_workers,
+        options=server_options(),
+        compression=compression()
+    )
     llm_service_pb2_grpc.add_LLMServiceServicer_to_server(
-        LLMServicer(), server
+        servicer, server
     )
-    server.add_insecure_port('[::]:50053')
+    health_servicer = add_health_service(server, SERVICE_NAME)
+    add_ports(server, addresses)
     server.start()
     
     print("\n" + "="*60)
     print("LLM Service rodando (gRPC)")
     print("="*60)
-    print("   Porta: 50053")
+    print(f"   Endereços: {', '.join(addresses)}")
     print("="*60 + "\n")
     
+    warm_up_and_serve(health_servicer, SERVICE_NAME, servicer.warmup)
+    
     try:
         server.wait_for_termination()
     except KeyboardInterrupt:
@@ -53,5 +121,6 @@ def serve():
 
 
 if __name__ == '__main__':
-    serve()
+    args = serve_arguments("LLM Service gRPC", 50053)
+    serve(args.port, args.address)
 
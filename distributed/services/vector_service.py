@@ -1,70 +1,249 @@
 """
 Vector Service gRPC
-Porta: 50052
+Porta padrão: 50052 (--port/--address: réplicas e sockets Unix; --read-only: réplicas de leitura)
 """
 
 import grpc
 from concurrent import futures
+import os
 import sys
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 sys.path.insert(0, str(Path(__file__).parent.parent / "generated"))
 
-from generated import vector_service_pb2, vector_service_pb2_grpc
-from shared.vectordb import VectorDB
+from generated import (
+    vector_service_pb2, vector_service_pb2_grpc,
+    embedding_service_pb2, embedding_service_pb2_grpc
+)
+from shared.vectordb import ReadOnlyIndexError, VectorDB
+from shared.packing import pack_matrix, unpack_matrix
+from shared.grpc_options import (
+    ChannelPool, add_ports, bind_addresses, compression, serve_arguments, server_options, service_addresses
+)
+from health import add_health_service, warm_up_and_serve
+
+# Acima disso o tempo restante informado pelo gRPC significa "sem deadline"
+MAX_PROPAGATED_DEADLINE = 24 * 3600
+
+SERVICE_NAME = vector_service_pb2.DESCRIPTOR.services_by_name['VectorService'].full_name
 
 
 class VectorServicer(vector_service_pb2_grpc.VectorServiceServicer):
-    def __init__(self):
-        self.vector_db = VectorDB()
-        print("Vector Service inicializado.")
+    def __init__(self, retrieval_embedding: str = None, read_only: bool = None):
+        if retrieval_embedding is None:
+            retrieval_embedding = os.getenv('RETRIEVAL_EMBEDDING', 'remote').lower()
+        if read_only is None:
+            read_only = os.getenv('VECTOR_SERVICE_READ_ONLY', 'false').lower() == 'true'
+        
+        # Réplicas de leitura: índice NumPy acompanha a primária; Chroma exige servidor compartilhado
+        self.vector_db = VectorDB(read_only=read_only)
+        if read_only and self.vector_db.backend.name == 'chroma' and not self.vector_db.backend.shared:
+            raise ValueError(
+                "Réplica somente leitura com ChromaDB local não recebe as escritas da primária: "
+                "use CHROMA_SERVER_URL ou VECTOR_BACKEND=numpy"
+            )
+        
+        # EmbedAndSearch: modelo no próprio processo (local) ou Embedding Service (remote)
+        self.retrieval_embedding = retrieval_embedding
+        self.embedding_model = None
+        self.embedding_pool = None
+        if retrieval_embedding == 'local':
+            from shared.embeddings import EmbeddingModel
+            self.embedding_model = EmbeddingModel()
+        else:
+            self.embedding_pool = ChannelPool(
+                service_addresses('EMBEDDING_SERVICE', 'localhost:50051'),
+                embedding_service_pb2_grpc.EmbeddingServiceStub
+            )
+        print(f"Vector Service inicializado (embedding da busca: {retrieval_embedding}"
+              f"{', somente leitura' if self.vector_db.read_only else ''}).")
+    
+    def warmup(self):
+        self.vector_db.warmup()
+        if self.embedding_model is not None:
+            self.embedding_model.warmup()
     
     def Search(self, request, context):
         try:
-            query_embedding = list(request.query_embedding)
+            if request.HasField('query_matrix'):
+                matrix = request.query_matrix
+                query_embedding = unpack_matrix(matrix.data, matrix.rows, matrix.dim)[0]
+            else:
+                query_embedding = list(request.query_embedding)
             top_k = request.top_k if request.top_k > 0 else 5
             
             print(f"Search solicitado com top_k={top_k}")
             results = self.vector_db.query(query_embedding, top_k)
             
-            documents = []
-            if results['documents'] and len(results['documents']) > 0:
-                docs = results['documents'][0]
-                metadatas = results['metadatas'][0] if results['metadatas'] else [{}] * len(docs)
-                distances = results['distances'][0] if results['distances'] else [0] * len(docs)
-                
-                for i, doc in enumerate(docs):
-                    documents.append(vector_service_pb2.Document(
-                        text=doc,
-                        metadata=metadatas[i],
-                        score=1 - distances[i]
-                    ))
-            
-            return vector_service_pb2.SearchResponse(documents=documents)
+            return self._to_search_response(results, 0)
         except Exception as e:
             print(f"Erro durante Search: {e}")
             context.set_code(grpc.StatusCode.INTERNAL)
             return vector_service_pb2.SearchResponse()
     
-    def AddDocuments(self, request, context):
+    def BatchSearch(self, request, context):
+        try:
+            matrix = request.query_matrix
+            query_embeddings = unpack_matrix(matrix.data, matrix.rows, matrix.dim)
+            top_k = request.top_k if request.top_k > 0 else 5
+            
+            print(f"BatchSearch solicitado com {matrix.rows} queries, top_k={top_k}")
+            results = self.vector_db.query_many(query_embeddings, top_k)
+            
+            return vector_service_pb2.BatchSearchResponse(results=[
+                self._to_search_response(results, i) for i in range(matrix.rows)
+            ])
+        except Exception as e:
+            print(f"Erro durante BatchSearch: {e}")
+            context.set_code(grpc.StatusCode.INTERNAL)
+            return vector_service_pb2.BatchSearchResponse()
+    
+    def EmbedAndSearch(self, request, context):
         try:
-            texts = list(request.texts)
+            top_k = request.top_k if request.top_k > 0 else 5
+            print(f"EmbedAndSearch solicitado com top_k={top_k}")
+            
+            if self.embedding_model is not None:
+                data, rows, dim = pack_matrix(self.embedding_model.embed_query(request.text))
+            else:
+                # Repassa o deadline do gateway (sem deadline, o gRPC informa um prazo "infinito")
+                remaining = context.time_remaining()
+                with self.embedding_pool.lease() as embedding_stub:
+                    embed_response = embedding_stub.EmbedQuery(
+                        embedding_service_pb2.EmbedQueryRequest(text=request.text, packed=True),
+                        timeout=remaining if remaining < MAX_PROPAGATED_DEADLINE else None
+                    )
+                matrix = embed_response.matrix
+                data, rows, dim = matrix.data, matrix.rows, matrix.dim
+            
+            query_embedding = unpack_matrix(data, rows, dim)[0]
+            results = self.vector_db.query(query_embedding, top_k)
+            
+            return vector_service_pb2.EmbedAndSearchResponse(
+                documents=self._to_search_response(results, 0).documents,
+                query_matrix=vector_service_pb2.EmbeddingMatrix(data=data, rows=rows, dim=dim)
+            )
+        except grpc.RpcError as e:
+            # Falha do Embedding Service chega ao gateway com o código original
+            print(f"Erro no Embedding Service durante EmbedAndSearch: {e.code()}")
+            context.set_code(e.code())
+            context.set_details(e.details() or "")
+            return vector_service_pb2.EmbedAndSearchResponse()
+        except Exception as e:
+            print(f"Erro durante EmbedAndSearch: {e}")
+            context.set_code(grpc.StatusCode.INTERNAL)
+            return vector_service_pb2.EmbedAndSearchResponse()
+    
+    @staticmethod
+    def _to_search_response(results, index: int):
+        documents = []
+        if results['documents'] and len(results['documents']) > index:
+            docs = results['documents'][index]
+            metadatas = results['metadatas'][index] if results['metadatas'] else [{}] * len(docs)
+            distances = results['distances'][index] if results['distances'] else [0] * len(docs)
+            ids = results['ids'][index] if results.get('ids') else [''] * len(docs)
+            
+            for i, doc in enumerate(docs):
+                documents.append(vector_service_pb2.Document(
+                    text=doc,
+                    metadata={str(k): str(v) for k, v in metadatas[i].items()},
+                    score=1 - distances[i],
+                    id=ids[i]
+                ))
+        
+        return vector_service_pb2.SearchResponse(documents=documents)
+    
+    @staticmethod
+    def _decode_add_request(request):
+        texts = list(request.texts)
+        if request.HasField('matrix'):
+            matrix = request.matrix
+            embeddings = unpack_matrix(matrix.data, matrix.rows, matrix.dim)
+        else:
             embeddings = [list(emb.values) for emb in request.embeddings]
-            metadatas = [dict(meta.data) for meta in request.metadatas]
+        metadatas = [dict(meta.data) for meta in request.metadatas]
+        ids = list(request.ids) or None
+        return texts, embeddings, metadatas, ids
+    
+    def AddDocuments(self, request, context):
+        try:
+            texts, embeddings, metadatas, ids = self._decode_add_request(request)
             
             print(f"AddDocuments recebido com {len(texts)} documentos")
-            self.vector_db.add_documents(texts, embeddings, metadatas)
+            self.vector_db.add_documents(texts, embeddings, metadatas, ids)
             
             return vector_service_pb2.AddDocumentsResponse(
                 documents_added=len(texts),
                 total_documents=self.vector_db.get_document_count()
             )
+        except ReadOnlyIndexError as e:
+            context.set_code(grpc.StatusCode.FAILED_PRECONDITION)
+            context.set_details(str(e))
+            return vector_service_pb2.AddDocumentsResponse()
         except Exception as e:
             print(f"Erro durante AddDocuments: {e}")
             context.set_code(grpc.StatusCode.INTERNAL)
             return vector_service_pb2.AddDocumentsResponse()
     
+    def AddDocumentsStream(self, request_iterator, context):
+        try:
+            added = 0
+            for request in request_iterator:
+                texts, embeddings, metadatas, ids = self._decode_add_request(request)
+                print(f"Lote AddDocumentsStream recebido com {len(texts)} documentos")
+                self.vector_db.add_documents(texts, embeddings, metadatas, ids)
+                added += len(texts)
+            
+            return vector_service_pb2.AddDocumentsResponse(
+                documents_added=added,
+                total_documents=self.vector_db.get_document_count()
+            )
+        except ReadOnlyIndexError as e:
+            context.set_code(grpc.StatusCode.FAILED_PRECONDITION)
+            context.set_details(str(e))
+            return vector_service_pb2.AddDocumentsResponse()
+        except Exception as e:
+            print(f"Erro durante AddDocumentsStream: {e}")
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(str(e))
+            return vector_service_pb2.AddDocumentsResponse()
+    
+    def SyncSource(self, request, context):
+        try:
+            plan = self.vector_db.sync_source(
+                request.source,
+                list(request.ids),
+                [dict(meta.data) for meta in request.metadatas]
+            )
+            return vector_service_pb2.SyncSourceResponse(
+                missing=plan["missing"],
+                updated=plan["updated"],
+                unchanged=plan["unchanged"],
+                deleted=plan["deleted"]
+            )
+        except ReadOnlyIndexError as e:
+            context.set_code(grpc.StatusCode.FAILED_PRECONDITION)
+            context.set_details(str(e))
+            return vector_service_pb2.SyncSourceResponse()
+        except Exception as e:
+            print(f"Erro durante SyncSource: {e}")
+            context.set_code(grpc.StatusCode.INTERNAL)
+            return vector_service_pb2.SyncSourceResponse()
+    
+    def PruneSources(self, request, context):
+        try:
+            deleted = self.vector_db.prune_sources(request.directory, list(request.keep_sources))
+            return vector_service_pb2.PruneSourcesResponse(deleted=deleted)
+        except ReadOnlyIndexError as e:
+            context.set_code(grpc.StatusCode.FAILED_PRECONDITION)
+            context.set_details(str(e))
+            return vector_service_pb2.PruneSourcesResponse()
+        except Exception as e:
+            print(f"Erro durante PruneSources: {e}")
+            context.set_code(grpc.StatusCode.INTERNAL)
+            return vector_service_pb2.PruneSourcesResponse()
+    
     def GetCount(self, request, context):
         try:
             count = self.vector_db.get_document_count()
@@ -74,20 +253,29 @@ class VectorServicer(vector_service_pb2_grpc.VectorServiceServicer):
             return vector_service_pb2.CountResponse()
 
 
-def serve():
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+def serve(port: int = None, address: str = None, read_only: bool = None):
+    addresses = bind_addresses('VECTOR_SERVICE', port, address, default_port=50052)
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=10),
+        options=server_options(),
+        compression=compression()
+    )
+    servicer = VectorServicer(read_only=read_only)
     vector_service_pb2_grpc.add_VectorServiceServicer_to_server(
-        VectorServicer(), server
+        servicer, server
     )
-    server.add_insecure_port('[::]:50052')
+    health_servicer = add_health_service(server, SERVICE_NAME)
+    add_ports(server, addresses)
     server.start()
     
     print("\n" + "="*60)
     print("Vector Service rodando (gRPC)")
     print("="*60)
-    print("   Porta: 50052")
+    print(f"   Endereços: {', '.join(addresses)}")
     print("="*60 + "\n")
     
+    warm_up_and_serve(health_servicer, SERVICE_NAME, servicer.warmup)
+    
     try:
         server.wait_for_termination()
     except KeyboardInterrupt:
@@ -95,5 +283,6 @@ def serve():
 
 
 if __name__ == '__main__':
-    serve()
+    args = serve_arguments("Vector Service gRPC", 50052, read_only=True)
+    serve(args.port, args.address, args.read_only or None)
 
@@ -4,17 +4,24 @@ Porta: 8001
 """
 
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 
+import asyncio
+import itertools
 import sys
+import threading
 from pathlib import Path
 
 # Adicionar path para acessar módulo shared
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from rag_pipeline import get_pipeline
+from rag_pipeline import close_pipeline, get_pipeline, is_ready, is_warm, readiness_status
 from shared.path_utils import resolve_directory_path
+from shared.sse import format_sse
+from shared.admission import AdmissionRejected
+from shared.vectordb import ReadOnlyIndexError
 
 app = FastAPI(title="RAG Monolithic API", version="1.0.0")
 
@@ -28,11 +35,44 @@ class IngestRequest(BaseModel):
     directory_path: str
 
 
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    top_k: Optional[int] = 5
+
+
 @app.get("/")
 def root():
     return {"message": "RAG Monolithic API", "mode": "monolithic"}
 
 
+@app.on_event("startup")
+def startup():
+    # Carrega e aquece o pipeline em segundo plano; /ready indica quando terminar
+    # (workers do modo prefork já chegam aquecidos)
+    if not is_warm():
+        threading.Thread(target=lambda: get_pipeline().warmup(), daemon=True).start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await close_pipeline()
+
+
+async def get_pipeline_async():
+    """get_pipeline() sem bloquear o event loop enquanto o pipeline ainda carrega"""
+    if is_warm():
+        return get_pipeline()
+    return await asyncio.to_thread(get_pipeline)
+
+
+@app.get("/ready")
+def ready():
+    """Readiness: pipeline carregado e aquecido"""
+    if not is_ready():
+        raise HTTPException(status_code=503, detail={"ready": False, **readiness_status()})
+    return {"ready": True, "warmup": get_pipeline().warmup_info, **readiness_status()}
+
+
 @app.get("/health")
 def health():
     pipeline = get_pipeline()
@@ -44,35 +84,92 @@ def health():
     }
 
 
+def overloaded(error: AdmissionRejected) -> HTTPException:
+    """Sobrecarga do LLM: HTTP 429 com Retry-After"""
+    return HTTPException(
+        status_code=429,
+        detail=str(error),
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+
 @app.post("/query")
-def query(request: QueryRequest):
+async def query(request: QueryRequest):
     try:
-        pipeline = get_pipeline()
-        result = pipeline.answer(request.query, request.top_k)
+        pipeline = await get_pipeline_async()
+        result = await pipeline.answer(request.query, request.top_k)
         return result
+    except AdmissionRejected as e:
+        raise overloaded(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/ingest")
+@app.post("/query/stream")
+def query_stream(request: QueryRequest):
+    pipeline = get_pipeline()
+    events = pipeline.answer_stream(request.query, request.top_k)
+    try:
+        # A admissão acontece antes do primeiro evento: recusa vira 429, não um stream 200
+        first = next(events)
+    except AdmissionRejected as e:
+        raise overloaded(e)
+    return StreamingResponse(
+        (format_sse(event) for event in itertools.chain([first], events)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/search/batch")
+def search_batch(request: BatchSearchRequest):
+    try:
+        pipeline = get_pipeline()
+        results = pipeline.search_many(request.queries, request.top_k)
+        return {"results": [
+            {"query": query, "documents": documents}
+            for query, documents in zip(request.queries, results)
+        ]}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/ingest", status_code=202)
 def ingest(request: IngestRequest):
+    """Agenda a ingestão em segundo plano; progresso em GET /ingest/{job_id}"""
     try:
         pipeline = get_pipeline()
         directory = resolve_directory_path(request.directory_path)
-        result = pipeline.ingest_documents(directory_path=str(directory))
-        return result
+        return pipeline.start_ingest(str(directory))
     except (FileNotFoundError, NotADirectoryError, ValueError) as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except ReadOnlyIndexError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/ingest")
+def ingest_jobs():
+    return {"jobs": get_pipeline().jobs.list()}
+
+
+@app.get("/ingest/{job_id}")
+def ingest_job(job_id: str):
+    job = get_pipeline().jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job de ingestão não encontrado: {job_id}")
+    return job
+
+
 @app.post("/reset")
 def reset():
     try:
         pipeline = get_pipeline()
         result = pipeline.reset()
         return result
+    except ReadOnlyIndexError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -85,6 +182,11 @@ def stats():
 
 if __name__ == "__main__":
     import uvicorn
-    print("\nIniciando API Monolítica na porta 8001...")
-    uvicorn.run(app, host="0.0.0.0", port=8001)
+    from prefork import serve, worker_count
+    workers = worker_count()
+    print(f"\nIniciando API Monolítica na porta 8001 ({workers} worker(s))...")
+    if workers > 1:
+        serve(app, host="0.0.0.0", port=8001, workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8001)
 
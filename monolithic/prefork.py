@@ -0,0 +1,88 @@
+"""
+Modo Prefork da API Monolítica
+Modelo carregado antes do fork; N workers uvicorn no mesmo socket
+"""
+
+import gc
+import multiprocessing
+import os
+import signal
+
+import uvicorn
+
+from rag_pipeline import configure_pipeline, get_pipeline
+from shared.embeddings import EmbeddingModel
+from shared.workers import WorkerSupervisor, available_cpus, pin_worker
+
+
+class WorkerReadiness:
+    """Warm-up de cada worker em memória compartilhada (criada antes do fork)"""
+    
+    def __init__(self, workers: int):
+        self._slots = multiprocessing.RawArray('b', workers)
+        self.total = workers
+    
+    def mark(self, index: int, ready: bool) -> None:
+        self._slots[index] = int(ready)
+    
+    def count(self) -> int:
+        return sum(self._slots)
+    
+    def all_ready(self) -> bool:
+        return self.count() == self.total
+
+
+def worker_count() -> int:
+    """MONOLITH_WORKERS (0 = um worker por CPU disponível)"""
+    workers = int(os.getenv('MONOLITH_WORKERS', '1'))
+    return workers if workers > 0 else len(available_cpus())
+
+
+def serve(app, host: str, port: int, workers: int) -> None:
+    """Carrega o modelo, abre o socket e supervisiona os workers (fork)"""
+    # Carregamento com uma thread: o pool OpenMP do torch não existe antes do fork
+    import torch
+    torch.set_num_threads(1)
+    
+    model_name = os.getenv('EMBEDDING_MODEL', 'intfloat/multilingual-e5-small')
+    model = EmbeddingModel.load_model(model_name)
+    
+    config = uvicorn.Config(app, host=host, port=port)
+    sock = config.bind_socket()
+    readiness = WorkerReadiness(workers)
+    
+    # Objetos já carregados saem do GC: coletas nos workers não copiam as páginas herdadas
+    gc.collect()
+    gc.freeze()
+    
+    print("\n" + "="*60)
+    print(f"API Monolítica: {workers} workers em {host}:{port}")
+    print("="*60 + "\n")
+    
+    WorkerSupervisor(
+        "API Monolítica", run_worker, workers,
+        args=(app, host, port, sock, model_name, model, readiness),
+        start_method='fork',
+        on_exit=lambda index: readiness.mark(index, False)
+    ).run()
+
+
+def run_worker(index: int, workers: int, app, host: str, port: int, sock,
+               model_name: str, model, readiness: WorkerReadiness) -> None:
+    # Handler de SIGTERM herdado do supervisor; o uvicorn instala os próprios
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    
+    affinity = os.getenv('MONOLITH_CPU_AFFINITY', 'true').lower() == 'true'
+    torch_threads = int(os.getenv('MONOLITH_TORCH_THREADS', '0'))
+    worker = {**pin_worker(index, workers, torch_threads, affinity), "workers": workers}
+    
+    # Pesos herdados do supervisor (copy-on-write); caches e banco vetorial são do worker
+    configure_pipeline(
+        embedding_model=EmbeddingModel(model_name, model=model),
+        worker=worker,
+        readiness=readiness
+    )
+    # Aquece antes de aceitar conexões: o socket compartilhado só é atendido por workers prontos
+    get_pipeline().warmup()
+    
+    uvicorn.Server(uvicorn.Config(app, host=host, port=port)).run(sockets=[sock])
@@ -9,78 +9,180 @@ sys.path.append(str(Path(__file__).parent.parent))
 
 from shared.embeddings import EmbeddingModel
 from shared.vectordb import VectorDB
-from shared.llm import OllamaLLM
-from shared.ingest import process_documents_for_ingestion
-from typing import List, Dict, Any
+from shared.llm import AsyncOllamaLLM, OllamaLLM, GENERATION_ERROR
+from shared.ingest import collect_files, iter_incremental_batches, source_key
+from shared.metrics import Histogram, LATENCY_BUCKETS
+from shared.prompt import build_prompt, format_sources
+from shared.context import ContextPacker
+from shared.semantic_cache import SemanticCache
+from shared.singleflight import AsyncSingleFlight
+from shared.admission import AdmissionController
+from shared.jobs import IngestJob, JobRegistry, PriorityGate
+from shared.query_cache import normalize_query
+from typing import Iterator, List, Dict, Any, Optional, Tuple
+import asyncio
 import os
+import threading
+import time
 
 
 class RAGMonolithicPipeline:
     """Pipeline RAG Monolítico - Tudo em um processo"""
     
-    def __init__(self):
+    def __init__(self, embedding_model: EmbeddingModel = None, worker: Dict[str, Any] = None,
+                 readiness=None):
         print("\n" + "="*60)
         print("Inicializando pipeline monolítico")
         print("="*60)
         
-        self.embedding_model = EmbeddingModel()
-        self.vector_db = VectorDB()
+        # Modo prefork: modelo carregado antes do fork, um pipeline por worker
+        self.worker = worker
+        self.readiness = readiness
+        workers = worker["workers"] if worker else 1
+        
+        self.embedding_model = embedding_model or EmbeddingModel()
+        # Vários workers só escrevem num armazenamento compartilhado (servidor Chroma)
+        self.vector_db = VectorDB(read_only=workers > 1)
         self.llm = OllamaLLM()
+        # /query roda no event loop: gerações em andamento não ocupam uma thread cada
+        self.async_llm = AsyncOllamaLLM(pool=self.llm.pool)
+        self.admission = AdmissionController(backends=len(self.llm.pool.endpoints), workers=workers)
+        
+        self.semantic_cache = None
+        if os.getenv('SEMANTIC_CACHE_ENABLED', 'true').lower() == 'true':
+            # Arquivo por worker: processos não sobrescrevem as respostas uns dos outros
+            name = f"monolithic-worker{worker['worker']}" if workers > 1 else "monolithic"
+            self.semantic_cache = SemanticCache(name)
+        
+        self.single_flight = None
+        if os.getenv('SINGLE_FLIGHT_ENABLED', 'true').lower() == 'true':
+            self.single_flight = AsyncSingleFlight()
         
         self.top_k = int(os.getenv('TOP_K_RESULTS', '5'))
-        self.max_context_length = int(os.getenv('MAX_CONTEXT_LENGTH', '2000'))
+        self.context_packer = ContextPacker()
+        self.ingest_batch_size = int(os.getenv('INGEST_BATCH_SIZE', '64'))
+        
+        # Ingestão em segundo plano, cedendo a vez às consultas
+        self.jobs = JobRegistry("monolithic")
+        self.priority = PriorityGate()
+        
+        self.ttft_histogram = Histogram(LATENCY_BUCKETS)
+        self.stream_total_histogram = Histogram(LATENCY_BUCKETS)
+        
+        self.ready = False
+        self.warmup_info = {}
         
         print("="*60)
         print("Pipeline monolítico pronto")
         print("="*60 + "\n")
     
+    def warmup(self) -> Dict[str, Any]:
+        """Aquece modelo de embeddings, índice vetorial e LLM antes de aceitar tráfego"""
+        if os.getenv('WARMUP_ENABLED', 'true').lower() == 'true':
+            try:
+                self.warmup_info = {
+                    "embedding_s": round(self.embedding_model.warmup(), 3),
+                    "vector_db_s": round(self.vector_db.warmup(), 3),
+                    "llm_endpoints_loaded": self.llm.preload()
+                }
+            except Exception as e:
+                # Falha no aquecimento não deixa o pipeline indisponível para sempre
+                print(f"Erro no warm-up: {e}")
+                self.warmup_info = {"error": str(e)}
+        
+        self.ready = True
+        if self.readiness is not None:
+            self.readiness.mark(self.worker["worker"], True)
+        print("Pipeline monolítico pronto para receber tráfego")
+        return self.warmup_info
+    
+    def start_ingest(self, directory_path: str) -> Dict[str, Any]:
+        """Agenda a ingestão em segundo plano e retorna o job (progresso em self.jobs)"""
+        self.vector_db.check_writable()
+        job = self.jobs.create(directory_path)
+        self.jobs.run_in_thread(job, lambda job: self.ingest_documents(directory_path=directory_path, progress=job))
+        return job.to_dict()
+    
     def ingest_documents(self, file_paths: List[str] = None, 
-                        directory_path: str = None) -> Dict[str, Any]:
+                        directory_path: str = None, progress: IngestJob = None) -> Dict[str, Any]:
         """Ingere documentos"""
         print("\nIngestão monolítica iniciada")
         
-        texts, metadatas = process_documents_for_ingestion(file_paths, directory_path)
+        files = collect_files(file_paths, directory_path)
         
-        if not texts:
+        if not files:
             return {"status": "error", "message": "Nenhum documento"}
+        if progress is not None:
+            progress.set_files_total(len(files))
         
-        embeddings = self.embedding_model.embed_texts(texts)
-        self.vector_db.add_documents(texts, embeddings, metadatas)
+        counts = {"added": 0, "updated": 0, "unchanged": 0, "deleted": 0}
         
+        def sync_source(source, ids, metadatas):
+            plan = self.vector_db.sync_source(source, ids, metadatas)
+            for key in ("updated", "unchanged", "deleted"):
+                counts[key] += plan[key]
+            if progress is not None:
+                progress.file_done()
+            return plan["missing"]
+        
+        written = False
+        try:
+            # Só chunks novos ou alterados passam pelo modelo de embeddings
+            for texts, metadatas, ids in iter_incremental_batches(files, sync_source, self.ingest_batch_size):
+                # Consultas em andamento usam o modelo primeiro (INGEST_PRIORITY=low)
+                self.priority.wait_background()
+                embeddings = self.embedding_model.embed_texts_array(texts)
+                if progress is not None:
+                    progress.add_embedded(len(texts))
+                written = True
+                self.vector_db.add_documents(texts, embeddings, metadatas, ids)
+                counts["added"] += len(texts)
+                if progress is not None:
+                    progress.add_written(len(texts))
+            
+            if directory_path:
+                counts["deleted"] += self.vector_db.prune_sources(
+                    str(Path(directory_path).resolve()),
+                    [source_key(f) for f in files]
+                )
+        finally:
+            # Também em caso de erro: sync_source e lotes já gravados alteraram a base
+            if self.semantic_cache is not None and (written or counts["updated"] or counts["deleted"]):
+                self.semantic_cache.clear()
+        
+        print(f"Ingestão: {counts}")
         return {
             "status": "success",
-            "chunks_added": len(texts),
+            "chunks_added": counts["added"],
+            "chunks_updated": counts["updated"],
+            "chunks_unchanged": counts["unchanged"],
+            "chunks_deleted": counts["deleted"],
             "total_documents": self.vector_db.get_document_count()
         }
     
-    def answer(self, query: str, top_k: int = None) -> Dict[str, Any]:
-        """Responde pergunta"""
+    async def answer(self, query: str, top_k: int = None) -> Dict[str, Any]:
+        """Responde pergunta (consultas idênticas simultâneas compartilham a execução)"""
         if top_k is None:
             top_k = self.top_k
+        if self.single_flight is None:
+            return await self._answer(query, top_k)
         
+        result, coalesced = await self.single_flight.do(
+            (normalize_query(query), top_k),
+            lambda: self._answer(query, top_k)
+        )
+        if coalesced:
+            return {**result, "query": query, "coalesced": True}
+        return result
+    
+    async def _answer(self, query: str, top_k: int) -> Dict[str, Any]:
+        """Responde pergunta (embedding e busca em threads, geração pelo cliente assíncrono)"""
         print("\n" + "="*60)
         print(f"Consulta monolítica: {query}")
         print("="*60)
         
-        # 1. Gerar embedding da query
-        query_embedding = self.embedding_model.embed_query(query)
-        
-        # 2. Buscar documentos
-        results = self.vector_db.query(query_embedding, top_k)
-        
-        documents = []
-        if results['documents'] and len(results['documents']) > 0:
-            docs = results['documents'][0]
-            metadatas = results['metadatas'][0] if results['metadatas'] else [{}] * len(docs)
-            distances = results['distances'][0] if results['distances'] else [0] * len(docs)
-            
-            for i, doc in enumerate(docs):
-                documents.append({
-                    'text': doc,
-                    'metadata': metadatas[i],
-                    'score': 1 - distances[i],
-                    'rank': i + 1
-                })
+        # 1-2. Gerar embedding da query e buscar documentos
+        query_embedding, documents = await asyncio.to_thread(self._retrieve, query, top_k)
         
         if not documents:
             return {
@@ -91,41 +193,32 @@ class RAGMonolithicPipeline:
                 "mode": "monolithic"
             }
         
-        # 3. Construir prompt
-        context_parts = []
-        for doc in documents:
-            source = doc['metadata'].get('source', 'Desconhecido')
-            context_parts.append(f"[Fonte: {source}]\n{doc['text']}")
-        
-        context = "\n\n---\n\n".join(context_parts)
-        if len(context) > self.max_context_length:
-            context = context[:self.max_context_length] + "..."
+        sources = format_sources(documents)
+        chunk_ids = [doc['id'] for doc in documents]
         
-        prompt = f"""Você é um assistente de onboarding corporativo.
-
-CONTEXTO:
-{context}
-
-PERGUNTA: {query}
-
-INSTRUÇÕES:
-- Use APENAS as informações do contexto
-- Seja claro e objetivo
-- Cite as fontes
-
-RESPOSTA:"""
+        # 3. Pergunta equivalente sobre os mesmos chunks já respondida
+        cached = await asyncio.to_thread(self._lookup_answer, query_embedding, chunk_ids)
+        if cached is not None:
+            return {
+                "query": query,
+                "answer": cached["answer"],
+                "sources": sources,
+                "context_used": len(documents),
+                "mode": "monolithic",
+                "architecture": "monolithic",
+                "cached": True,
+                "cache_similarity": cached["similarity"]
+            }
         
-        # 4. Gerar resposta
-        answer_text = self.llm.generate(prompt)
+        # 4. Construir prompt (chunks inteiros dentro do orçamento de tokens)
+        context, context_info = self.context_packer.pack(documents)
+        prompt = build_prompt(query, context)
+        prompt_tokens = self.context_packer.observe_prompt(prompt)
         
-        # 5. Preparar resposta
-        sources = []
-        for doc in documents:
-            sources.append({
-                'source': doc['metadata'].get('source', 'Desconhecido'),
-                'score': round(doc['score'], 4),
-                'excerpt': doc['text'][:150] + "..."
-            })
+        # 5. Gerar resposta (vagas limitadas; sobrecarga levanta AdmissionRejected)
+        async with self.admission.admit_async():
+            answer_text = await self.async_llm.generate(prompt)
+        await asyncio.to_thread(self._store_answer, query_embedding, chunk_ids, answer_text)
         
         print("="*60)
         print("Resposta gerada no modo monolítico")
@@ -137,30 +230,221 @@ RESPOSTA:"""
             "sources": sources,
             "context_used": len(documents),
             "mode": "monolithic",
-            "architecture": "monolithic"
+            "architecture": "monolithic",
+            "prompt_tokens": prompt_tokens,
+            "context_tokens": context_info["context_tokens"],
+            "cached": False
         }
     
+    def answer_stream(self, query: str, top_k: int = None) -> Iterator[Dict[str, Any]]:
+        """Responde pergunta em eventos: fontes primeiro, depois tokens
+        
+        A vaga de geração é reservada antes do primeiro evento: sobrecarga levanta
+        AdmissionRejected na primeira iteração, antes de o stream começar.
+        """
+        if top_k is None:
+            top_k = self.top_k
+        
+        started_at = time.perf_counter()
+        print(f"\nConsulta monolítica (streaming): {query}")
+        
+        # Depois dos headers 200 toda falha vira um evento de erro, nunca um stream truncado
+        try:
+            query_embedding, documents = self._retrieve(query, top_k)
+            sources_event = {"event": "sources", "data": {
+                "query": query,
+                "sources": format_sources(documents),
+                "context_used": len(documents),
+                "mode": "monolithic"
+            }}
+            chunk_ids = [doc['id'] for doc in documents]
+            cached = self._lookup_answer(query_embedding, chunk_ids) if documents else None
+            if documents and cached is None:
+                context, _ = self.context_packer.pack(documents)
+                prompt = build_prompt(query, context)
+                prompt_tokens = self.context_packer.observe_prompt(prompt)
+        except Exception as e:
+            print(f"Erro ao preparar a resposta (streaming): {e}")
+            yield {"event": "error", "data": {"message": f"Erro: {e}"}}
+            return
+        
+        if not documents:
+            yield sources_event
+            yield {"event": "token", "data": {"text": "Nenhum documento encontrado"}}
+            yield {"event": "done", "data": {"total_time": time.perf_counter() - started_at}}
+            return
+        
+        if cached is not None:
+            yield sources_event
+            yield {"event": "token", "data": {"text": cached["answer"]}}
+            yield {"event": "done", "data": {
+                "total_time": time.perf_counter() - started_at,
+                "cached": True
+            }}
+            return
+        
+        time_to_first_token = None
+        tokens = []
+        with self.admission.admit():
+            yield sources_event
+            try:
+                for token in self.llm.generate_stream(prompt):
+                    if time_to_first_token is None:
+                        time_to_first_token = time.perf_counter() - started_at
+                        self.ttft_histogram.observe(time_to_first_token)
+                    tokens.append(token)
+                    yield {"event": "token", "data": {"text": token}}
+            except Exception as e:
+                print(f"Erro no streaming do LLM: {e}")
+                yield {"event": "error", "data": {"message": str(e)}}
+                return
+        
+        total_time = time.perf_counter() - started_at
+        self.stream_total_histogram.observe(total_time)
+        try:
+            self._store_answer(query_embedding, chunk_ids, "".join(tokens))
+        except Exception as e:
+            # A resposta já foi entregue; só o cache fica sem ela
+            print(f"Erro ao guardar a resposta no cache semântico: {e}")
+        yield {"event": "done", "data": {
+            "time_to_first_token": time_to_first_token,
+            "total_time": total_time,
+            "prompt_tokens": prompt_tokens,
+            "cached": False
+        }}
+    
+    def _retrieve(self, query: str, top_k: int) -> Tuple[List[float], List[Dict[str, Any]]]:
+        """Embedding da query + busca vetorial (ingestão em segundo plano cede a vez)"""
+        with self.priority.interactive():
+            query_embedding = self.embedding_model.embed_query(query)
+            results = self.vector_db.query(query_embedding, top_k)
+        return query_embedding, self._to_documents(results, 0)
+    
+    def _lookup_answer(self, query_embedding: List[float], chunk_ids: List[str]) -> Optional[Dict[str, Any]]:
+        """Consulta o cache semântico de respostas"""
+        if self.semantic_cache is None:
+            return None
+        cached = self.semantic_cache.lookup(query_embedding, chunk_ids)
+        if cached is not None:
+            print(f"Cache semântico: hit (similaridade {cached['similarity']:.3f})")
+        return cached
+    
+    def _store_answer(self, query_embedding: List[float], chunk_ids: List[str], answer_text: str) -> None:
+        """Guarda resposta no cache semântico (falhas de geração não são guardadas)"""
+        if self.semantic_cache is not None and answer_text and not answer_text.startswith(GENERATION_ERROR):
+            self.semantic_cache.put(query_embedding, chunk_ids, answer_text)
+    
+    def search_many(self, queries: List[str], top_k: int = None) -> List[List[Dict[str, Any]]]:
+        """Busca em lote: um forward pass e uma passada pelo índice para N queries"""
+        if top_k is None:
+            top_k = self.top_k
+        
+        with self.priority.interactive():
+            query_embeddings = self.embedding_model.embed_queries_cached(queries)
+            results = self.vector_db.query_many(query_embeddings, top_k)
+        return [self._to_documents(results, i) for i in range(len(queries))]
+    
+    @staticmethod
+    def _to_documents(results: Dict[str, Any], index: int) -> List[Dict[str, Any]]:
+        """Converte resultado da busca (índice da query) em documentos ranqueados"""
+        documents = []
+        if results['documents'] and len(results['documents']) > index:
+            docs = results['documents'][index]
+            ids = results['ids'][index]
+            metadatas = results['metadatas'][index] if results['metadatas'] else [{}] * len(docs)
+            distances = results['distances'][index] if results['distances'] else [0] * len(docs)
+            
+            for i, doc in enumerate(docs):
+                documents.append({
+                    'id': ids[i],
+                    'text': doc,
+                    'metadata': metadatas[i],
+                    'score': 1 - distances[i],
+                    'rank': i + 1
+                })
+        return documents
+    
     def get_stats(self) -> Dict[str, Any]:
         """Retorna estatísticas"""
         return {
             "total_documents": self.vector_db.get_document_count(),
             "embedding_model": self.embedding_model.model_name,
             "llm_model": self.llm.model,
+            "embedding_cache": self.embedding_model.get_cache_stats(),
+            "query_cache": self.embedding_model.get_query_cache_stats(),
+            "semantic_cache": self._semantic_cache_stats(),
+            "single_flight": self._single_flight_stats(),
+            "admission": self.admission.get_stats(),
+            "ingest_priority": self.priority.get_stats(),
+            "llm_endpoints": self.llm.pool.get_stats(),
+            "context": self.context_packer.get_stats(),
+            "streaming": {
+                "time_to_first_token_s": self.ttft_histogram.get_stats(),
+                "total_time_s": self.stream_total_histogram.get_stats()
+            },
+            "worker": self.worker or {},
             "mode": "monolithic"
         }
     
+    def _semantic_cache_stats(self) -> Dict[str, Any]:
+        if self.semantic_cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.semantic_cache.get_stats()}
+    
+    def _single_flight_stats(self) -> Dict[str, Any]:
+        if self.single_flight is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.single_flight.get_stats()}
+    
+    async def aclose(self) -> None:
+        """Fecha as conexões com o Ollama e grava o cache semântico"""
+        await self.async_llm.aclose()
+        self.llm.close()
+        if self.semantic_cache is not None:
+            await asyncio.to_thread(self.semantic_cache.close)
+    
     def reset(self) -> Dict[str, Any]:
         """Reseta banco"""
         self.vector_db.reset_collection()
+        if self.semantic_cache is not None:
+            self.semantic_cache.clear()
         return {"status": "success", "message": "Resetado"}
 
 
 # Singleton
 _pipeline = None
+_pipeline_lock = threading.Lock()
+_pipeline_options = {}
+
+def configure_pipeline(**options) -> None:
+    """Argumentos do pipeline deste processo (workers do modo prefork)"""
+    _pipeline_options.update(options)
 
 def get_pipeline():
     global _pipeline
-    if _pipeline is None:
-        _pipeline = RAGMonolithicPipeline()
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = RAGMonolithicPipeline(**_pipeline_options)
     return _pipeline
 
+async def close_pipeline() -> None:
+    """Fecha o pipeline deste processo, se já foi criado"""
+    if _pipeline is not None:
+        await _pipeline.aclose()
+
+def is_warm() -> bool:
+    """Pipeline deste processo criado e aquecido"""
+    return _pipeline is not None and _pipeline.ready
+
+def is_ready() -> bool:
+    """Pipeline aquecido; no modo prefork, em todos os workers (não bloqueia durante o carregamento)"""
+    readiness = _pipeline_options.get("readiness")
+    return is_warm() and (readiness is None or readiness.all_ready())
+
+def readiness_status() -> Dict[str, Any]:
+    """Workers aquecidos no modo prefork (vazio com um único processo)"""
+    readiness = _pipeline_options.get("readiness")
+    if readiness is None:
+        return {}
+    return {"workers_ready": readiness.count(), "workers": readiness.total}
+
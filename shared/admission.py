@@ -0,0 +1,134 @@
+"""
+Controle de Admissão - Código Compartilhado
+"""
+
+import asyncio
+import math
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Dict, Any, Iterator
+
+from shared.metrics import Histogram, LATENCY_BUCKETS
+
+# Chave de metadata gRPC com a sugestão de nova tentativa (segundos)
+RETRY_AFTER_METADATA_KEY = 'retry-after'
+
+
+class AdmissionRejected(Exception):
+    """Requisição recusada por sobrecarga (fila cheia ou espera esgotada)"""
+    
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Limita gerações simultâneas com fila de espera limitada e prazo na fila"""
+    
+    def __init__(self, max_concurrency: int = None, max_queue: int = None,
+                 queue_timeout: float = None, backends: int = 1, workers: int = 1):
+        if max_concurrency is None:
+            # LLM_MAX_CONCURRENCY é por endpoint Ollama, dividido entre os processos worker
+            max_concurrency = max(1, int(os.getenv('LLM_MAX_CONCURRENCY', '2')) * backends // workers)
+        if max_queue is None:
+            max_queue = max(1, int(os.getenv('LLM_MAX_QUEUE', '16')) // workers)
+        if queue_timeout is None:
+            queue_timeout = float(os.getenv('LLM_QUEUE_TIMEOUT_SECONDS', '10'))
+        
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.queue_wait_histogram = Histogram(LATENCY_BUCKETS)
+        self.service_time_histogram = Histogram(LATENCY_BUCKETS)
+    
+    def retry_after(self) -> int:
+        """Estimativa (s) até uma vaga: fila à frente x tempo médio de geração"""
+        avg = self.service_time_histogram.get_stats()["avg"] or 1.0
+        ahead = (self._waiting + 1) / self.max_concurrency
+        return max(1, math.ceil(ahead * avg))
+    
+    def acquire(self) -> float:
+        """Reserva uma vaga de geração ou levanta AdmissionRejected; retorna o início da geração"""
+        queued_at = time.perf_counter()
+        
+        with self._cond:
+            if self._active >= self.max_concurrency or self._waiting:
+                if self._waiting >= self.max_queue:
+                    self.rejected += 1
+                    raise AdmissionRejected("Fila de geração cheia", self.retry_after())
+                
+                self._waiting += 1
+                deadline = queued_at + self.queue_timeout
+                try:
+                    while self._active >= self.max_concurrency:
+                        remaining = deadline - time.perf_counter()
+                        if remaining <= 0:
+                            self.timed_out += 1
+                            raise AdmissionRejected("Tempo máximo na fila esgotado", self.retry_after())
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            self._active += 1
+            self.admitted += 1
+        
+        started_at = time.perf_counter()
+        self.queue_wait_histogram.observe(started_at - queued_at)
+        return started_at
+    
+    def release(self, started_at: float) -> None:
+        """Devolve a vaga reservada por acquire()"""
+        self.service_time_histogram.observe(time.perf_counter() - started_at)
+        with self._cond:
+            self._active -= 1
+            self._cond.notify()
+    
+    @contextmanager
+    def admit(self) -> Iterator[None]:
+        """Reserva uma vaga de geração ou levanta AdmissionRejected"""
+        started_at = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(started_at)
+    
+    @asynccontextmanager
+    async def admit_async(self) -> AsyncIterator[None]:
+        """admit() para event loops: só a espera na fila ocupa uma thread, a geração não"""
+        waiter = asyncio.ensure_future(asyncio.to_thread(self.acquire))
+        try:
+            started_at = await asyncio.shield(waiter)
+        except asyncio.CancelledError:
+            # Chamador cancelado durante a espera: a vaga obtida depois é devolvida
+            waiter.add_done_callback(
+                lambda w: w.cancelled() or w.exception() is not None or self.release(w.result())
+            )
+            raise
+        try:
+            yield
+        finally:
+            self.release(started_at)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna ocupação, fila, recusas e tempos de espera/geração"""
+        with self._cond:
+            active, waiting = self._active, self._waiting
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "active": active,
+            "queue_depth": waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "queue_wait_s": self.queue_wait_histogram.get_stats(),
+            "service_time_s": self.service_time_histogram.get_stats()
+        }
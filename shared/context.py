@@ -0,0 +1,154 @@
+"""
+Empacotamento de Contexto por Orçamento de Tokens - Código Compartilhado
+"""
+
+import math
+import os
+import threading
+from typing import Dict, List, Any, Tuple
+
+from shared.metrics import Histogram
+
+# Buckets (tokens) para o tamanho dos prompts
+TOKEN_BUCKETS = [128, 256, 512, 768, 1024, 1536, 2048, 4096, 8192]
+
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+
+
+def format_chunk(source: str, text: str) -> str:
+    """Bloco de contexto com a fonte, como citado no prompt"""
+    return f"[Fonte: {source}]\n{text}"
+
+
+def merge_overlapping(first: str, second: str, min_overlap: int = 10) -> str:
+    """Junta chunks adjacentes removendo o trecho sobreposto (overlap do chunk_text)"""
+    for size in range(min(len(first), len(second), 200), min_overlap - 1, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return f"{first} {second}"
+
+
+class ContextPacker:
+    """Monta o contexto com chunks inteiros, por score, dentro de MAX_CONTEXT_TOKENS (menos a margem)"""
+    
+    def __init__(self, max_tokens: int = None, tokenizer_name: str = None, margin: float = None):
+        if max_tokens is None:
+            max_tokens = int(os.getenv('MAX_CONTEXT_TOKENS', '768'))
+        if tokenizer_name is None:
+            tokenizer_name = os.getenv('CONTEXT_TOKENIZER', '')
+        # Sem o tokenizer do LLM a contagem é aproximada (tokenizer do modelo de embeddings)
+        approximate = not tokenizer_name
+        if approximate:
+            tokenizer_name = os.getenv('EMBEDDING_MODEL', 'intfloat/multilingual-e5-small')
+        
+        self.max_tokens = max_tokens
+        self.tokenizer_name = tokenizer_name
+        self.tokenizer = None
+        self._lock = threading.Lock()
+        try:
+            from transformers import AutoTokenizer
+            self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+        except Exception as e:
+            # Sem tokenizer local: estimativa de ~4 caracteres por token
+            print(f"Tokenizer {tokenizer_name} indisponível ({e}); usando estimativa")
+            self.tokenizer_name = "estimate"
+            approximate = True
+        
+        # Contagem aproximada: folga para o tokenizer do LLM, que pode gerar mais tokens
+        if margin is None:
+            margin = float(os.getenv('CONTEXT_TOKEN_MARGIN', '0.15' if approximate else '0'))
+        self.margin = margin
+        self.budget = max(1, int(max_tokens * (1 - margin)))
+        
+        self.prompt_tokens_histogram = Histogram(TOKEN_BUCKETS)
+        self.chunks_merged = 0
+        self.blocks_dropped = 0
+        print(f"Contexto limitado a {self.budget} de {max_tokens} tokens "
+              f"({self.tokenizer_name}, margem {margin:.0%})")
+    
+    def count_tokens(self, text: str) -> int:
+        """Número de tokens do texto"""
+        if self.tokenizer is None:
+            return math.ceil(len(text) / 4)
+        with self._lock:
+            return len(self.tokenizer(text, add_special_tokens=False, verbose=False)['input_ids'])
+    
+    def _merge_adjacent(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Agrupa chunks consecutivos da mesma fonte num único bloco"""
+        positioned = []
+        blocks = []
+        for doc in documents:
+            metadata = doc.get('metadata', {})
+            try:
+                # Mesmo arquivo = mesmo caminho; o nome sozinho pode se repetir entre diretórios
+                key = metadata.get('path', metadata['source'])
+                positioned.append((key, int(metadata['chunk_id']), doc))
+            except (KeyError, TypeError, ValueError):
+                blocks.append({"source": metadata.get('source', 'Desconhecido'),
+                               "text": doc['text'], "score": doc['score']})
+        
+        current = None
+        for key, chunk_id, doc in sorted(positioned, key=lambda item: (item[0], item[1])):
+            if current is not None and current["key"] == key and current["last_chunk"] + 1 == chunk_id:
+                current["text"] = merge_overlapping(current["text"], doc['text'])
+                current["score"] = max(current["score"], doc['score'])
+                current["last_chunk"] = chunk_id
+                continue
+            current = {"source": doc['metadata']['source'], "key": key, "text": doc['text'],
+                       "score": doc['score'], "last_chunk": chunk_id}
+            blocks.append(current)
+        return blocks
+    
+    def pack(self, documents: List[Dict[str, Any]]) -> Tuple[str, Dict[str, Any]]:
+        """Contexto com os blocos mais relevantes que cabem no orçamento de tokens"""
+        blocks = sorted(self._merge_adjacent(documents), key=lambda block: block["score"], reverse=True)
+        separator_tokens = self.count_tokens(CONTEXT_SEPARATOR)
+        
+        selected = []
+        used_tokens = 0
+        for block in blocks:
+            text = format_chunk(block["source"], block["text"])
+            tokens = self.count_tokens(text) + (separator_tokens if selected else 0)
+            if used_tokens + tokens <= self.budget:
+                selected.append(text)
+                used_tokens += tokens
+        
+        if not selected and blocks:
+            # Nem o bloco mais relevante cabe: corta-o no orçamento
+            text = format_chunk(blocks[0]["source"], blocks[0]["text"])
+            tokens = self.count_tokens(text)
+            # Tokens não se distribuem por igual entre os caracteres: recorta até caber
+            while tokens > self.budget and text:
+                text = text[:min(len(text) - 1, int(len(text) * self.budget / tokens * 0.95))]
+                tokens = self.count_tokens(text)
+            selected.append(text)
+            used_tokens = tokens
+        
+        merged = len(documents) - len(blocks)
+        dropped = len(blocks) - len(selected)
+        self.chunks_merged += merged
+        self.blocks_dropped += dropped
+        return CONTEXT_SEPARATOR.join(selected), {
+            "context_tokens": used_tokens,
+            "blocks_used": len(selected),
+            "chunks_merged": merged,
+            "blocks_dropped": dropped
+        }
+    
+    def observe_prompt(self, prompt: str) -> int:
+        """Conta e registra os tokens do prompt final"""
+        tokens = self.count_tokens(prompt)
+        self.prompt_tokens_histogram.observe(tokens)
+        return tokens
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna orçamento, tokenizer e distribuição de tokens por prompt"""
+        return {
+            "max_context_tokens": self.max_tokens,
+            "context_budget_tokens": self.budget,
+            "token_margin": self.margin,
+            "tokenizer": self.tokenizer_name,
+            "chunks_merged": self.chunks_merged,
+            "blocks_dropped": self.blocks_dropped,
+            "prompt_tokens": self.prompt_tokens_histogram.get_stats()
+        }
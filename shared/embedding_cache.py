@@ -0,0 +1,156 @@
+"""
+Cache Persistente de Embeddings - Código Compartilhado
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Any
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """Cache em disco endereçado por conteúdo (modelo, prefixo, hash do chunk)"""
+    
+    def __init__(self, cache_dir: str = None, max_size_mb: float = None):
+        if cache_dir is None:
+            cache_dir = os.getenv('EMBEDDING_CACHE_DIR', './embedding_cache')
+        if max_size_mb is None:
+            max_size_mb = float(os.getenv('EMBEDDING_CACHE_MAX_MB', '256'))
+        
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+        os.makedirs(cache_dir, exist_ok=True)
+        
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            os.path.join(cache_dir, 'embeddings.sqlite3'),
+            check_same_thread=False,
+            timeout=30
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, dim INTEGER NOT NULL, "
+            "vector BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_last_access ON embeddings(last_access)"
+        )
+        self._conn.commit()
+        
+        self._size_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        ).fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        print(f"Cache de embeddings em {cache_dir} ({self._size_bytes / 1e6:.1f} MB)")
+    
+    @staticmethod
+    def make_key(model_name: str, prefix: str, text: str) -> str:
+        """Chave estável para (modelo, prefixo, conteúdo)"""
+        digest = hashlib.sha256()
+        for part in (model_name, prefix, text):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\x00')
+        return digest.hexdigest()
+    
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Busca embeddings existentes; chaves ausentes contam como miss"""
+        unique_keys = list(dict.fromkeys(keys))
+        found = {}
+        
+        with self._lock:
+            # SQLite limita o número de parâmetros por consulta
+            for start in range(0, len(unique_keys), 500):
+                batch = unique_keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype='<f4')
+            
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+            
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        
+        return found
+    
+    def put_many(self, items: Dict[str, np.ndarray]) -> None:
+        """Armazena embeddings como float32 little-endian"""
+        if not items:
+            return
+        
+        now = time.time()
+        rows = []
+        for key, vector in items.items():
+            blob = np.asarray(vector, dtype='<f4').tobytes()
+            rows.append((key, len(blob) // 4, blob, now))
+        
+        with self._lock:
+            replaced = 0
+            for start in range(0, len(rows), 500):
+                batch = [row[0] for row in rows[start:start + 500]]
+                placeholders = ",".join("?" * len(batch))
+                replaced += self._conn.execute(
+                    f"SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings "
+                    f"WHERE key IN ({placeholders})",
+                    batch
+                ).fetchone()[0]
+            
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, dim, vector, last_access) "
+                "VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._size_bytes += sum(len(row[2]) for row in rows) - replaced
+            
+            if self._size_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+    
+    def _evict(self) -> None:
+        """Remove entradas menos usadas até ficar em 90% do limite"""
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute(
+            "SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_access ASC"
+        )
+        to_delete = []
+        size = self._size_bytes
+        for key, length in rows:
+            if size <= target:
+                break
+            to_delete.append((key,))
+            size -= length
+        
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", to_delete)
+        self._size_bytes = size
+        self.evictions += len(to_delete)
+        print(f"Cache de embeddings: {len(to_delete)} entradas removidas")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna contadores de hit/miss e ocupação"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "size_mb": round(self._size_bytes / (1024 * 1024), 2)
+        }
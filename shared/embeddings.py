@@ -3,36 +3,145 @@ Módulo de Embeddings - Código Compartilhado
 """
 
 from sentence_transformers import SentenceTransformer
-from typing import List
+from typing import List, Dict, Any, Optional
+import numpy as np
 import os
+import time
+
+from shared.embedding_cache import EmbeddingCache
+from shared.query_cache import LRUCache, normalize_query
 
 
 class EmbeddingModel:
     """Classe para gerar embeddings usando SentenceTransformer"""
     
-    def __init__(self, model_name: str = None):
+    def __init__(self, model_name: str = None, use_cache: bool = None,
+                 model: SentenceTransformer = None):
         if model_name is None:
             model_name = os.getenv('EMBEDDING_MODEL', 'intfloat/multilingual-e5-small')
+        if use_cache is None:
+            use_cache = os.getenv('EMBEDDING_CACHE_ENABLED', 'true').lower() == 'true'
         
-        print(f"Carregando modelo de embeddings: {model_name}")
-        self.model = SentenceTransformer(model_name)
+        if model is None:
+            model = self.load_model(model_name)
+        self.model = model
         self.model_name = model_name
+        self.cache = EmbeddingCache() if use_cache else None
+        
+        self.query_cache = None
+        if os.getenv('QUERY_CACHE_ENABLED', 'true').lower() == 'true':
+            self.query_cache = LRUCache(
+                max_entries=int(os.getenv('QUERY_CACHE_MAX_ENTRIES', '1024')),
+                ttl_seconds=float(os.getenv('QUERY_CACHE_TTL_SECONDS', '3600'))
+            )
         print("Modelo de embeddings carregado com sucesso.")
     
+    @staticmethod
+    def load_model(model_name: str) -> SentenceTransformer:
+        """Carrega só os pesos (sem caches), ex.: antes do fork dos workers"""
+        print(f"Carregando modelo de embeddings: {model_name}")
+        return SentenceTransformer(model_name)
+    
     def embed_query(self, query: str) -> List[float]:
-        """Gera embedding para query"""
+        """Gera embedding para query (consultando o cache de queries)"""
+        cached = self.get_cached_query(query)
+        if cached is not None:
+            return cached
+        
+        embedding = self.embed_queries([query])[0]
+        self.store_query(query, embedding)
+        return embedding
+    
+    def get_cached_query(self, query: str) -> Optional[List[float]]:
+        """Busca embedding da query normalizada no cache"""
+        if self.query_cache is None:
+            return None
+        return self.query_cache.get(normalize_query(query))
+    
+    def store_query(self, query: str, embedding: List[float]) -> None:
+        """Guarda embedding da query normalizada no cache"""
+        if self.query_cache is not None:
+            self.query_cache.put(normalize_query(query), embedding)
+    
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Gera embeddings para várias queries num único forward pass (sem cache)"""
         if 'e5' in self.model_name.lower():
-            query = f"query: {query}"
-        return self.model.encode(query, convert_to_tensor=False).tolist()
+            queries = [f"query: {query}" for query in queries]
+        embeddings = self.model.encode(queries, convert_to_tensor=False)
+        return [emb.tolist() for emb in embeddings]
+    
+    def embed_queries_cached(self, queries: List[str]) -> List[List[float]]:
+        """Gera embeddings para várias queries, calculando só as ausentes do cache"""
+        embeddings = [self.get_cached_query(query) for query in queries]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        
+        if missing:
+            encoded = self.embed_queries([queries[i] for i in missing])
+            for i, embedding in zip(missing, encoded):
+                embeddings[i] = embedding
+                self.store_query(queries[i], embedding)
+        return embeddings
     
     def embed_texts(self, texts: List[str]) -> List[List[float]]:
         """Gera embeddings para múltiplos textos"""
-        if 'e5' in self.model_name.lower():
-            texts = [f"passage: {text}" for text in texts]
-        embeddings = self.model.encode(texts, convert_to_tensor=False, show_progress_bar=True)
-        return [emb.tolist() for emb in embeddings]
+        return self.embed_texts_array(texts).tolist()
+    
+    def embed_texts_array(self, texts: List[str]) -> np.ndarray:
+        """Gera embeddings para múltiplos textos como matriz float32 (n x dim)"""
+        prefix = "passage: " if 'e5' in self.model_name.lower() else ""
+        
+        if not texts:
+            return np.empty((0, self.get_dimension()), dtype=np.float32)
+        
+        if self.cache is None:
+            embeddings = self.model.encode(
+                [f"{prefix}{text}" for text in texts],
+                convert_to_tensor=False,
+                show_progress_bar=True
+            )
+            return np.asarray(embeddings, dtype=np.float32)
+        
+        # Só passa pelo modelo o que ainda não está no cache
+        keys = [self.cache.make_key(self.model_name, prefix, text) for text in texts]
+        found = self.cache.get_many(keys)
+        missing = [i for i, key in enumerate(keys) if key not in found]
+        
+        if missing:
+            print(f"Cache de embeddings: {len(texts) - len(missing)} hits, {len(missing)} misses")
+            encoded = self.model.encode(
+                [f"{prefix}{texts[i]}" for i in missing],
+                convert_to_tensor=False,
+                show_progress_bar=True
+            )
+            new_items = {keys[i]: emb for i, emb in zip(missing, encoded)}
+            self.cache.put_many(new_items)
+            found.update(new_items)
+        else:
+            print(f"Cache de embeddings: {len(texts)} hits")
+        
+        return np.stack([found[key] for key in keys]).astype(np.float32, copy=False)
+    
+    def warmup(self) -> float:
+        """Encodes descartáveis (fora dos caches) para inicializar os kernels; retorna a duração"""
+        started_at = time.perf_counter()
+        self.embed_queries(["warm-up"])
+        self.embed_queries(["warm-up"] * 8)
+        elapsed = time.perf_counter() - started_at
+        print(f"Modelo de embeddings aquecido em {elapsed:.2f}s")
+        return elapsed
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Retorna estatísticas do cache de embeddings"""
+        if self.cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.cache.get_stats()}
+    
+    def get_query_cache_stats(self) -> Dict[str, Any]:
+        """Retorna estatísticas do cache de queries"""
+        if self.query_cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.query_cache.get_stats()}
     
     def get_dimension(self) -> int:
         """Retorna dimensão dos embeddings"""
         return self.model.get_sentence_embedding_dimension()
-
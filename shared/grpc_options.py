@@ -0,0 +1,322 @@
+"""
+Canais e Opções gRPC - Código Compartilhado
+"""
+
+import argparse
+import asyncio
+import os
+import stat
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Tuple
+
+import grpc
+from grpc_health.v1 import health_pb2, health_pb2_grpc
+
+LB_POLICIES = ('round_robin', 'least_loaded')
+
+# Falhas de transporte que contam contra a réplica (as demais são da aplicação)
+REPLICA_FAILURE_CODES = (grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED)
+
+
+def _keepalive_time_ms() -> int:
+    return int(os.getenv('GRPC_KEEPALIVE_TIME_MS', '30000'))
+
+
+def _max_message_bytes() -> int:
+    return int(float(os.getenv('GRPC_MAX_MESSAGE_MB', '32')) * 1024 * 1024)
+
+
+def compression() -> grpc.Compression:
+    """Compressão das mensagens (GRPC_COMPRESSION: none ou gzip)"""
+    if os.getenv('GRPC_COMPRESSION', 'none').lower() == 'gzip':
+        return grpc.Compression.Gzip
+    return grpc.Compression.NoCompression
+
+
+def channel_options() -> List[Tuple[str, Any]]:
+    """Keepalive, tamanho máximo de mensagem e conexão própria por canal"""
+    max_message = _max_message_bytes()
+    return [
+        ('grpc.keepalive_time_ms', _keepalive_time_ms()),
+        ('grpc.keepalive_timeout_ms', int(os.getenv('GRPC_KEEPALIVE_TIMEOUT_MS', '10000'))),
+        ('grpc.keepalive_permit_without_calls', 1),
+        ('grpc.http2.max_pings_without_data', 0),
+        ('grpc.max_send_message_length', max_message),
+        ('grpc.max_receive_message_length', max_message),
+        # Sem isso canais com as mesmas opções compartilham a mesma conexão HTTP/2
+        ('grpc.use_local_subchannel_pool', 1),
+    ]
+
+
+def server_options() -> List[Tuple[str, Any]]:
+    """Opções dos servidores compatíveis com as dos canais"""
+    max_message = _max_message_bytes()
+    keepalive_time = _keepalive_time_ms()
+    return [
+        ('grpc.keepalive_time_ms', keepalive_time),
+        ('grpc.keepalive_timeout_ms', int(os.getenv('GRPC_KEEPALIVE_TIMEOUT_MS', '10000'))),
+        ('grpc.keepalive_permit_without_calls', 1),
+        # Aceita os pings de keepalive dos clientes sem encerrar a conexão
+        ('grpc.http2.min_recv_ping_interval_without_data_ms', min(keepalive_time, 10000)),
+        ('grpc.http2.max_ping_strikes', 0),
+        ('grpc.max_send_message_length', max_message),
+        ('grpc.max_receive_message_length', max_message),
+    ]
+
+
+def service_addresses(service: str, default: str) -> List[str]:
+    """Endereços de um serviço: <SERVICE>_ADDRESSES (vírgulas) ou <SERVICE>_ADDRESS"""
+    addresses = os.getenv(f'{service}_ADDRESSES') or os.getenv(f'{service}_ADDRESS', default)
+    return [address.strip() for address in addresses.split(',') if address.strip()]
+
+
+def bind_addresses(service: str, port: int = None, address: str = None,
+                   default_port: int = 50051) -> List[str]:
+    """Endereços de escuta: address explícito, <SERVICE>_LISTEN ou [::]:port (vírgulas, aceita unix:)"""
+    addresses = address or os.getenv(f'{service}_LISTEN') or f"[::]:{port or default_port}"
+    return [item.strip() for item in addresses.split(',') if item.strip()]
+
+
+def unix_socket_path(address: str):
+    """Caminho do arquivo de um endereço unix:path ou unix:///path (None para TCP)"""
+    if address.startswith('unix://'):
+        return address[len('unix://'):]
+    if address.startswith('unix:'):
+        return address[len('unix:'):]
+    return None
+
+
+def add_ports(server, addresses: List[str]) -> None:
+    """Escuta em cada endereço; sockets Unix têm o diretório criado e o arquivo antigo removido"""
+    for address in addresses:
+        path = unix_socket_path(address)
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            # Socket que sobrou de uma execução anterior impede o bind
+            if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+                os.unlink(path)
+        server.add_insecure_port(address)
+
+
+def serve_arguments(description: str, default_port: int, workers: bool = False,
+                    read_only: bool = False) -> argparse.Namespace:
+    """Argumentos de linha de comando dos serviços (--port ou --address, opcionalmente --workers/--read-only)"""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--port', type=int, default=default_port,
+                        help=f"porta TCP (padrão: {default_port})")
+    parser.add_argument('--address', help="endereços separados por vírgula, ex.: "
+                        "0.0.0.0:50061,unix:/tmp/rag-embedding.sock (sobrepõe --port)")
+    if workers:
+        parser.add_argument('--workers', type=int,
+                            help="processos escutando o mesmo endereço (SO_REUSEPORT)")
+    if read_only:
+        parser.add_argument('--read-only', action='store_true',
+                            help="réplica de leitura: acompanha o índice escrito pela primária")
+    return parser.parse_args()
+
+
+def create_channel(address: str, aio: bool = False):
+    """Canal inseguro com as opções compartilhadas"""
+    factory = grpc.aio.insecure_channel if aio else grpc.insecure_channel
+    return factory(address, options=channel_options(), compression=compression())
+
+
+class Replica:
+    """Estado de roteamento de uma réplica (endereço) de um serviço"""
+    
+    def __init__(self, address: str, channels: List[Any], stub_class):
+        self.address = address
+        self.channels = channels
+        self.stubs = [stub_class(channel) for channel in channels]
+        self.health_stub = health_pb2_grpc.HealthStub(channels[0])
+        self.outstanding = 0
+        self.healthy = True
+        self.ejected_until = 0.0
+        self.consecutive_failures = 0
+        self.requests = 0
+        self.failures = 0
+        self.ejections = 0
+        self._next = 0
+    
+    def available(self, now: float) -> bool:
+        return self.healthy and now >= self.ejected_until
+    
+    def next_stub(self):
+        """Canais da réplica em rodízio"""
+        stub = self.stubs[self._next % len(self.stubs)]
+        self._next += 1
+        return stub
+
+
+class ChannelPool:
+    """Réplicas de um serviço com vários canais cada, balanceadas no cliente"""
+    
+    def __init__(self, addresses: List[str], stub_class, channels_per_address: int = None,
+                 aio: bool = False, policy: str = None, eject_failures: int = None,
+                 eject_seconds: float = None, health_interval: float = None):
+        if channels_per_address is None:
+            channels_per_address = int(os.getenv('GRPC_CHANNELS_PER_ADDRESS', '4'))
+        if policy is None:
+            policy = os.getenv('GRPC_LB_POLICY', 'least_loaded').lower()
+        if eject_failures is None:
+            eject_failures = int(os.getenv('GRPC_EJECT_FAILURES', '3'))
+        if eject_seconds is None:
+            eject_seconds = float(os.getenv('GRPC_EJECT_SECONDS', '30'))
+        if health_interval is None:
+            health_interval = float(os.getenv('GRPC_HEALTH_INTERVAL', '5'))
+        if policy not in LB_POLICIES:
+            raise ValueError(f"GRPC_LB_POLICY inválida: {policy} (use {', '.join(LB_POLICIES)})")
+        
+        self.addresses = addresses
+        self.channels_per_address = max(1, channels_per_address)
+        self.aio = aio
+        self.policy = policy
+        self.eject_failures = eject_failures
+        self.eject_seconds = eject_seconds
+        self.health_interval = health_interval
+        
+        self.replicas = [
+            Replica(address, [create_channel(address, aio) for _ in range(self.channels_per_address)], stub_class)
+            for address in addresses
+        ]
+        self._lock = threading.Lock()
+        self._next = 0
+        
+        self._health_task = None
+        if health_interval > 0 and len(self.replicas) > 1:
+            if aio:
+                # Pool aio é criado dentro do event loop (startup do gateway)
+                self._health_task = asyncio.get_running_loop().create_task(self._health_loop_async())
+            else:
+                threading.Thread(target=self._health_loop, daemon=True).start()
+    
+    def acquire(self) -> Replica:
+        """Escolhe a réplica pela política (round_robin ou least_loaded)"""
+        with self._lock:
+            now = time.time()
+            candidates = [r for r in self.replicas if r.available(now)]
+            if not candidates:
+                # Todas fora: tenta a que volta primeiro em vez de falhar direto
+                candidates = [min(self.replicas, key=lambda r: r.ejected_until)]
+            
+            # Rodízio a partir de um índice rotativo (também desempata o least_loaded)
+            start = self._next
+            self._next = (self._next + 1) % len(self.replicas)
+            order = {id(r): (i - start) % len(self.replicas) for i, r in enumerate(self.replicas)}
+            if self.policy == 'least_loaded':
+                replica = min(candidates, key=lambda r: (r.outstanding, order[id(r)]))
+            else:
+                replica = min(candidates, key=lambda r: order[id(r)])
+            
+            replica.outstanding += 1
+            replica.requests += 1
+            return replica
+    
+    def available_count(self) -> int:
+        """Réplicas disponíveis agora (saudáveis e fora da ejeção)"""
+        with self._lock:
+            now = time.time()
+            return sum(1 for r in self.replicas if r.available(now))
+    
+    def release(self, replica: Replica, success: bool) -> None:
+        """Libera a réplica; falhas seguidas a retiram do pool"""
+        with self._lock:
+            replica.outstanding -= 1
+            if success:
+                replica.consecutive_failures = 0
+                return
+            
+            replica.failures += 1
+            replica.consecutive_failures += 1
+            if replica.consecutive_failures >= self.eject_failures:
+                if time.time() >= replica.ejected_until:
+                    replica.ejections += 1
+                    print(f"Réplica {replica.address} removida do pool por {self.eject_seconds:.0f}s")
+                replica.ejected_until = time.time() + self.eject_seconds
+                replica.consecutive_failures = 0
+    
+    @contextmanager
+    def lease(self) -> Iterator[Any]:
+        """Stub de uma réplica durante uma chamada; falhas de transporte contam contra ela"""
+        replica = self.acquire()
+        try:
+            yield replica.next_stub()
+        except grpc.RpcError as e:
+            self.release(replica, success=e.code() not in REPLICA_FAILURE_CODES)
+            raise
+        except BaseException:
+            # Erros da aplicação ou cancelamento (hedging): não é falha da réplica
+            self.release(replica, success=True)
+            raise
+        self.release(replica, success=True)
+    
+    @staticmethod
+    def _is_healthy(status: int) -> bool:
+        return status == health_pb2.HealthCheckResponse.SERVING
+    
+    def _set_health(self, replica: Replica, healthy: bool) -> None:
+        with self._lock:
+            if healthy != replica.healthy:
+                state = "de volta ao" if healthy else "fora do"
+                print(f"Réplica {replica.address} {state} pool (health check)")
+            replica.healthy = healthy
+    
+    def _health_loop(self) -> None:
+        while True:
+            time.sleep(self.health_interval)
+            for replica in self.replicas:
+                try:
+                    response = replica.health_stub.Check(health_pb2.HealthCheckRequest(), timeout=2)
+                    healthy = self._is_healthy(response.status)
+                except grpc.RpcError as e:
+                    # Serviço sem health check registrado continua elegível
+                    healthy = e.code() == grpc.StatusCode.UNIMPLEMENTED
+                self._set_health(replica, healthy)
+    
+    async def _health_loop_async(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_interval)
+            for replica in self.replicas:
+                try:
+                    response = await replica.health_stub.Check(health_pb2.HealthCheckRequest(), timeout=2)
+                    healthy = self._is_healthy(response.status)
+                except grpc.RpcError as e:
+                    healthy = e.code() == grpc.StatusCode.UNIMPLEMENTED
+                self._set_health(replica, healthy)
+    
+    def close(self) -> None:
+        """Fecha os canais síncronos"""
+        for replica in self.replicas:
+            for channel in replica.channels:
+                channel.close()
+    
+    async def aclose(self) -> None:
+        """Fecha os canais grpc.aio"""
+        if self._health_task is not None:
+            self._health_task.cancel()
+        await asyncio.gather(*(
+            channel.close() for replica in self.replicas for channel in replica.channels
+        ))
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Política, disponibilidade e carga por réplica"""
+        now = time.time()
+        with self._lock:
+            return {
+                "policy": self.policy,
+                "channels_per_address": self.channels_per_address,
+                "replicas": len(self.replicas),
+                "available": sum(1 for r in self.replicas if r.available(now)),
+                "by_replica": {
+                    replica.address: {
+                        "available": replica.available(now),
+                        "outstanding": replica.outstanding,
+                        "requests": replica.requests,
+                        "failures": replica.failures,
+                        "ejections": replica.ejections
+                    }
+                    for replica in self.replicas
+                }
+            }
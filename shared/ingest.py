@@ -2,9 +2,10 @@
 Módulo de Ingestão de Documentos - Código Compartilhado
 """
 
+import hashlib
 import os
 from pathlib import Path
-from typing import List, Tuple, Dict, Any
+from typing import Callable, Iterator, List, Tuple, Dict, Any
 
 
 def read_text_file(file_path: str) -> str:
@@ -35,16 +36,8 @@ def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> List[str]
     return chunks
 
 
-def process_documents_for_ingestion(
-    file_paths: List[str] = None,
-    directory_path: str = None
-) -> Tuple[List[str], List[Dict[str, Any]]]:
-    """Processa documentos para ingestão"""
-    
-    all_texts = []
-    all_metadatas = []
-    
-    # Coletar arquivos
+def collect_files(file_paths: List[str] = None, directory_path: str = None) -> List[str]:
+    """Lista arquivos a ingerir (caminhos explícitos + .txt do diretório)"""
     files_to_process = []
     
     if file_paths:
@@ -57,12 +50,27 @@ def process_documents_for_ingestion(
                 str(f) for f in directory.glob('*.txt')
             ])
     
-    if not files_to_process:
-        print("Nenhum arquivo encontrado para ingestão.")
-        return [], []
-    
-    print(f"Processando {len(files_to_process)} arquivos...")
-    
+    return files_to_process
+
+
+def content_hash(text: str) -> str:
+    """Hash do conteúdo de um chunk"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+def source_key(file_path: str) -> str:
+    """Chave da fonte: caminho resolvido (arquivos homônimos em diretórios diferentes não colidem)"""
+    return str(Path(file_path).resolve())
+
+
+def make_document_id(source: str, text: str) -> str:
+    """ID estável derivado de (fonte, hash do conteúdo)"""
+    digest = hashlib.sha256(f"{source}\x00{content_hash(text)}".encode('utf-8'))
+    return f"doc_{digest.hexdigest()[:24]}"
+
+
+def iter_file_chunks(files_to_process: List[str]) -> Iterator[Tuple[str, List[str], List[Dict[str, Any]]]]:
+    """Gera (chave da fonte, chunks, metadados) arquivo a arquivo, sem carregar o corpus inteiro"""
     for file_path in files_to_process:
         try:
             # Ler arquivo
@@ -70,21 +78,58 @@ def process_documents_for_ingestion(
             
             # Dividir em chunks
             chunks = chunk_text(content)
-            
-            # Adicionar chunks e metadados
-            file_name = Path(file_path).name
-            for i, chunk in enumerate(chunks):
-                all_texts.append(chunk)
-                all_metadatas.append({
-                    'source': file_name,
-                    'chunk_id': i
-                })
-            
-            print(f"   {file_name}: {len(chunks)} chunks")
-        
         except Exception as e:
             print(f"   Erro em {file_path}: {e}")
-    
-    print(f"Total: {len(all_texts)} chunks de {len(files_to_process)} arquivos processados.")
-    return all_texts, all_metadatas
+            continue
+        
+        path = source_key(file_path)
+        file_name = Path(path).name
+        print(f"   {file_name}: {len(chunks)} chunks")
+        
+        metadatas = [
+            {
+                'source': file_name,
+                'path': path,
+                'chunk_id': i,
+                'directory': str(Path(path).parent),
+                'content_hash': content_hash(chunk)
+            }
+            for i, chunk in enumerate(chunks)
+        ]
+        yield path, chunks, metadatas
 
+
+def iter_incremental_batches(
+    files_to_process: List[str],
+    sync_source: Callable[[str, List[str], List[Dict[str, Any]]], List[int]],
+    batch_size: int = 64
+) -> Iterator[Tuple[List[str], List[Dict[str, Any]], List[str]]]:
+    """
+    Gera lotes (textos, metadados, ids) apenas com chunks que precisam de embedding.
+    
+    sync_source(fonte, ids, metadados) reconcilia a fonte com o banco vetorial
+    e retorna os índices dos chunks ainda ausentes.
+    """
+    texts, metadatas, ids = [], [], []
+    
+    for source, chunks, chunk_metadatas in iter_file_chunks(files_to_process):
+        # Chunks idênticos na mesma fonte geram o mesmo ID: mantém o primeiro
+        unique = {}
+        for chunk, metadata in zip(chunks, chunk_metadatas):
+            unique.setdefault(make_document_id(source, chunk), (chunk, metadata))
+        source_ids = list(unique)
+        
+        missing = sync_source(source, source_ids, [unique[doc_id][1] for doc_id in source_ids])
+        
+        for index in missing:
+            doc_id = source_ids[index]
+            chunk, metadata = unique[doc_id]
+            texts.append(chunk)
+            metadatas.append(metadata)
+            ids.append(doc_id)
+            if len(texts) >= batch_size:
+                yield texts, metadatas, ids
+                texts, metadatas, ids = [], [], []
+    
+    if texts:
+        yield texts, metadatas, ids
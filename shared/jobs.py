@@ -0,0 +1,342 @@
+"""
+Jobs de Ingestão em Segundo Plano - Código Compartilhado
+"""
+
+import asyncio
+import fcntl
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+
+class IngestJob:
+    """Progresso de uma ingestão: arquivos, chunks embedados e gravados, chunks/s"""
+    
+    def __init__(self, registry: 'JobRegistry', directory: str):
+        self.registry = registry
+        self.job_id = uuid.uuid4().hex
+        self.directory = directory
+        # Processo dono do job: jobs de processos que morreram são marcados como falhos
+        self.pid = os.getpid()
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.files_total = 0
+        self.files_done = 0
+        self.chunks_embedded = 0
+        self.chunks_written = 0
+        self.result = None
+        self.error = None
+        self._lock = threading.Lock()
+        self._saved_at = 0.0
+    
+    def start(self) -> None:
+        with self._lock:
+            self.status = "running"
+            self.started_at = time.time()
+        self.registry.save(self, force=True)
+    
+    def set_files_total(self, count: int) -> None:
+        with self._lock:
+            self.files_total = count
+        self.registry.save(self)
+    
+    def file_done(self) -> None:
+        with self._lock:
+            self.files_done += 1
+        self.registry.save(self)
+    
+    def add_embedded(self, count: int) -> None:
+        with self._lock:
+            self.chunks_embedded += count
+        self.registry.save(self)
+    
+    def add_written(self, count: int) -> None:
+        with self._lock:
+            self.chunks_written += count
+        self.registry.save(self)
+    
+    def finish(self, result: Dict[str, Any]) -> None:
+        """Conclui com o resultado da ingestão (status "error" marca o job como falho)"""
+        with self._lock:
+            self.result = result
+            if result.get("status") == "error":
+                self.status = "failed"
+                self.error = result.get("message")
+            else:
+                self.status = "succeeded"
+            self.finished_at = time.time()
+        self.registry.save(self, force=True)
+    
+    def fail(self, error: Exception) -> None:
+        with self._lock:
+            self.status = "failed"
+            self.error = str(error)
+            self.finished_at = time.time()
+        self.registry.save(self, force=True)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            elapsed = 0.0
+            if self.started_at is not None:
+                elapsed = (self.finished_at or time.time()) - self.started_at
+            return {
+                "job_id": self.job_id,
+                "status": self.status,
+                "directory": self.directory,
+                "pid": self.pid,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "elapsed_s": round(elapsed, 3),
+                "progress": {
+                    "files_total": self.files_total,
+                    "files_done": self.files_done,
+                    "chunks_embedded": self.chunks_embedded,
+                    "chunks_written": self.chunks_written,
+                    "chunks_per_second": round(self.chunks_written / elapsed, 2) if elapsed > 0 else 0
+                },
+                "result": self.result,
+                "error": self.error
+            }
+
+
+def _process_alive(pid: Optional[int]) -> bool:
+    """Processo ainda existe (outro que não este)"""
+    if not pid or pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobRegistry:
+    """Jobs de ingestão executados um por vez; estado em disco, visível a todos os workers
+    
+    A execução é serializada entre processos por um flock em run.lock no diretório
+    dos jobs: com vários workers, um job aceito por outro worker espera como queued.
+    """
+    
+    def __init__(self, name: str, jobs_dir: str = None, max_history: int = None,
+                 save_interval: float = 0.5):
+        if jobs_dir is None:
+            jobs_dir = os.getenv('INGEST_JOBS_DIR', './ingest_jobs')
+        if max_history is None:
+            max_history = int(os.getenv('INGEST_JOBS_MAX_HISTORY', '50'))
+        
+        self.directory = os.path.join(jobs_dir, name)
+        self.max_history = max_history
+        self.save_interval = save_interval
+        os.makedirs(self.directory, exist_ok=True)
+        self._run_lock_path = os.path.join(self.directory, 'run.lock')
+        self._recover()
+        
+        self._jobs: Dict[str, IngestJob] = {}
+        self._lock = threading.Lock()
+        self._queue = None
+        self._async_lock = None
+        self._tasks = set()
+    
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.json")
+    
+    def _recover(self) -> None:
+        """Jobs queued/running cujo processo morreu (reinício, crash) passam a failed"""
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, file_name)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    job = json.load(f)
+            except (FileNotFoundError, ValueError):
+                continue
+            if job.get("status") not in ("queued", "running") or _process_alive(job.get("pid")):
+                continue
+            job.update(status="failed", finished_at=time.time(),
+                       error="Processo encerrado antes do fim da ingestão")
+            self._write(path, job)
+            print(f"Job de ingestão {job.get('job_id')} interrompido; marcado como falho")
+    
+    @staticmethod
+    def _write(path: str, data: Dict[str, Any]) -> None:
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    
+    def _acquire_run_lock(self):
+        """Espera a vez entre todos os processos que compartilham o diretório (fechar libera)"""
+        lock_file = open(self._run_lock_path, 'a')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+    
+    def create(self, directory: str) -> IngestJob:
+        job = IngestJob(self, directory)
+        with self._lock:
+            self._jobs[job.job_id] = job
+        self.save(job, force=True)
+        self._prune()
+        return job
+    
+    def save(self, job: IngestJob, force: bool = False) -> None:
+        """Grava o estado do job (progresso no máximo a cada save_interval)"""
+        now = time.time()
+        if not force and now - job._saved_at < self.save_interval:
+            return
+        job._saved_at = now
+        self._write(self._path(job.job_id), job.to_dict())
+    
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Estado do job (deste processo ou, via disco, de outro worker)"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        try:
+            with open(self._path(job_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+    
+    def list(self) -> List[Dict[str, Any]]:
+        """Jobs mais recentes primeiro"""
+        jobs = []
+        for file_name in os.listdir(self.directory):
+            if file_name.endswith('.json'):
+                job = self.get(file_name[:-len('.json')])
+                if job is not None:
+                    jobs.append(job)
+        return sorted(jobs, key=lambda job: job["created_at"], reverse=True)
+    
+    def _prune(self) -> None:
+        finished = [job for job in self.list() if job["finished_at"] is not None]
+        for job in finished[self.max_history:]:
+            with self._lock:
+                self._jobs.pop(job["job_id"], None)
+            try:
+                os.remove(self._path(job["job_id"]))
+            except FileNotFoundError:
+                pass
+    
+    def run_in_thread(self, job: IngestJob, target: Callable[[IngestJob], Dict[str, Any]]) -> None:
+        """Enfileira o job numa thread de ingestão (FIFO, um por vez)"""
+        with self._lock:
+            if self._queue is None:
+                self._queue = queue.Queue()
+                threading.Thread(target=self._run_queue, daemon=True).start()
+        self._queue.put((job, target))
+    
+    def _run_queue(self) -> None:
+        while True:
+            job, target = self._queue.get()
+            lock_file = self._acquire_run_lock()
+            try:
+                job.start()
+                job.finish(target(job))
+            except Exception as e:
+                print(f"Erro no job de ingestão {job.job_id}: {e}")
+                job.fail(e)
+            finally:
+                lock_file.close()
+    
+    def run_in_loop(self, job: IngestJob, target: Callable[[IngestJob], Awaitable[Dict[str, Any]]]) -> None:
+        """Agenda o job no event loop atual (um por vez)"""
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        task = asyncio.get_running_loop().create_task(self._run_async(job, target))
+        # Referência até o fim: o loop guarda só referências fracas às tasks
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def _run_async(self, job: IngestJob, target) -> None:
+        async with self._async_lock:
+            # flock e gravações do estado em threads, sem bloquear o event loop
+            lock_file = await asyncio.to_thread(self._acquire_run_lock)
+            try:
+                await asyncio.to_thread(job.start)
+                result = await target(job)
+                await asyncio.to_thread(job.finish, result)
+            except Exception as e:
+                print(f"Erro no job de ingestão {job.job_id}: {e}")
+                await asyncio.to_thread(job.fail, e)
+            finally:
+                lock_file.close()
+
+
+class PriorityGate:
+    """Trabalho em segundo plano (ingestão) cede a vez às consultas interativas em andamento"""
+    
+    def __init__(self, priority: str = None, max_yield_ms: float = None):
+        if priority is None:
+            priority = os.getenv('INGEST_PRIORITY', 'low').lower()
+        if max_yield_ms is None:
+            max_yield_ms = float(os.getenv('INGEST_MAX_YIELD_MS', '2000'))
+        if priority not in ('low', 'normal'):
+            raise ValueError(f"INGEST_PRIORITY inválida: {priority} (use 'low' ou 'normal')")
+        
+        self.priority = priority
+        # Limite de espera por lote: tráfego contínuo não impede a ingestão de avançar
+        self.max_yield = max_yield_ms / 1000
+        
+        self._cond = threading.Condition()
+        self._active = 0
+        self.yields = 0
+        self.yielded_seconds = 0.0
+    
+    @contextmanager
+    def interactive(self) -> Iterator[None]:
+        """Marca uma consulta interativa em andamento"""
+        with self._cond:
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                if self._active == 0:
+                    self._cond.notify_all()
+    
+    def _record(self, started_at: float) -> None:
+        with self._cond:
+            self.yields += 1
+            self.yielded_seconds += time.perf_counter() - started_at
+    
+    def wait_background(self) -> None:
+        """Antes de cada lote em segundo plano: espera as consultas em andamento (até max_yield)"""
+        if self.priority != 'low' or not self._active:
+            return
+        started_at = time.perf_counter()
+        with self._cond:
+            self._cond.wait_for(lambda: self._active == 0, timeout=self.max_yield)
+        self._record(started_at)
+    
+    async def wait_background_async(self, poll_interval: float = 0.005) -> None:
+        """wait_background sem bloquear o event loop"""
+        if self.priority != 'low' or not self._active:
+            return
+        started_at = time.perf_counter()
+        deadline = started_at + self.max_yield
+        while self._active and time.perf_counter() < deadline:
+            await asyncio.sleep(poll_interval)
+        self._record(started_at)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "priority": self.priority,
+                "max_yield_ms": self.max_yield * 1000,
+                "interactive_in_flight": self._active,
+                "yields": self.yields,
+                "yielded_s": round(self.yielded_seconds, 3)
+            }
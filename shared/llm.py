@@ -3,53 +3,244 @@ Módulo LLM - Código Compartilhado
 """
 
 import requests
+import httpx
+import json
 import os
-from typing import Optional
+from requests.adapters import HTTPAdapter
+from typing import AsyncIterator, Iterator, List, Optional
 
+from shared.ollama_pool import OllamaEndpointPool
 
-class OllamaLLM:
-    """Classe para interagir com Ollama"""
+# Prefixo das respostas devolvidas quando a geração falha
+GENERATION_ERROR = "Erro ao gerar resposta"
+
+
+class _OllamaBase:
+    """Configuração comum aos clientes síncrono e assíncrono do Ollama"""
     
-    def __init__(self, base_url: str = None, model: str = None):
-        if base_url is None:
-            base_url = os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434')
+    def __init__(self, base_urls: List[str] = None, model: str = None, pool_size: int = None,
+                 connect_timeout: float = None, read_timeout: float = None, keep_alive: str = None,
+                 pool: OllamaEndpointPool = None):
         if model is None:
             model = os.getenv('OLLAMA_MODEL', 'llama3.2:3b')
+        if keep_alive is None:
+            keep_alive = os.getenv('OLLAMA_KEEP_ALIVE', '30m')
+        if pool_size is None:
+            pool_size = int(os.getenv('OLLAMA_POOL_SIZE', '16'))
+        if connect_timeout is None:
+            connect_timeout = float(os.getenv('OLLAMA_CONNECT_TIMEOUT', '5'))
+        if read_timeout is None:
+            read_timeout = float(os.getenv('OLLAMA_READ_TIMEOUT', '120'))
         
-        self.base_url = base_url.rstrip('/')
+        # Um ou mais endpoints (OLLAMA_BASE_URLS), roteados por menor carga; clientes
+        # sync e async do mesmo processo podem compartilhar o pool (mesma contagem de carga)
+        self.pool = pool or OllamaEndpointPool(base_urls)
         self.model = model
-        self.generate_url = f"{self.base_url}/api/generate"
+        self.keep_alive = keep_alive
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
         
-        print(f"Ollama endpoint: {self.base_url}")
+        print(f"Ollama endpoints: {', '.join(e.base_url for e in self.pool.endpoints)}")
         print(f"Modelo carregado: {self.model}")
     
-    def check_connection(self) -> bool:
-        """Verifica se Ollama está acessível"""
-        try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5)
-            return response.status_code == 200
-        except:
-            return False
-    
-    def generate(self, prompt: str, temperature: float = 0.7) -> str:
-        """Gera resposta"""
-        payload = {
+    def _payload(self, prompt: str, temperature: float, stream: bool) -> dict:
+        return {
             "model": self.model,
             "prompt": prompt,
-            "stream": False,
+            "stream": stream,
+            "keep_alive": self.keep_alive,
             "options": {"temperature": temperature}
         }
+    
+    def _preload_payload(self) -> dict:
+        # Sem prompt, o Ollama apenas carrega o modelo na memória
+        return {"model": self.model, "keep_alive": self.keep_alive}
+    
+    @staticmethod
+    def _parse_stream_line(line: str) -> Optional[dict]:
+        """Decodifica uma linha do stream do Ollama (um objeto JSON por linha)"""
+        if not line:
+            return None
+        chunk = json.loads(line)
+        if chunk.get('error'):
+            raise RuntimeError(chunk['error'])
+        return chunk
+
+
+class OllamaLLM(_OllamaBase):
+    """Classe para interagir com Ollama"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        
+        # Sessão com pool de conexões keep-alive (evita um handshake TCP por chamada)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.pool.endpoints), pool_maxsize=self.pool_size,
+                              pool_block=False)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.timeout = (self.connect_timeout, self.read_timeout)
+    
+    def check_connection(self) -> bool:
+        """Verifica se algum endpoint Ollama está acessível"""
+        return any(self.pool.probe(endpoint) for endpoint in self.pool.endpoints)
+    
+    def generate(self, prompt: str, temperature: float = 0.7) -> str:
+        """Gera resposta"""
+        payload = self._payload(prompt, temperature, stream=False)
         
         try:
             print("Gerando resposta com o LLM...")
-            response = requests.post(self.generate_url, json=payload, timeout=120)
-            response.raise_for_status()
-            result = response.json()
+            result = self._post_generate(payload)
             generated_text = result.get('response', '')
             print(f"Resposta gerada ({len(generated_text)} caracteres)")
             return generated_text
         except Exception as e:
-            error_msg = f"Erro ao gerar resposta: {str(e)}"
+            error_msg = f"{GENERATION_ERROR}: {str(e)}"
             print(error_msg)
             return error_msg
+    
+    def _post_generate(self, payload: dict) -> dict:
+        """POST /api/generate; falha de conexão tenta o próximo endpoint"""
+        attempts = len(self.pool.endpoints)
+        for attempt in range(attempts):
+            try:
+                with self.pool.lease() as endpoint:
+                    response = self.session.post(endpoint.generate_url, json=payload, timeout=self.timeout)
+                    response.raise_for_status()
+                    return response.json()
+            except requests.ConnectionError:
+                if attempt == attempts - 1:
+                    raise
+    
+    def generate_stream(self, prompt: str, temperature: float = 0.7) -> Iterator[str]:
+        """Gera resposta token a token (stream do Ollama)"""
+        payload = self._payload(prompt, temperature, stream=True)
+        
+        print("Gerando resposta com o LLM (streaming)...")
+        with self.pool.lease() as endpoint:
+            with self.session.post(endpoint.generate_url, json=payload, stream=True,
+                                   timeout=self.timeout) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    chunk = self._parse_stream_line(line)
+                    if chunk is None:
+                        continue
+                    token = chunk.get('response', '')
+                    if token:
+                        yield token
+                    if chunk.get('done'):
+                        break
+    
+    def preload(self) -> int:
+        """Carrega o modelo em todos os endpoints (keep_alive); retorna quantos carregaram"""
+        loaded = 0
+        for endpoint in self.pool.endpoints:
+            try:
+                response = self.session.post(endpoint.generate_url, json=self._preload_payload(),
+                                             timeout=self.timeout)
+                response.raise_for_status()
+                loaded += 1
+            except Exception as e:
+                print(f"Falha ao pré-carregar {self.model} em {endpoint.base_url}: {e}")
+        print(f"Modelo {self.model} pré-carregado em {loaded}/{len(self.pool.endpoints)} endpoints")
+        return loaded
+    
+    def close(self) -> None:
+        """Fecha as conexões do pool"""
+        self.session.close()
 
+
+class AsyncOllamaLLM(_OllamaBase):
+    """Cliente assíncrono do Ollama (httpx) para chamadas concorrentes num event loop"""
+    
+    def __init__(self, *args, keepalive_expiry: float = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if keepalive_expiry is None:
+            keepalive_expiry = float(os.getenv('OLLAMA_KEEPALIVE_EXPIRY', '60'))
+        
+        # O cliente se associa ao event loop em que for usado pela primeira vez
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.pool_size,
+                max_keepalive_connections=self.pool_size,
+                keepalive_expiry=keepalive_expiry
+            ),
+            timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+        )
+    
+    async def check_connection(self) -> bool:
+        """Verifica se algum endpoint Ollama está acessível"""
+        timeout = httpx.Timeout(5, connect=self.connect_timeout)
+        for endpoint in self.pool.endpoints:
+            try:
+                response = await self.client.get(endpoint.tags_url, timeout=timeout)
+                if response.status_code == 200:
+                    return True
+            except Exception:
+                continue
+        return False
+    
+    async def generate(self, prompt: str, temperature: float = 0.7) -> str:
+        """Gera resposta"""
+        payload = self._payload(prompt, temperature, stream=False)
+        
+        try:
+            print("Gerando resposta com o LLM (async)...")
+            result = await self._post_generate(payload)
+            generated_text = result.get('response', '')
+            print(f"Resposta gerada ({len(generated_text)} caracteres)")
+            return generated_text
+        except Exception as e:
+            error_msg = f"{GENERATION_ERROR}: {str(e)}"
+            print(error_msg)
+            return error_msg
+    
+    async def _post_generate(self, payload: dict) -> dict:
+        """POST /api/generate; falha de conexão tenta o próximo endpoint"""
+        attempts = len(self.pool.endpoints)
+        for attempt in range(attempts):
+            try:
+                with self.pool.lease() as endpoint:
+                    response = await self.client.post(endpoint.generate_url, json=payload)
+                    response.raise_for_status()
+                    return response.json()
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                if attempt == attempts - 1:
+                    raise
+    
+    async def generate_stream(self, prompt: str, temperature: float = 0.7) -> AsyncIterator[str]:
+        """Gera resposta token a token (stream do Ollama)"""
+        payload = self._payload(prompt, temperature, stream=True)
+        
+        print("Gerando resposta com o LLM (streaming async)...")
+        with self.pool.lease() as endpoint:
+            async with self.client.stream('POST', endpoint.generate_url, json=payload) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    chunk = self._parse_stream_line(line)
+                    if chunk is None:
+                        continue
+                    token = chunk.get('response', '')
+                    if token:
+                        yield token
+                    if chunk.get('done'):
+                        break
+    
+    async def preload(self) -> int:
+        """Carrega o modelo em todos os endpoints (keep_alive); retorna quantos carregaram"""
+        loaded = 0
+        for endpoint in self.pool.endpoints:
+            try:
+                response = await self.client.post(endpoint.generate_url, json=self._preload_payload())
+                response.raise_for_status()
+                loaded += 1
+            except Exception as e:
+                print(f"Falha ao pré-carregar {self.model} em {endpoint.base_url}: {e}")
+        print(f"Modelo {self.model} pré-carregado em {loaded}/{len(self.pool.endpoints)} endpoints")
+        return loaded
+    
+    async def aclose(self) -> None:
+        """Fecha as conexões do pool"""
+        await self.client.aclose()
@@ -0,0 +1,87 @@
+"""
+Módulo de Métricas - Código Compartilhado
+"""
+
+import bisect
+import threading
+from typing import Dict, List, Any
+
+# Buckets (segundos) para latências de ponta a ponta
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120]
+
+
+def flatten_metrics(data: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    """Achata dicionário aninhado em chaves pontuadas (para map<string, double>)"""
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten_metrics(value, f"{name}."))
+        elif isinstance(value, (bool, int, float)):
+            flat[name] = float(value)
+    return flat
+
+
+def unflatten_metrics(flat: Dict[str, float]) -> Dict[str, Any]:
+    """Reconstrói dicionário aninhado a partir de chaves pontuadas"""
+    data = {}
+    for name, value in flat.items():
+        node = data
+        parts = name.split(".")
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = int(value) if float(value).is_integer() else value
+    return data
+
+
+class Histogram:
+    """Histograma thread-safe com buckets fixos"""
+    
+    def __init__(self, buckets: List[float]):
+        self.buckets = sorted(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+    
+    def observe(self, value: float) -> None:
+        """Registra uma observação"""
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._count += 1
+            self._sum += value
+            self._max = max(self._max, value)
+    
+    def percentile(self, pct: float) -> float:
+        """Percentil aproximado (limite superior do bucket)"""
+        with self._lock:
+            if self._count == 0:
+                return 0.0
+            target = pct / 100 * self._count
+            cumulative = 0
+            for i, count in enumerate(self._counts):
+                cumulative += count
+                if cumulative >= target:
+                    return self.buckets[i] if i < len(self.buckets) else self._max
+            return self._max
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Resumo com contagem, média, percentis e buckets cumulativos"""
+        p50 = self.percentile(50)
+        p95 = self.percentile(95)
+        with self._lock:
+            cumulative = 0
+            buckets = {}
+            for bound, count in zip(self.buckets, self._counts):
+                cumulative += count
+                buckets[f"le_{bound:g}".replace(".", "_")] = cumulative
+            buckets["le_inf"] = self._count
+            return {
+                "count": self._count,
+                "avg": round(self._sum / self._count, 4) if self._count else 0.0,
+                "p50": p50,
+                "p95": p95,
+                "max": round(self._max, 4),
+                "buckets": buckets
+            }
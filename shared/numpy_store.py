@@ -0,0 +1,410 @@
+"""
+Backend Vetorial NumPy (busca exata) - Código Compartilhado
+"""
+
+import fcntl
+import glob
+import json
+import os
+import threading
+import uuid
+from typing import List, Dict, Any, Union
+
+import numpy as np
+
+
+class NumpyIndexError(RuntimeError):
+    """Arquivos do índice NumPy inconsistentes com o cabeçalho"""
+
+
+class NumpyBackend:
+    """Busca exata por similaridade de cosseno sobre matriz float32 contígua"""
+    
+    name = "numpy"
+    
+    def __init__(self, index_directory: str, use_mmap: bool = None, read_only: bool = False,
+                 compact_ratio: float = None):
+        if use_mmap is None:
+            use_mmap = os.getenv('NUMPY_INDEX_MMAP', 'false').lower() == 'true'
+        if compact_ratio is None:
+            compact_ratio = float(os.getenv('NUMPY_INDEX_COMPACT_RATIO', '0.3'))
+        
+        self.index_directory = index_directory
+        # Somente leitura sempre via mmap: processos leitores dividem o page cache
+        self.use_mmap = use_mmap or read_only
+        self.read_only = read_only
+        # Fração de linhas removidas/substituídas que dispara a compactação
+        self.compact_ratio = compact_ratio
+        os.makedirs(index_directory, exist_ok=True)
+        
+        self.header_path = os.path.join(index_directory, 'index.json')
+        
+        # Um único processo escritor por diretório: outro truncaria os appends em andamento
+        self._writer_lock = None
+        if not read_only:
+            self._writer_lock = open(os.path.join(index_directory, 'writer.lock'), 'w')
+            try:
+                fcntl.flock(self._writer_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self._writer_lock.close()
+                raise NumpyIndexError(
+                    f"Índice NumPy em {index_directory} já está aberto para escrita por outro processo "
+                    "(réplicas adicionais devem abrir somente leitura)"
+                )
+        
+        self._lock = threading.Lock()
+        self._load()
+        print(f"Índice NumPy pronto em {index_directory}. Documentos: {self.count()}"
+              f"{' (mmap)' if self.use_mmap else ''}{' (somente leitura)' if read_only else ''}")
+    
+    def _generation_paths(self, generation: int):
+        # Geração 0: nomes do formato anterior, sem número de geração
+        if generation == 0:
+            names = ('vectors.f32', 'records.jsonl')
+        else:
+            names = (f'vectors-{generation}.f32', f'records-{generation}.jsonl')
+        return tuple(os.path.join(self.index_directory, name) for name in names)
+    
+    def _load(self) -> None:
+        self._ids = []
+        self._texts = []
+        self._metadatas = []
+        self._positions = {}
+        # Linhas substituídas ou removidas (tombstones), ignoradas na busca
+        self._dead = set()
+        self._dim = 0
+        self._size = 0
+        self._matrix = np.empty((0, 0), dtype=np.float32)
+        self._records_end = 0
+        # Antes da leitura: uma troca durante o carregamento é vista no próximo refresh
+        self._header_signature = self._header_stat()
+        
+        if not os.path.exists(self.header_path):
+            # Identifica o índice entre resets (os nomes de arquivo da geração se repetem)
+            self._index_id = uuid.uuid4().hex
+            self._generation = 1
+            self.vectors_path, self.records_path = self._generation_paths(self._generation)
+            if not self.read_only:
+                # Sem cabeçalho nada foi confirmado: restos de uma primeira escrita interrompida
+                for path in (self.vectors_path, self.records_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+            return
+        
+        with open(self.header_path, 'r', encoding='utf-8') as f:
+            header = json.load(f)
+        self._dim = header['dim']
+        count = header['count']
+        self._generation = header.get('generation', 0)
+        self._index_id = header.get('index_id')
+        self.vectors_path, self.records_path = self._generation_paths(self._generation)
+        
+        records_end = 0
+        with open(self.records_path, 'rb') as f:
+            for line in f:
+                if len(self._ids) >= count:
+                    break
+                record = json.loads(line)
+                self._ids.append(record['id'])
+                self._texts.append(record['text'])
+                self._metadatas.append(record['metadata'])
+                records_end += len(line)
+        
+        # O cabeçalho só é gravado depois dos dados: arquivos menores indicam índice corrompido
+        vectors_bytes = count * self._dim * 4
+        if len(self._ids) != count or os.path.getsize(self.vectors_path) < vectors_bytes:
+            raise NumpyIndexError(
+                f"Índice NumPy inconsistente em {self.index_directory}: cabeçalho com {count} linhas, "
+                f"{len(self._ids)} registros e {os.path.getsize(self.vectors_path) // max(self._dim * 4, 1)} vetores"
+            )
+        
+        # Dados além do cabeçalho vêm de uma escrita interrompida e são descartados
+        # (leitores só ignoram: podem ser de uma escrita em andamento em outro processo)
+        if not self.read_only:
+            with open(self.records_path, 'r+b') as f:
+                f.truncate(records_end)
+            with open(self.vectors_path, 'r+b') as f:
+                f.truncate(vectors_bytes)
+        
+        self._size = count
+        self._records_end = records_end
+        self._dead = set(header.get('dead', []))
+        self._positions = {
+            doc_id: i for i, doc_id in enumerate(self._ids) if i not in self._dead
+        }
+        self._matrix = self._read_vectors(count)
+    
+    def _header_stat(self):
+        try:
+            stat = os.stat(self.header_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+    
+    def _refresh(self) -> None:
+        """Leitores acompanham o processo escritor quando o cabeçalho muda"""
+        if not self.read_only or self._header_stat() == self._header_signature:
+            return
+        with self._lock:
+            for _ in range(3):
+                try:
+                    self._reload()
+                    return
+                except FileNotFoundError:
+                    # Compactação trocou a geração durante a leitura: tenta de novo
+                    continue
+            self._load()
+    
+    def _reload(self) -> None:
+        signature = self._header_stat()
+        if signature == self._header_signature:
+            return
+        if signature is None:
+            self._load()
+            return
+        with open(self.header_path, 'r', encoding='utf-8') as f:
+            header = json.load(f)
+        count = header['count']
+        if (header.get('index_id') != self._index_id or header.get('generation', 0) != self._generation
+                or count < self._size):
+            self._load()
+            return
+        
+        # Mesma geração: lê só os registros novos e as tombstones do cabeçalho
+        size = self._size
+        with open(self.records_path, 'rb') as f:
+            f.seek(self._records_end)
+            for line in f:
+                if len(self._ids) >= count:
+                    break
+                record = json.loads(line)
+                self._ids.append(record['id'])
+                self._texts.append(record['text'])
+                self._metadatas.append(record['metadata'])
+                self._records_end += len(line)
+        if len(self._ids) != count or os.path.getsize(self.vectors_path) < count * header['dim'] * 4:
+            # Estado parcial descartado: recarrega do zero
+            self._load()
+            return
+        
+        dead = set(header.get('dead', []))
+        for row in dead - self._dead:
+            if row < size and self._positions.get(self._ids[row]) == row:
+                del self._positions[self._ids[row]]
+        for row in range(size, count):
+            if row not in dead:
+                self._positions[self._ids[row]] = row
+        self._dim = header['dim']
+        self._dead = dead
+        self._size = count
+        self._matrix = self._read_vectors(count)
+        self._header_signature = signature
+    
+    def _read_vectors(self, count: int) -> np.ndarray:
+        if count == 0:
+            return np.empty((0, self._dim), dtype=np.float32)
+        if self.use_mmap:
+            return np.memmap(self.vectors_path, dtype='<f4', mode='r', shape=(count, self._dim))
+        return np.fromfile(self.vectors_path, dtype='<f4', count=count * self._dim).reshape(count, self._dim)
+    
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+    
+    def _write_header(self) -> None:
+        """Confirma o estado atual: a troca atômica do cabeçalho é o único ponto de commit"""
+        tmp_path = self.header_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "dim": self._dim,
+                "count": self._size,
+                "index_id": self._index_id,
+                "generation": self._generation,
+                "dead": sorted(self._dead)
+            }, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.header_path)
+    
+    def _append_to_matrix(self, vectors: np.ndarray) -> None:
+        if self.use_mmap:
+            # Remapeia o arquivo já estendido em vez de copiar para a RAM
+            self._matrix = self._read_vectors(self._size)
+            return
+        
+        start = self._size - len(vectors)
+        if self._size > self._matrix.shape[0]:
+            capacity = max(self._size, 2 * self._matrix.shape[0], 1024)
+            grown = np.empty((capacity, self._dim), dtype=np.float32)
+            grown[:start] = self._matrix[:start]
+            self._matrix = grown
+        self._matrix[start:self._size] = vectors
+    
+    def upsert(self, ids: List[str], texts: List[str],
+               embeddings: Union[List[List[float]], np.ndarray],
+               metadatas: List[Dict[str, Any]]) -> None:
+        vectors = self._normalize(np.asarray(embeddings, dtype=np.float32))
+        if vectors.ndim != 2 or len(vectors) != len(ids):
+            raise ValueError("Embeddings e IDs com tamanhos incompatíveis")
+        
+        with self._lock:
+            if self._size > 0 and vectors.shape[1] != self._dim:
+                raise ValueError(f"Dimensão {vectors.shape[1]} difere do índice ({self._dim})")
+            # IDs existentes: nova linha no fim e tombstone na antiga (sem regravar o índice)
+            self._append(ids, texts, vectors, metadatas)
+            self._maybe_compact()
+    
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            rows = [self._positions[doc_id] for doc_id in ids]
+            self._append(
+                list(ids), [self._texts[row] for row in rows],
+                np.array(self._matrix[rows]), list(metadatas)
+            )
+            self._maybe_compact()
+    
+    def delete(self, ids: List[str]) -> None:
+        with self._lock:
+            removed = [self._positions.pop(doc_id) for doc_id in ids if doc_id in self._positions]
+            if not removed:
+                return
+            self._dead.update(removed)
+            self._write_header()
+            self._maybe_compact()
+    
+    def get_metadatas(self, field: str, value: str) -> Dict[str, Dict[str, Any]]:
+        self._refresh()
+        with self._lock:
+            return {
+                doc_id: self._metadatas[row]
+                for doc_id, row in self._positions.items()
+                if str(self._metadatas[row].get(field)) == str(value)
+            }
+    
+    def _append(self, ids: List[str], texts: List[str], vectors: np.ndarray,
+                metadatas: List[Dict[str, Any]]) -> None:
+        if self._size == 0:
+            self._dim = vectors.shape[1]
+            self._matrix = np.empty((0, self._dim), dtype=np.float32)
+        
+        # Escrita append-only: vetores, registros e por fim o cabeçalho
+        with open(self.vectors_path, 'ab') as f:
+            f.write(np.ascontiguousarray(vectors, dtype='<f4').tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self.records_path, 'a', encoding='utf-8') as f:
+            for doc_id, text, metadata in zip(ids, texts, metadatas):
+                f.write(self._encode_record(doc_id, text, metadata))
+            f.flush()
+            os.fsync(f.fileno())
+        
+        # Listas só crescem: buscas em andamento leem até o tamanho do seu snapshot
+        self._ids.extend(ids)
+        self._texts.extend(texts)
+        self._metadatas.extend(metadatas)
+        for offset, doc_id in enumerate(ids):
+            previous = self._positions.get(doc_id)
+            if previous is not None:
+                self._dead.add(previous)
+            self._positions[doc_id] = self._size + offset
+        self._size += len(ids)
+        self._append_to_matrix(vectors)
+        self._write_header()
+    
+    def _maybe_compact(self) -> None:
+        if self._dead and len(self._dead) > self.compact_ratio * self._size:
+            self._compact()
+    
+    def _compact(self) -> None:
+        """Regrava só as linhas vivas numa nova geração de arquivos"""
+        rows = sorted(self._positions.values())
+        generation = self._generation + 1
+        vectors_path, records_path = self._generation_paths(generation)
+        
+        with open(vectors_path, 'wb') as f:
+            f.write(np.ascontiguousarray(self._matrix[:self._size][rows], dtype='<f4').tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        with open(records_path, 'w', encoding='utf-8') as f:
+            for row in rows:
+                f.write(self._encode_record(self._ids[row], self._texts[row], self._metadatas[row]))
+            f.flush()
+            os.fsync(f.fileno())
+        
+        # Até a troca do cabeçalho a geração anterior continua sendo a válida
+        old_paths = (self.vectors_path, self.records_path)
+        self._generation = generation
+        self._size = len(rows)
+        self._dead = set()
+        self._write_header()
+        for path in old_paths:
+            os.remove(path)
+        print(f"Índice NumPy compactado: {len(rows)} linhas (geração {generation})")
+        self._load()
+    
+    @staticmethod
+    def _encode_record(doc_id: str, text: str, metadata: Dict[str, Any]) -> str:
+        return json.dumps(
+            {"id": doc_id, "text": text, "metadata": metadata},
+            ensure_ascii=False
+        ) + "\n"
+    
+    def query(self, query_embedding: Union[List[float], np.ndarray], n_results: int) -> Dict[str, Any]:
+        return self.query_many(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1), n_results)
+    
+    def query_many(self, query_embeddings: Union[List[List[float]], np.ndarray],
+                   n_results: int) -> Dict[str, Any]:
+        queries = self._normalize(np.asarray(query_embeddings, dtype=np.float32))
+        
+        self._refresh()
+        with self._lock:
+            size = self._size
+            matrix = self._matrix[:size]
+            ids, texts, metadatas = self._ids, self._texts, self._metadatas
+            dead = list(self._dead)
+        
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        live = size - len(dead)
+        if live == 0:
+            for key in results:
+                results[key] = [[] for _ in range(len(queries))]
+            return results
+        
+        # Uma única passada pelo índice para todas as queries: (m x d) @ (d x n)
+        scores = queries @ matrix.T
+        if dead:
+            scores[:, dead] = -np.inf
+        k = min(n_results, live)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        
+        # Distância de cosseno, como no ChromaDB (score = 1 - distância)
+        for row, row_scores in zip(top.tolist(), top_scores.tolist()):
+            results["ids"].append([ids[i] for i in row])
+            results["documents"].append([texts[i] for i in row])
+            results["metadatas"].append([metadatas[i] for i in row])
+            results["distances"].append([1 - score for score in row_scores])
+        return results
+    
+    def count(self) -> int:
+        self._refresh()
+        return len(self._positions)
+    
+    def warmup(self) -> None:
+        # Uma passada completa pela matriz (páginas do mmap entram em memória)
+        if self._size:
+            self.query(self._matrix[0], 1)
+    
+    def reset(self) -> None:
+        with self._lock:
+            # Cabeçalho primeiro: sem ele nenhum dado é considerado confirmado
+            if os.path.exists(self.header_path):
+                os.remove(self.header_path)
+            for pattern in ('vectors*.f32', 'records*.jsonl'):
+                for path in glob.glob(os.path.join(self.index_directory, pattern)):
+                    os.remove(path)
+            self._load()
@@ -0,0 +1,157 @@
+"""
+Pool de Endpoints Ollama - Código Compartilhado
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Any, Iterator
+
+import requests
+
+from shared.metrics import Histogram, LATENCY_BUCKETS
+
+
+class OllamaEndpoint:
+    """Estado de roteamento de uma instância Ollama"""
+    
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip('/')
+        self.generate_url = f"{self.base_url}/api/generate"
+        self.tags_url = f"{self.base_url}/api/tags"
+        self.outstanding = 0
+        self.healthy = True
+        self.ejected_until = 0.0
+        self.consecutive_failures = 0
+        self.requests = 0
+        self.failures = 0
+        self.ejections = 0
+        self.latency_histogram = Histogram(LATENCY_BUCKETS)
+    
+    def available(self, now: float) -> bool:
+        return self.healthy and now >= self.ejected_until
+
+
+class OllamaEndpointPool:
+    """Roteia gerações para o endpoint com menos requisições em andamento"""
+    
+    def __init__(self, base_urls: List[str] = None, eject_failures: int = None,
+                 eject_seconds: float = None, health_interval: float = None):
+        if base_urls is None:
+            urls = os.getenv('OLLAMA_BASE_URLS') or os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434')
+            base_urls = [url.strip() for url in urls.split(',') if url.strip()]
+        if eject_failures is None:
+            eject_failures = int(os.getenv('OLLAMA_EJECT_FAILURES', '3'))
+        if eject_seconds is None:
+            eject_seconds = float(os.getenv('OLLAMA_EJECT_SECONDS', '30'))
+        if health_interval is None:
+            health_interval = float(os.getenv('OLLAMA_HEALTH_INTERVAL', '10'))
+        
+        self.endpoints = [OllamaEndpoint(url) for url in base_urls]
+        self.eject_failures = eject_failures
+        self.eject_seconds = eject_seconds
+        self.health_interval = health_interval
+        
+        self._lock = threading.Lock()
+        self._next = 0
+        self._probe_session = requests.Session()
+        
+        if health_interval > 0 and len(self.endpoints) > 1:
+            threading.Thread(target=self._health_loop, daemon=True).start()
+    
+    def acquire(self) -> OllamaEndpoint:
+        """Escolhe o endpoint disponível com menos requisições em andamento"""
+        with self._lock:
+            now = time.time()
+            candidates = [e for e in self.endpoints if e.available(now)]
+            if not candidates:
+                # Todos fora: tenta o que volta primeiro em vez de falhar direto
+                candidates = [min(self.endpoints, key=lambda e: e.ejected_until)]
+            
+            # Empates se revezam a partir de um índice rotativo
+            start = self._next
+            self._next = (self._next + 1) % len(self.endpoints)
+            order = {id(e): (i - start) % len(self.endpoints) for i, e in enumerate(self.endpoints)}
+            endpoint = min(candidates, key=lambda e: (e.outstanding, order[id(e)]))
+            
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            return endpoint
+    
+    def release(self, endpoint: OllamaEndpoint, elapsed: float, success: bool) -> None:
+        """Libera o endpoint e registra latência ou falha"""
+        with self._lock:
+            endpoint.outstanding -= 1
+            if success:
+                endpoint.consecutive_failures = 0
+                endpoint.latency_histogram.observe(elapsed)
+                return
+            
+            endpoint.failures += 1
+            endpoint.consecutive_failures += 1
+            if endpoint.consecutive_failures >= self.eject_failures:
+                self._eject(endpoint)
+    
+    @contextmanager
+    def lease(self) -> Iterator[OllamaEndpoint]:
+        """Reserva um endpoint durante uma chamada; exceções contam como falha"""
+        endpoint = self.acquire()
+        started_at = time.perf_counter()
+        try:
+            yield endpoint
+        except Exception:
+            self.release(endpoint, time.perf_counter() - started_at, success=False)
+            raise
+        except BaseException:
+            # Gerador fechado pelo consumidor: não é falha do endpoint
+            self.release(endpoint, time.perf_counter() - started_at, success=True)
+            raise
+        self.release(endpoint, time.perf_counter() - started_at, success=True)
+    
+    def _eject(self, endpoint: OllamaEndpoint) -> None:
+        if time.time() >= endpoint.ejected_until:
+            endpoint.ejections += 1
+            print(f"Ollama {endpoint.base_url} removido do pool por {self.eject_seconds:.0f}s")
+        endpoint.ejected_until = time.time() + self.eject_seconds
+        endpoint.consecutive_failures = 0
+    
+    def probe(self, endpoint: OllamaEndpoint, timeout: float = 5) -> bool:
+        """Consulta /api/tags do endpoint"""
+        try:
+            response = self._probe_session.get(endpoint.tags_url, timeout=timeout)
+            return response.status_code == 200
+        except Exception:
+            return False
+    
+    def _health_loop(self) -> None:
+        while True:
+            time.sleep(self.health_interval)
+            for endpoint in self.endpoints:
+                healthy = self.probe(endpoint)
+                with self._lock:
+                    if healthy != endpoint.healthy:
+                        state = "de volta ao" if healthy else "fora do"
+                        print(f"Ollama {endpoint.base_url} {state} pool (health check)")
+                    endpoint.healthy = healthy
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Estado, carga e latência por endpoint"""
+        now = time.time()
+        with self._lock:
+            return {
+                "endpoints": len(self.endpoints),
+                "available": sum(1 for e in self.endpoints if e.available(now)),
+                "by_endpoint": {
+                    str(i): {
+                        "url": endpoint.base_url,
+                        "available": endpoint.available(now),
+                        "outstanding": endpoint.outstanding,
+                        "requests": endpoint.requests,
+                        "failures": endpoint.failures,
+                        "ejections": endpoint.ejections,
+                        "latency_s": endpoint.latency_histogram.get_stats()
+                    }
+                    for i, endpoint in enumerate(self.endpoints)
+                }
+            }
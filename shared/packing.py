@@ -0,0 +1,28 @@
+"""
+Empacotamento binário de embeddings - Código Compartilhado
+"""
+
+from typing import Tuple
+
+import numpy as np
+
+# float32 little-endian, independente da arquitetura
+FLOAT32_LE = np.dtype('<f4')
+
+
+def pack_matrix(matrix) -> Tuple[bytes, int, int]:
+    """Converte matriz (rows x dim) em bytes float32 contíguos"""
+    array = np.ascontiguousarray(matrix, dtype=FLOAT32_LE)
+    if array.ndim == 1:
+        array = array.reshape(1, -1)
+    rows, dim = array.shape
+    return array.tobytes(), rows, dim
+
+
+def unpack_matrix(data: bytes, rows: int, dim: int) -> np.ndarray:
+    """Reconstrói a matriz sem cópia (view somente leitura sobre os bytes)"""
+    if len(data) != rows * dim * FLOAT32_LE.itemsize:
+        raise ValueError(
+            f"Matriz empacotada inválida: {len(data)} bytes para {rows}x{dim} float32"
+        )
+    return np.frombuffer(data, dtype=FLOAT32_LE).reshape(rows, dim)
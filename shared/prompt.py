@@ -0,0 +1,34 @@
+"""
+Montagem de Prompt e Fontes - Código Compartilhado
+"""
+
+from typing import List, Dict, Any
+
+
+def build_prompt(query: str, context: str) -> str:
+    """Prompt do assistente de onboarding"""
+    return f"""Você é um assistente de onboarding corporativo.
+
+CONTEXTO:
+{context}
+
+PERGUNTA: {query}
+
+INSTRUÇÕES:
+- Use APENAS as informações do contexto
+- Seja claro e objetivo
+- Cite as fontes
+
+RESPOSTA:"""
+
+
+def format_sources(documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Resumo das fontes usadas na resposta"""
+    sources = []
+    for doc in documents:
+        sources.append({
+            'source': doc['metadata'].get('source', 'Desconhecido'),
+            'score': round(doc['score'], 4),
+            'excerpt': doc['text'][:150] + "..."
+        })
+    return sources
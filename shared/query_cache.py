@@ -0,0 +1,79 @@
+"""
+Cache LRU/TTL para Embeddings de Queries - Código Compartilhado
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+_QUERY_PREFIX = re.compile(r'^\s*query:\s*', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_query(query: str) -> str:
+    """Normaliza query (prefixo e5 'query:', espaços e caixa)"""
+    query = _QUERY_PREFIX.sub('', query)
+    return _WHITESPACE.sub(' ', query).strip().lower()
+
+
+class LRUCache:
+    """Cache LRU limitado com expiração por TTL"""
+    
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Retorna valor ou None (miss ou expirado)"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            
+            value, stored_at = entry
+            if self.ttl_seconds > 0 and time.monotonic() - stored_at > self.ttl_seconds:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def put(self, key: Hashable, value: Any) -> None:
+        """Armazena valor, removendo o menos usado se cheio"""
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self) -> None:
+        """Esvazia o cache"""
+        with self._lock:
+            self._data.clear()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna tamanho e taxa de acerto"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+                "expirations": self.expirations,
+                "evictions": self.evictions
+            }
@@ -0,0 +1,197 @@
+"""
+Cache Semântico de Respostas - Código Compartilhado
+"""
+
+import base64
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Union
+
+import numpy as np
+
+
+class SemanticCache:
+    """Reaproveita respostas de perguntas similares sobre os mesmos chunks"""
+    
+    def __init__(self, name: str, cache_dir: str = None, max_entries: int = None,
+                 threshold: float = None, save_interval: float = None):
+        if cache_dir is None:
+            cache_dir = os.getenv('SEMANTIC_CACHE_DIR', './semantic_cache')
+        if max_entries is None:
+            max_entries = int(os.getenv('SEMANTIC_CACHE_MAX_ENTRIES', '1000'))
+        if threshold is None:
+            threshold = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.95'))
+        if save_interval is None:
+            save_interval = float(os.getenv('SEMANTIC_CACHE_SAVE_INTERVAL', '30'))
+        
+        self.path = os.path.join(cache_dir, f"{name}.json")
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.save_interval = save_interval
+        os.makedirs(cache_dir, exist_ok=True)
+        
+        # _lock protege o estado em memória (lookup/put); _save_lock serializa a escrita
+        # em disco, feita fora de _lock. Ordem: _save_lock antes de _lock.
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        # Matriz pré-alocada (max_entries x dim): a linha i guarda a query de _entries[i]
+        self._embeddings = None
+        self._entries = []
+        # Linhas da menos para a mais usada; a remoção reaproveita a primeira
+        self._recency = OrderedDict()
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.saves = 0
+        self._load()
+        
+        self._stop = threading.Event()
+        if save_interval > 0:
+            threading.Thread(target=self._save_loop, daemon=True).start()
+        print(f"Cache semântico em {self.path} ({len(self._entries)} respostas)")
+    
+    @staticmethod
+    def _normalize(vector: Union[List[float], np.ndarray]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+    
+    def lookup(self, query_embedding: Union[List[float], np.ndarray],
+               chunk_ids: List[str]) -> Optional[Dict[str, Any]]:
+        """Resposta de pergunta similar (>= threshold) que recuperou os mesmos chunks"""
+        query = self._normalize(query_embedding)
+        key = sorted(chunk_ids)
+        
+        with self._lock:
+            if self._entries and self._embeddings.shape[1] == len(query):
+                scores = self._embeddings[:len(self._entries)] @ query
+                candidates = np.flatnonzero(scores >= self.threshold)
+                # IDs são hashes de conteúdo: mesmo conjunto = chunks inalterados
+                for index in candidates[np.argsort(-scores[candidates])]:
+                    entry = self._entries[index]
+                    if entry['chunk_ids'] == key:
+                        entry['last_access'] = time.time()
+                        self._recency.move_to_end(int(index))
+                        self.hits += 1
+                        return {"answer": entry['answer'], "similarity": float(scores[index])}
+            self.misses += 1
+            return None
+    
+    def put(self, query_embedding: Union[List[float], np.ndarray],
+            chunk_ids: List[str], answer: str) -> None:
+        """Guarda resposta gerada (persistida periodicamente e em close())"""
+        query = self._normalize(query_embedding)
+        entry = {
+            "chunk_ids": sorted(chunk_ids),
+            "answer": answer,
+            "last_access": time.time()
+        }
+        
+        with self._lock:
+            if self._embeddings is None or self._embeddings.shape[1] != len(query):
+                # Primeira resposta ou modelo de embeddings trocado: entradas antigas não são comparáveis
+                self._allocate(len(query))
+            
+            if len(self._entries) < self.max_entries:
+                row = len(self._entries)
+                self._entries.append(entry)
+            else:
+                row, _ = self._recency.popitem(last=False)
+                self._entries[row] = entry
+                self.evictions += 1
+            self._embeddings[row] = query
+            self._recency[row] = None
+            self._dirty = True
+    
+    def clear(self) -> None:
+        """Invalida todas as respostas (ingestão ou reset da base)"""
+        # Espera uma escrita em andamento para não ressuscitar o arquivo antigo
+        with self._save_lock:
+            with self._lock:
+                if self._entries:
+                    self.invalidations += 1
+                self._embeddings = None
+                self._entries = []
+                self._recency.clear()
+                self._dirty = False
+            if os.path.exists(self.path):
+                os.remove(self.path)
+    
+    def flush(self) -> None:
+        """Persiste o cache se mudou desde a última escrita (cópia sob o lock, escrita fora dele)"""
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                embeddings = self._embeddings[:len(self._entries)].copy()
+                entries = [dict(entry) for entry in self._entries]
+                self._dirty = False
+            try:
+                self._save(entries, embeddings)
+            except Exception as e:
+                with self._lock:
+                    self._dirty = True
+                print(f"Falha ao persistir o cache semântico: {e}")
+    
+    def close(self) -> None:
+        """Para a persistência periódica e grava o estado final"""
+        self._stop.set()
+        self.flush()
+    
+    def _save_loop(self) -> None:
+        while not self._stop.wait(self.save_interval):
+            self.flush()
+    
+    def _allocate(self, dim: int) -> None:
+        self._embeddings = np.zeros((self.max_entries, dim), dtype=np.float32)
+        self._entries = []
+        self._recency.clear()
+    
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            # Mais usadas por último; acima de max_entries ficam as mais recentes
+            entries = sorted(data['entries'], key=lambda entry: entry['last_access'])[-self.max_entries:]
+            vectors = [np.frombuffer(base64.b64decode(entry.pop('embedding')), dtype='<f4') for entry in entries]
+            if vectors:
+                self._allocate(len(vectors[0]))
+                self._embeddings[:len(vectors)] = np.stack(vectors)
+                self._entries = entries
+                self._recency.update((row, None) for row in range(len(entries)))
+        except Exception as e:
+            self._embeddings = None
+            self._entries = []
+            self._recency.clear()
+            print(f"Cache semântico ignorado ({e})")
+    
+    def _save(self, entries: List[Dict[str, Any]], embeddings: np.ndarray) -> None:
+        data = [
+            {**entry, "embedding": base64.b64encode(vector.astype('<f4').tobytes()).decode('ascii')}
+            for entry, vector in zip(entries, embeddings)
+        ]
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"entries": data}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self.saves += 1
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna contadores de hit/miss e ocupação"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "entries": len(self._entries),
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "saves": self.saves,
+            "threshold": self.threshold
+        }
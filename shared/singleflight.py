@@ -0,0 +1,96 @@
+"""
+Coalescência de Requisições (single-flight) - Código Compartilhado
+"""
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class _Call:
+    """Execução em andamento compartilhada pelos chamadores da mesma chave"""
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Executa uma única vez chamadas concorrentes com a mesma chave"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executions = 0
+        self.coalesced = 0
+    
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Executa fn ou aguarda a execução em andamento; retorna (resultado, coalescido)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.executions += 1
+            else:
+                self.coalesced += 1
+        
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            # Chamadas seguintes com a mesma chave voltam a executar
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna execuções, chamadas coalescidas e chaves em andamento"""
+        with self._lock:
+            in_flight = len(self._calls)
+        total = self.executions + self.coalesced
+        return {
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "coalesced_ratio": round(self.coalesced / total, 4) if total else 0.0,
+            "in_flight": in_flight
+        }
+
+
+class AsyncSingleFlight(SingleFlight):
+    """Versão asyncio: chamadores concorrentes aguardam a mesma task"""
+    
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Executa fn() ou aguarda a task em andamento; retorna (resultado, coalescido)"""
+        with self._lock:
+            task = self._calls.get(key)
+            leader = task is None
+            if leader:
+                task = asyncio.ensure_future(fn())
+                self._calls[key] = task
+                self.executions += 1
+            else:
+                self.coalesced += 1
+        
+        if leader:
+            # Chamadas seguintes com a mesma chave voltam a executar
+            task.add_done_callback(lambda _: self._forget(key, task))
+        
+        # shield: cancelar um chamador (cliente desconectado) não cancela os demais
+        return await asyncio.shield(task), not leader
+    
+    def _forget(self, key: Hashable, task: asyncio.Future) -> None:
+        with self._lock:
+            if self._calls.get(key) is task:
+                del self._calls[key]
@@ -0,0 +1,12 @@
+"""
+Formatação de Server-Sent Events - Código Compartilhado
+"""
+
+import json
+from typing import Any, Dict
+
+
+def format_sse(event: Dict[str, Any]) -> str:
+    """Serializa {'event': nome, 'data': {...}} no formato text/event-stream"""
+    data = json.dumps(event.get("data", {}), ensure_ascii=False)
+    return f"event: {event['event']}\ndata: {data}\n\n"
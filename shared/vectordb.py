@@ -3,65 +3,232 @@ Módulo de Vector Database - Código Compartilhado
 """
 
 import chromadb
-from typing import List, Dict, Any
+import numpy as np
+from typing import List, Dict, Any, Union
 import os
+import time
+from urllib.parse import urlparse
 
+from shared.ingest import make_document_id
 
-class VectorDB:
-    """Classe para gerenciar ChromaDB"""
+
+class ReadOnlyIndexError(RuntimeError):
+    """Escrita num índice aberto somente para leitura (workers do monolito)"""
+
+
+def _as_strings(metadata: Dict[str, Any]) -> Dict[str, str]:
+    # Metadados chegam como string via gRPC e com tipos nativos no monolito
+    return {str(k): str(v) for k, v in metadata.items()}
+
+
+class ChromaBackend:
+    """Backend ChromaDB (SQLite + HNSW)"""
     
-    def __init__(self, persist_directory: str = None):
-        if persist_directory is None:
-            persist_directory = os.getenv('CHROMA_PERSIST_DIR', './chroma_store')
-        
-        self.persist_directory = persist_directory
-        os.makedirs(persist_directory, exist_ok=True)
-        
-        print(f"Inicializando ChromaDB em {persist_directory}")
-        self.client = chromadb.PersistentClient(path=persist_directory)
+    name = "chroma"
+    
+    def __init__(self, persist_directory: str, server_url: str = None):
+        # Servidor Chroma: armazenamento que vários processos podem escrever com segurança
+        self.shared = bool(server_url)
+        if server_url:
+            url = urlparse(server_url)
+            print(f"Conectando ao servidor ChromaDB em {server_url}")
+            self.client = chromadb.HttpClient(
+                host=url.hostname, port=url.port or 8000, ssl=url.scheme == 'https'
+            )
+        else:
+            print(f"Inicializando ChromaDB em {persist_directory}")
+            self.client = chromadb.PersistentClient(path=persist_directory)
         self.collection = self.client.get_or_create_collection(
             name="onboarding_docs",
             metadata={"hnsw:space": "cosine"}
         )
         print(f"ChromaDB pronto. Documentos: {self.collection.count()}")
     
-    def add_documents(self, texts: List[str], embeddings: List[List[float]], 
-                     metadatas: List[Dict[str, Any]] = None) -> None:
-        """Adiciona documentos"""
-        import time
-        timestamp = int(time.time() * 1000)
-        ids = [f"doc_{timestamp}_{i}" for i in range(len(texts))]
-        
-        if metadatas is None:
-            metadatas = [{}] * len(texts)
-        
-        print(f"Adicionando {len(texts)} documentos ao ChromaDB...")
-        self.collection.add(
+    def upsert(self, ids: List[str], texts: List[str],
+               embeddings: Union[List[List[float]], np.ndarray],
+               metadatas: List[Dict[str, Any]]) -> None:
+        if isinstance(embeddings, np.ndarray):
+            # ChromaDB só aceita listas
+            embeddings = embeddings.tolist()
+        self.collection.upsert(
             documents=texts,
             embeddings=embeddings,
             metadatas=metadatas,
             ids=ids
         )
-        print("Documentos adicionados com sucesso.")
     
-    def query(self, query_embedding: List[float], n_results: int = 5) -> Dict[str, Any]:
-        """Busca vetorial"""
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        self.collection.update(ids=ids, metadatas=metadatas)
+    
+    def delete(self, ids: List[str]) -> None:
+        self.collection.delete(ids=ids)
+    
+    def get_metadatas(self, field: str, value: str) -> Dict[str, Dict[str, Any]]:
+        result = self.collection.get(where={field: value}, include=["metadatas"])
+        return dict(zip(result['ids'], result['metadatas']))
+    
+    def query(self, query_embedding: Union[List[float], np.ndarray], n_results: int) -> Dict[str, Any]:
+        if isinstance(query_embedding, np.ndarray):
+            query_embedding = query_embedding.tolist()
         return self.collection.query(
             query_embeddings=[query_embedding],
             n_results=n_results
         )
     
-    def get_document_count(self) -> int:
-        """Retorna número de documentos"""
+    def query_many(self, query_embeddings: Union[List[List[float]], np.ndarray],
+                   n_results: int) -> Dict[str, Any]:
+        if isinstance(query_embeddings, np.ndarray):
+            query_embeddings = query_embeddings.tolist()
+        return self.collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n_results
+        )
+    
+    def count(self) -> int:
         return self.collection.count()
     
-    def reset_collection(self) -> None:
-        """Reseta coleção"""
-        print("Resetando coleção do ChromaDB...")
+    def warmup(self) -> None:
+        # O índice HNSW só é carregado na primeira busca
+        sample = self.collection.get(limit=1, include=["embeddings"])
+        if sample['embeddings']:
+            self.collection.query(query_embeddings=[list(sample['embeddings'][0])], n_results=1)
+    
+    def reset(self) -> None:
         self.client.delete_collection(name="onboarding_docs")
         self.collection = self.client.get_or_create_collection(
             name="onboarding_docs",
             metadata={"hnsw:space": "cosine"}
         )
-        print("Coleção resetada.")
 
+
+class VectorDB:
+    """Classe para gerenciar o banco vetorial (ChromaDB ou NumPy)"""
+    
+    def __init__(self, persist_directory: str = None, backend: str = None,
+                 read_only: bool = False, chroma_server_url: str = None):
+        if persist_directory is None:
+            persist_directory = os.getenv('CHROMA_PERSIST_DIR', './chroma_store')
+        if backend is None:
+            backend = os.getenv('VECTOR_BACKEND', 'chroma')
+        if chroma_server_url is None:
+            chroma_server_url = os.getenv('CHROMA_SERVER_URL', '')
+        
+        self.persist_directory = persist_directory
+        os.makedirs(persist_directory, exist_ok=True)
+        
+        backend = backend.lower()
+        if backend == 'chroma':
+            self.backend = ChromaBackend(persist_directory, chroma_server_url)
+        elif backend == 'numpy':
+            from shared.numpy_store import NumpyBackend
+            self.backend = NumpyBackend(os.path.join(persist_directory, 'numpy_index'), read_only=read_only)
+        else:
+            raise ValueError(f"VECTOR_BACKEND inválido: {backend} (use 'chroma' ou 'numpy')")
+        
+        # Armazenamento compartilhado (servidor Chroma) aceita escrita de qualquer processo
+        self.read_only = read_only and not getattr(self.backend, 'shared', False)
+        if self.read_only:
+            print("Banco vetorial aberto somente para leitura")
+    
+    def check_writable(self) -> None:
+        """Falha com ReadOnlyIndexError se este processo não pode escrever no índice"""
+        if self.read_only:
+            raise ReadOnlyIndexError(
+                "Índice somente leitura neste processo (worker do monolito ou réplica --read-only): "
+                "escreva por um único processo ou use um servidor Chroma (CHROMA_SERVER_URL)"
+            )
+    
+    def add_documents(self, texts: List[str], embeddings: Union[List[List[float]], np.ndarray], 
+                     metadatas: List[Dict[str, Any]] = None, ids: List[str] = None) -> None:
+        """Adiciona documentos (upsert por ID estável)"""
+        self.check_writable()
+        if metadatas is None:
+            metadatas = [{}] * len(texts)
+        if ids is None:
+            ids = [
+                make_document_id(str(meta.get('path', meta.get('source', ''))), text)
+                for text, meta in zip(texts, metadatas)
+            ]
+        
+        print(f"Adicionando {len(texts)} documentos ({self.backend.name})...")
+        self.backend.upsert(ids, texts, embeddings, metadatas)
+        print("Documentos adicionados com sucesso.")
+    
+    def sync_source(self, source: str, ids: List[str],
+                    metadatas: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Reconcilia uma fonte (caminho resolvido, ver source_key) com o banco: remove
+        chunks que deixaram de existir, atualiza metadados de chunks inalterados e
+        retorna os índices dos ausentes.
+        """
+        self.check_writable()
+        existing = self.backend.get_metadatas('path', source)
+        
+        missing, to_update, unchanged = [], [], 0
+        for index, (doc_id, metadata) in enumerate(zip(ids, metadatas)):
+            if doc_id not in existing:
+                missing.append(index)
+            elif _as_strings(existing[doc_id]) != _as_strings(metadata):
+                to_update.append(index)
+            else:
+                unchanged += 1
+        
+        new_ids = set(ids)
+        to_delete = [doc_id for doc_id in existing if doc_id not in new_ids]
+        
+        if to_delete:
+            self.backend.delete(to_delete)
+        if to_update:
+            self.backend.update_metadatas(
+                [ids[i] for i in to_update], [metadatas[i] for i in to_update]
+            )
+        
+        return {
+            "missing": missing,
+            "updated": len(to_update),
+            "unchanged": unchanged,
+            "deleted": len(to_delete)
+        }
+    
+    def prune_sources(self, directory: str, keep_sources: List[str]) -> int:
+        """Remove chunks de fontes do diretório que não existem mais (keep_sources: caminhos resolvidos)"""
+        self.check_writable()
+        existing = self.backend.get_metadatas('directory', directory)
+        keep = set(keep_sources)
+        # Chunks sem 'path' (indexados só pelo nome do arquivo) também saem e são re-ingeridos
+        to_delete = [
+            doc_id for doc_id, metadata in existing.items()
+            if metadata.get('path') not in keep
+        ]
+        if to_delete:
+            print(f"Removendo {len(to_delete)} chunks de fontes excluídas...")
+            self.backend.delete(to_delete)
+        return len(to_delete)
+    
+    def query(self, query_embedding: Union[List[float], np.ndarray], n_results: int = 5) -> Dict[str, Any]:
+        """Busca vetorial"""
+        return self.backend.query(query_embedding, n_results)
+    
+    def query_many(self, query_embeddings: Union[List[List[float]], np.ndarray],
+                   n_results: int = 5) -> Dict[str, Any]:
+        """Busca vetorial em lote: N queries, N listas de resultados"""
+        return self.backend.query_many(query_embeddings, n_results)
+    
+    def get_document_count(self) -> int:
+        """Retorna número de documentos"""
+        return self.backend.count()
+    
+    def warmup(self) -> float:
+        """Abre a coleção e carrega o índice com uma busca descartável; retorna a duração"""
+        started_at = time.perf_counter()
+        self.backend.warmup()
+        elapsed = time.perf_counter() - started_at
+        print(f"Banco vetorial aquecido em {elapsed:.2f}s ({self.backend.count()} documentos)")
+        return elapsed
+    
+    def reset_collection(self) -> None:
+        """Reseta coleção"""
+        self.check_writable()
+        print(f"Resetando coleção ({self.backend.name})...")
+        self.backend.reset()
+        print("Coleção resetada.")
@@ -0,0 +1,131 @@
+"""
+Processos Worker e Supervisor - Código Compartilhado
+"""
+
+import multiprocessing
+import os
+import signal
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+def available_cpus() -> List[int]:
+    """CPUs que este processo pode usar"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def worker_cpus(index: int, workers: int) -> List[int]:
+    """Fatia de CPUs do worker (workers além do número de CPUs compartilham)"""
+    cpus = available_cpus()
+    if workers >= len(cpus):
+        return [cpus[index % len(cpus)]]
+    size = len(cpus) // workers
+    return cpus[index * size:(index + 1) * size]
+
+
+def pin_worker(index: int, workers: int, torch_threads: Optional[int] = 0, affinity: bool = True) -> Dict[str, Any]:
+    """Afinidade de CPU e threads intra-op do torch do worker (None mantém o padrão do torch)"""
+    cpus = worker_cpus(index, workers)
+    if affinity and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+    else:
+        cpus = available_cpus()
+    
+    import torch
+    if torch_threads is None:
+        threads = torch.get_num_threads()
+    else:
+        # 0: uma thread por CPU do worker (não disputa com os outros)
+        threads = torch_threads or len(cpus)
+        torch.set_num_threads(threads)
+    return {"worker": index, "pid": os.getpid(), "cpus": cpus, "torch_threads": threads}
+
+
+class WorkerSupervisor:
+    """Inicia N processos (spawn ou fork) e reinicia os que morrerem"""
+    
+    def __init__(self, name: str, target: Callable[..., None], workers: int,
+                 args: tuple = (), start_method: str = 'spawn',
+                 on_exit: Callable[[int], None] = None,
+                 restart_backoff: float = None, max_backoff: float = 30.0):
+        if restart_backoff is None:
+            restart_backoff = float(os.getenv('WORKER_RESTART_BACKOFF_SECONDS', '1'))
+        
+        self.name = name
+        self.target = target
+        self.workers = workers
+        self.args = args
+        self.on_exit = on_exit
+        self.restart_backoff = restart_backoff
+        self.max_backoff = max_backoff
+        
+        # spawn: worker começa sem o estado do supervisor (threads do gRPC/torch);
+        # fork: herda o que o supervisor já carregou (ex.: pesos do modelo, copy-on-write)
+        self._context = multiprocessing.get_context(start_method)
+        self._processes: List[Optional[multiprocessing.Process]] = [None] * workers
+        self._failures = [0] * workers
+        self._started_at = [0.0] * workers
+        self._restart_at = [0.0] * workers
+        self.restarts = 0
+        self._stopping = False
+    
+    def _start(self, index: int) -> None:
+        process = self._context.Process(
+            target=self.target,
+            args=(index, self.workers) + self.args,
+            name=f"{self.name}-worker-{index}",
+            daemon=False
+        )
+        process.start()
+        self._processes[index] = process
+        self._started_at[index] = time.time()
+        print(f"{self.name}: worker {index} iniciado (pid {process.pid})")
+    
+    def _check(self, index: int) -> None:
+        process = self._processes[index]
+        now = time.time()
+        if process is not None:
+            if process.is_alive():
+                return
+            # Morreu: agenda o restart com backoff exponencial se continuar caindo
+            uptime = now - self._started_at[index]
+            self._failures[index] = 0 if uptime > self.max_backoff else self._failures[index] + 1
+            delay = min(self.max_backoff, self.restart_backoff * 2 ** self._failures[index])
+            print(f"{self.name}: worker {index} (pid {process.pid}) saiu com código "
+                  f"{process.exitcode}; reiniciando em {delay:.0f}s")
+            self._processes[index] = None
+            self._restart_at[index] = now + delay
+            if self.on_exit is not None:
+                self.on_exit(index)
+            return
+        
+        if now >= self._restart_at[index]:
+            self.restarts += 1
+            self._start(index)
+    
+    def _stop(self, *_) -> None:
+        self._stopping = True
+    
+    def run(self) -> None:
+        """Bloqueia supervisionando os workers até SIGTERM ou Ctrl+C"""
+        signal.signal(signal.SIGTERM, self._stop)
+        for index in range(self.workers):
+            self._start(index)
+        
+        try:
+            while not self._stopping:
+                time.sleep(0.5)
+                for index in range(self.workers):
+                    self._check(index)
+        except KeyboardInterrupt:
+            pass
+        
+        print(f"\n{self.name}: parando {self.workers} workers...")
+        for process in self._processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self._processes:
+            if process is not None:
+                process.join(timeout=10)
@@ -50,6 +50,8 @@ if 'net_io_snapshot' not in st.session_state:
     st.session_state.net_io_snapshot = psutil.net_io_counters()
 if 'load_test_results' not in st.session_state:
     st.session_state.load_test_results = []
+if 'transport_results' not in st.session_state:
+    st.session_state.transport_results = []
 
 # CSS
 st.markdown("""
@@ -311,11 +313,13 @@ def run_load_test(base_url: str, arch_label: str, total_requests: int, concurren
 
 
 def check_api(url, name):
-    """Verifica se API está online e retorna mensagem de erro detalhada"""
+    """Verifica se API está pronta (aquecida) e retorna mensagem de erro detalhada"""
     try:
-        response = requests.get(f"{url}/health", timeout=5)
+        response = requests.get(f"{url}/ready", timeout=5)
         if response.status_code == 200:
             return True, None
+        if response.status_code == 503:
+            return False, f"{name}: aquecendo - {response.json().get('detail')}"
         return False, f"{name}: status {response.status_code} - {response.text}"
     except Exception as e:
         return False, f"{name}: {e}"
@@ -344,6 +348,37 @@ def query_api(url, query_text, top_k=5, arch_label="monolithic"):
         return None, elapsed, str(e)
 
 
+def run_ingest_job(url, directory_path, timeout=1800):
+    """Agenda a ingestão e acompanha o job até o fim com barra de progresso"""
+    response = requests.post(f"{url}/ingest", json={"directory_path": directory_path}, timeout=30)
+    if response.status_code != 202:
+        return None, response.text
+    job = response.json()
+    
+    progress_bar = st.progress(0.0, text="Na fila...")
+    deadline = time.time() + timeout
+    while job["status"] in ("queued", "running"):
+        if time.time() > deadline:
+            return None, f"Job {job['job_id']} ainda em andamento após {timeout}s"
+        time.sleep(0.5)
+        response = requests.get(f"{url}/ingest/{job['job_id']}", timeout=10)
+        if response.status_code != 200:
+            return None, response.text
+        job = response.json()
+        
+        progress = job["progress"]
+        fraction = progress["files_done"] / progress["files_total"] if progress["files_total"] else 0.0
+        progress_bar.progress(min(fraction, 1.0), text=(
+            f"{progress['files_done']}/{progress['files_total']} arquivos, "
+            f"{progress['chunks_written']} chunks gravados ({progress['chunks_per_second']} chunks/s)"
+        ))
+    progress_bar.empty()
+    
+    if job["status"] != "succeeded":
+        return None, job.get("error") or str(job.get("result"))
+    return job["result"], None
+
+
 # ============================================================================
 # SIDEBAR
 # ============================================================================
@@ -389,13 +424,8 @@ with st.sidebar:
             if st.button("Ingerir Mono"):
                 try:
                     with st.spinner("Processando..."):
-                        response = requests.post(
-                            f"{MONOLITHIC_URL}/ingest",
-                            json={"directory_path": folder_path},
-                            timeout=300
-                        )
-                        if response.status_code == 200:
-                            result = response.json()
+                        result, error = run_ingest_job(MONOLITHIC_URL, folder_path)
+                        if error is None:
                             st.session_state.last_ingest_mono = (
                                 result.get('chunks_added')
                                 or result.get('documents_added')
@@ -406,10 +436,10 @@ with st.sidebar:
                             st.session_state.last_ingest_mono_raw = result
                         else:
                             st.session_state.last_ingest_mono = None
-                            st.session_state.last_ingest_mono_error = response.text
+                            st.session_state.last_ingest_mono_error = error
                             st.session_state.last_ingest_mono_raw = None
                             st.error("Erro ao ingerir no monolítico")
-                            record_failure("monolithic", "ingest", response.text)
+                            record_failure("monolithic", "ingest", error)
                 except Exception as e:
                     st.session_state.last_ingest_mono = None
                     st.session_state.last_ingest_mono_error = str(e)
@@ -421,13 +451,8 @@ with st.sidebar:
             if st.button("Ingerir Dist"):
                 try:
                     with st.spinner("Processando..."):
-                        response = requests.post(
-                            f"{DISTRIBUTED_URL}/ingest",
-                            json={"directory_path": folder_path},
-                            timeout=300
-                        )
-                        if response.status_code == 200:
-                            result = response.json()
+                        result, error = run_ingest_job(DISTRIBUTED_URL, folder_path)
+                        if error is None:
                             st.session_state.last_ingest_dist = (
                                 result.get('chunks_added')
                                 or result.get('documents_added')
@@ -438,10 +463,10 @@ with st.sidebar:
                             st.session_state.last_ingest_dist_raw = result
                         else:
                             st.session_state.last_ingest_dist = None
-                            st.session_state.last_ingest_dist_error = response.text
+                            st.session_state.last_ingest_dist_error = error
                             st.session_state.last_ingest_dist_raw = None
                             st.error("Erro ao ingerir no distribuído")
-                            record_failure("distributed", "ingest", response.text)
+                            record_failure("distributed", "ingest", error)
                 except Exception as e:
                     st.session_state.last_ingest_dist = None
                     st.session_state.last_ingest_dist_error = str(e)
@@ -849,6 +874,77 @@ with tab_analytics:
     else:
         st.info("Execute um teste para registrar resultados.")
 
+    st.markdown("---")
+    st.subheader("Transporte gRPC: TCP vs Socket Unix")
+    st.caption(
+        "Mede um RPC pequeno do gateway até o serviço pelos dois transportes. "
+        "O serviço precisa escutar nos dois endereços (ex.: "
+        "EMBEDDING_SERVICE_LISTEN=[::]:50051,unix:/tmp/rag-embedding.sock); "
+        "os endereços vêm da configuração do gateway."
+    )
+    with st.form("transport_test_form"):
+        transport_service = st.selectbox("Serviço", ["embedding", "vector", "llm"])
+        transport_requests = st.number_input("Requisições por transporte", min_value=50, max_value=20000, value=1000, step=50)
+        transport_concurrency = st.slider("Concorrência", min_value=1, max_value=64, value=1)
+        submitted_transport = st.form_submit_button("Comparar transportes")
+        if submitted_transport:
+            try:
+                response = requests.post(
+                    f"{DISTRIBUTED_URL}/benchmark/transport",
+                    json={
+                        "service": transport_service,
+                        "requests": int(transport_requests),
+                        "concurrency": transport_concurrency
+                    },
+                    timeout=300
+                )
+                if response.status_code == 200:
+                    result = response.json()
+                    st.session_state.transport_results.append(result)
+                    failed = {
+                        name: data["error"] for name, data in result["transports"].items() if "error" in data
+                    }
+                    speedup = result.get("uds_speedup_p50")
+                    if failed:
+                        st.warning(f"Transportes com erro: {failed}")
+                    elif speedup is None:
+                        st.info("Sem p50 nos dois transportes para comparar.")
+                    else:
+                        st.success(f"Socket Unix {speedup:.2f}x mais rápido no p50.")
+                else:
+                    st.error(f"Erro {response.status_code}: {response.text}")
+            except Exception as e:
+                record_failure("distributed", "transport_benchmark", str(e))
+                st.error(f"Falha ao executar benchmark: {e}")
+
+    if st.session_state.transport_results:
+        transport_rows = []
+        for run_index, result in enumerate(st.session_state.transport_results, start=1):
+            for name, data in result["transports"].items():
+                if "error" in data:
+                    continue
+                transport_rows.append({
+                    "Execução": f"#{run_index} {result['service']} ({result['rpc']}, c={result['concurrency']})",
+                    "Transporte": "TCP" if name == "tcp" else "Socket Unix",
+                    "p50 (ms)": data["p50_ms"],
+                    "p95 (ms)": data["p95_ms"],
+                    "p99 (ms)": data["p99_ms"],
+                    "Throughput (req/s)": data["throughput_rps"]
+                })
+        if transport_rows:
+            transport_df = pd.DataFrame(transport_rows)
+            fig_transport = px.bar(
+                transport_df,
+                x="Execução",
+                y="p50 (ms)",
+                color="Transporte",
+                barmode="group",
+                hover_data=["p95 (ms)", "p99 (ms)", "Throughput (req/s)"],
+                title="Latência p50 por transporte"
+            )
+            st.plotly_chart(fig_transport, use_container_width=True)
+            st.dataframe(transport_df)
+
 # ============================================================================
 # TAB SOBRE
 # ============================================================================
@@ -0,0 +1,11 @@
+"""
+Configuração dos testes: módulos importáveis como nos scripts do projeto
+"""
+
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / "distributed" / "gateway"))
@@ -0,0 +1,157 @@
+"""
+Testes do controle de admissão: recusa com fila cheia, prazo na fila e Retry-After
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from shared.admission import AdmissionController, AdmissionRejected
+
+
+def occupy(controller: AdmissionController, count: int):
+    """Reserva count vagas e devolve os inícios para release()"""
+    return [controller.acquire() for _ in range(count)]
+
+
+def wait_for(predicate, timeout: float = 2.0):
+    deadline = time.perf_counter() + timeout
+    while not predicate():
+        assert time.perf_counter() < deadline, "condição não atingida"
+        time.sleep(0.005)
+
+
+def test_admits_up_to_max_concurrency():
+    controller = AdmissionController(max_concurrency=2, max_queue=1, queue_timeout=1)
+    
+    with controller.admit():
+        with controller.admit():
+            assert controller.get_stats()["active"] == 2
+    
+    stats = controller.get_stats()
+    assert stats["active"] == 0
+    assert stats["admitted"] == 2
+    assert stats["service_time_s"]["count"] == 2
+
+
+def test_rejects_when_queue_is_full():
+    controller = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=5)
+    slots = occupy(controller, 1)
+    
+    # Um na fila esperando a vaga; o próximo é recusado na hora
+    queued = threading.Thread(target=lambda: controller.release(controller.acquire()))
+    queued.start()
+    wait_for(lambda: controller.get_stats()["queue_depth"] == 1)
+    
+    started = time.perf_counter()
+    with pytest.raises(AdmissionRejected) as error:
+        controller.acquire()
+    assert time.perf_counter() - started < 0.5
+    assert error.value.retry_after >= 1
+    assert controller.rejected == 1
+    
+    controller.release(slots[0])
+    queued.join(timeout=2)
+    stats = controller.get_stats()
+    assert stats["admitted"] == 2
+    assert stats["active"] == 0 and stats["queue_depth"] == 0
+
+
+def test_times_out_in_queue():
+    controller = AdmissionController(max_concurrency=1, max_queue=4, queue_timeout=0.1)
+    slots = occupy(controller, 1)
+    
+    started = time.perf_counter()
+    with pytest.raises(AdmissionRejected) as error:
+        controller.acquire()
+    elapsed = time.perf_counter() - started
+    
+    assert 0.1 <= elapsed < 1.0
+    assert "fila" in str(error.value)
+    assert controller.timed_out == 1
+    assert controller.rejected == 0
+    assert controller.get_stats()["queue_depth"] == 0
+    
+    controller.release(slots[0])
+    # A vaga volta a ser concedida depois do timeout
+    controller.release(controller.acquire())
+    assert controller.get_stats()["active"] == 0
+
+
+def test_released_slot_goes_to_queued_request():
+    controller = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=2)
+    slots = occupy(controller, 1)
+    admitted = threading.Event()
+    
+    def queued():
+        with controller.admit():
+            admitted.set()
+    
+    thread = threading.Thread(target=queued)
+    thread.start()
+    wait_for(lambda: controller.get_stats()["queue_depth"] == 1)
+    assert not admitted.is_set()
+    
+    controller.release(slots[0])
+    thread.join(timeout=2)
+    assert admitted.is_set()
+    assert controller.timed_out == 0
+
+
+def test_retry_after_without_history_defaults_to_one_second():
+    controller = AdmissionController(max_concurrency=2, max_queue=4, queue_timeout=1)
+    assert controller.retry_after() == 1
+
+
+def test_retry_after_scales_with_service_time_and_queue():
+    controller = AdmissionController(max_concurrency=2, max_queue=8, queue_timeout=1)
+    for _ in range(3):
+        controller.service_time_histogram.observe(4.0)
+    
+    # Ninguém na fila: meia rodada de 4s
+    assert controller.retry_after() == 2
+    
+    # Três na fila à frente: (3 + 1) / 2 rodadas de 4s
+    controller._waiting = 3
+    assert controller.retry_after() == 8
+
+
+def test_rejection_carries_retry_after():
+    controller = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=0.05)
+    controller.service_time_histogram.observe(3.0)
+    slots = occupy(controller, 1)
+    
+    # Estourou o prazo ainda contado na fila: (1 + 1) / 1 rodadas de 3s
+    with pytest.raises(AdmissionRejected) as error:
+        controller.acquire()
+    assert error.value.retry_after == 6
+    
+    controller.release(slots[0])
+
+
+def test_admit_async_releases_slot_when_cancelled_in_queue():
+    controller = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=2)
+    
+    async def scenario():
+        slots = occupy(controller, 1)
+        
+        async def waiter():
+            async with controller.admit_async():
+                pass
+        
+        task = asyncio.create_task(waiter())
+        while controller.get_stats()["queue_depth"] == 0:
+            await asyncio.sleep(0.005)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        
+        # A thread de espera ainda obtém a vaga e a devolve sozinha
+        controller.release(slots[0])
+        while controller.admitted < 2 or controller.get_stats()["active"]:
+            await asyncio.sleep(0.005)
+    
+    asyncio.run(asyncio.wait_for(scenario(), timeout=5))
+    assert controller.get_stats()["active"] == 0
@@ -0,0 +1,149 @@
+"""
+Testes do backend NumPy: upsert, remoção, compactação e refresh de leitores
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from shared.numpy_store import NumpyBackend, NumpyIndexError
+
+DIM = 4
+
+
+def vector(index: int) -> np.ndarray:
+    """Vetor unitário no eixo index: similaridade 1 consigo, 0 com os demais"""
+    v = np.zeros(DIM, dtype=np.float32)
+    v[index] = 1.0
+    return v
+
+
+def add(backend: NumpyBackend, ids, texts, axes):
+    backend.upsert(list(ids), list(texts), np.stack([vector(a) for a in axes]),
+                   [{"source": doc_id} for doc_id in ids])
+
+
+def top(backend: NumpyBackend, axis: int, n: int = 1):
+    results = backend.query(vector(axis), n)
+    return list(zip(results["ids"][0], results["documents"][0]))
+
+
+@pytest.fixture
+def index_dir(tmp_path):
+    return str(tmp_path / "numpy_index")
+
+
+def test_upsert_appends_and_tombstones_previous_row(index_dir):
+    backend = NumpyBackend(index_dir, compact_ratio=10)
+    add(backend, ["a", "b"], ["texto a", "texto b"], [0, 1])
+    
+    # Mesmo ID com conteúdo novo: linha nova no fim, a antiga vira tombstone
+    add(backend, ["a"], ["texto a v2"], [2])
+    
+    assert backend.count() == 2
+    assert backend._size == 3
+    assert backend._dead == {0}
+    assert top(backend, 2) == [("a", "texto a v2")]
+    # A linha antiga não aparece mais na busca
+    assert [doc_id for doc_id, _ in top(backend, 0, n=2)].count("a") == 1
+
+
+def test_upsert_is_persisted_for_new_readers(index_dir):
+    backend = NumpyBackend(index_dir, compact_ratio=10)
+    add(backend, ["a", "b"], ["texto a", "texto b"], [0, 1])
+    add(backend, ["b"], ["texto b v2"], [3])
+    
+    reader = NumpyBackend(index_dir, read_only=True)
+    assert reader.count() == 2
+    assert top(reader, 3) == [("b", "texto b v2")]
+
+
+def test_delete_removes_from_search_and_metadata(index_dir):
+    backend = NumpyBackend(index_dir, compact_ratio=10)
+    add(backend, ["a", "b", "c"], ["texto a", "texto b", "texto c"], [0, 1, 2])
+    
+    backend.delete(["b", "inexistente"])
+    
+    assert backend.count() == 2
+    assert "b" not in backend.get_metadatas("source", "b")
+    results = backend.query(vector(1), 3)
+    assert sorted(results["ids"][0]) == ["a", "c"]
+
+
+def test_delete_everything_returns_empty_results(index_dir):
+    backend = NumpyBackend(index_dir, compact_ratio=10)
+    add(backend, ["a"], ["texto a"], [0])
+    backend.delete(["a"])
+    
+    assert backend.count() == 0
+    assert backend.query(vector(0), 5)["ids"] == [[]]
+
+
+def test_compaction_writes_new_generation(index_dir):
+    backend = NumpyBackend(index_dir, compact_ratio=0.4)
+    add(backend, ["a", "b", "c", "d"], ["a", "b", "c", "d"], [0, 1, 2, 3])
+    first_generation = backend._generation
+    old_vectors, old_records = backend.vectors_path, backend.records_path
+    
+    # 2 tombstones em 6 linhas ainda não compacta; o terceiro passa de 40%
+    add(backend, ["a", "b"], ["a2", "b2"], [1, 2])
+    assert backend._generation == first_generation
+    add(backend, ["d"], ["d2"], [0])
+    
+    assert backend._generation == first_generation + 1
+    assert backend._dead == set()
+    assert backend._size == 4
+    assert not os.path.exists(old_vectors) and not os.path.exists(old_records)
+    assert top(backend, 0) == [("d", "d2")]
+    
+    reader = NumpyBackend(index_dir, read_only=True)
+    assert reader.count() == 4
+    assert top(reader, 1) == [("a", "a2")]
+    assert top(reader, 3) == [("c", "c")]
+
+
+def test_reader_follows_writer(index_dir):
+    writer = NumpyBackend(index_dir, compact_ratio=0.5)
+    add(writer, ["a", "b"], ["texto a", "texto b"], [0, 1])
+    reader = NumpyBackend(index_dir, read_only=True)
+    assert reader.count() == 2
+    
+    # Appends: o leitor lê só os registros novos
+    add(writer, ["c"], ["texto c"], [2])
+    assert reader.count() == 3
+    assert top(reader, 2) == [("c", "texto c")]
+    
+    # Upsert e remoção: tombstones vêm do cabeçalho
+    add(writer, ["a"], ["texto a v2"], [3])
+    writer.delete(["b"])
+    assert reader.count() == 2
+    assert top(reader, 3) == [("a", "texto a v2")]
+    assert "b" not in reader.query(vector(1), 5)["ids"][0]
+    
+    # Compactação troca a geração: o leitor recarrega
+    add(writer, ["c"], ["texto c v2"], [0])
+    assert reader.count() == 2
+    assert reader._generation == writer._generation
+    assert top(reader, 0) == [("c", "texto c v2")]
+    
+    writer.reset()
+    assert reader.count() == 0
+
+
+def test_second_writer_is_rejected(index_dir):
+    writer = NumpyBackend(index_dir)
+    add(writer, ["a"], ["texto a"], [0])
+    
+    with pytest.raises(NumpyIndexError):
+        NumpyBackend(index_dir)
+    # Leitores continuam permitidos
+    assert NumpyBackend(index_dir, read_only=True).count() == 1
+
+
+def test_dimension_mismatch_is_rejected(index_dir):
+    backend = NumpyBackend(index_dir)
+    add(backend, ["a"], ["texto a"], [0])
+    
+    with pytest.raises(ValueError):
+        backend.upsert(["b"], ["texto b"], np.ones((1, DIM + 1), dtype=np.float32), [{}])
@@ -0,0 +1,197 @@
+"""
+Testes de retries e hedging do gateway com stubs falsos (sem servidores gRPC)
+"""
+
+import asyncio
+import itertools
+from contextlib import contextmanager
+
+import grpc
+import pytest
+
+from resilience import HedgeBudget, ResilientCaller
+
+
+class FakeRpcError(grpc.RpcError):
+    def __init__(self, code: grpc.StatusCode):
+        super().__init__(code.name)
+        self._code = code
+    
+    def code(self) -> grpc.StatusCode:
+        return self._code
+
+
+class FakeStub:
+    """Réplica falsa: responde após delay ou falha com os códigos de errors, em ordem"""
+    
+    def __init__(self, name: str, delay: float = 0.0, errors=()):
+        self.name = name
+        self.delay = delay
+        self.errors = list(errors)
+        self.calls = 0
+        self.cancelled = 0
+        self.timeouts = []
+    
+    async def EmbedQuery(self, timeout):
+        self.calls += 1
+        self.timeouts.append(timeout)
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.errors:
+            raise FakeRpcError(self.errors.pop(0))
+        return self.name
+
+
+class FakePool:
+    """Pool round-robin com a interface usada por ResilientCaller (lease, available_count)"""
+    
+    def __init__(self, *stubs: FakeStub):
+        self.stubs = stubs
+        self._next = itertools.cycle(stubs)
+    
+    @contextmanager
+    def lease(self):
+        yield next(self._next)
+    
+    def available_count(self) -> int:
+        return len(self.stubs)
+
+
+def make_caller(**overrides) -> ResilientCaller:
+    options = dict(hedging_enabled=False, backoff_ms=1, max_backoff_ms=5, hedge_min_samples=5,
+                   latency_window=50, hedge_budget_percent=100, hedge_burst=3)
+    options.update(overrides)
+    return ResilientCaller(**options)
+
+
+def embed_query(caller: ResilientCaller, pool: FakePool):
+    return asyncio.run(caller.call("EmbedQuery", pool, lambda stub, timeout: stub.EmbedQuery(timeout)))
+
+
+def warm_latencies(caller: ResilientCaller, seconds: float = 0.01):
+    """Amostras suficientes para o hedging usar o p95"""
+    caller.policies["EmbedQuery"].latencies.extend([seconds] * caller.hedge_min_samples)
+
+
+def test_hedge_budget_accrues_up_to_burst():
+    budget = HedgeBudget(ratio=0.5, burst=2)
+    
+    assert not budget.try_acquire()
+    assert budget.throttled == 1
+    
+    for _ in range(10):
+        budget.on_call()
+    assert budget.tokens == 2
+    
+    assert budget.try_acquire() and budget.try_acquire()
+    assert not budget.try_acquire()
+    assert budget.throttled == 2
+
+
+def test_retries_transient_failure():
+    stub = FakeStub("a", errors=[grpc.StatusCode.UNAVAILABLE])
+    caller = make_caller()
+    
+    assert embed_query(caller, FakePool(stub)) == "a"
+    
+    policy = caller.policies["EmbedQuery"]
+    assert stub.calls == 2
+    assert policy.retried == 1
+    assert policy.failures == 0
+    assert stub.timeouts == [policy.timeout, policy.timeout]
+
+
+def test_retry_moves_to_next_replica():
+    failing = FakeStub("a", errors=[grpc.StatusCode.DEADLINE_EXCEEDED])
+    healthy = FakeStub("b")
+    caller = make_caller()
+    
+    assert embed_query(caller, FakePool(failing, healthy)) == "b"
+    assert caller.policies["EmbedQuery"].deadline_exceeded == 1
+
+
+def test_gives_up_after_retries():
+    stub = FakeStub("a", errors=[grpc.StatusCode.UNAVAILABLE] * 10)
+    caller = make_caller()
+    policy = caller.policies["EmbedQuery"]
+    
+    with pytest.raises(grpc.RpcError) as error:
+        embed_query(caller, FakePool(stub))
+    
+    assert error.value.code() == grpc.StatusCode.UNAVAILABLE
+    assert stub.calls == policy.retries + 1
+    assert policy.retried == policy.retries
+    assert policy.failures == 1
+
+
+def test_does_not_retry_non_retryable_codes():
+    stub = FakeStub("a", errors=[grpc.StatusCode.INVALID_ARGUMENT])
+    caller = make_caller()
+    
+    with pytest.raises(grpc.RpcError):
+        embed_query(caller, FakePool(stub))
+    
+    assert stub.calls == 1
+    assert caller.policies["EmbedQuery"].retried == 0
+
+
+def test_hedge_wins_over_slow_replica():
+    slow = FakeStub("lenta", delay=1.0)
+    fast = FakeStub("rápida")
+    caller = make_caller(hedging_enabled=True)
+    warm_latencies(caller)
+    
+    assert embed_query(caller, FakePool(slow, fast)) == "rápida"
+    
+    policy = caller.policies["EmbedQuery"]
+    assert policy.hedged == 1
+    assert policy.hedge_wins == 1
+    # A cópia perdedora é cancelada
+    assert slow.cancelled == 1
+    assert caller.hedge_budget.tokens == 0
+
+
+def test_hedge_throttled_without_budget():
+    slow = FakeStub("lenta", delay=0.05)
+    fast = FakeStub("rápida")
+    caller = make_caller(hedging_enabled=True, hedge_budget_percent=0)
+    warm_latencies(caller)
+    
+    assert embed_query(caller, FakePool(slow, fast)) == "lenta"
+    
+    assert caller.policies["EmbedQuery"].hedged == 0
+    assert caller.hedge_budget.throttled == 1
+    assert fast.calls == 0
+
+
+def test_no_hedge_with_single_replica_or_few_samples():
+    caller = make_caller(hedging_enabled=True)
+    slow = FakeStub("lenta", delay=0.05)
+    
+    # Uma réplica: a cópia cairia no mesmo servidor
+    warm_latencies(caller)
+    assert embed_query(caller, FakePool(slow)) == "lenta"
+    
+    # Sem amostras suficientes para o p95
+    caller.policies["EmbedQuery"].latencies.clear()
+    assert embed_query(caller, FakePool(slow, FakeStub("rápida"))) == "lenta"
+    
+    assert caller.policies["EmbedQuery"].hedged == 0
+    assert caller.hedge_budget.throttled == 0
+
+
+def test_hedge_falls_back_when_copy_fails():
+    slow = FakeStub("lenta", delay=0.1)
+    broken = FakeStub("quebrada", errors=[grpc.StatusCode.UNAVAILABLE])
+    caller = make_caller(hedging_enabled=True)
+    warm_latencies(caller)
+    
+    assert embed_query(caller, FakePool(slow, broken)) == "lenta"
+    
+    policy = caller.policies["EmbedQuery"]
+    assert policy.hedged == 1
+    assert policy.hedge_wins == 0
+    assert policy.retried == 0
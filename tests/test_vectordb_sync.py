@@ -0,0 +1,128 @@
+"""
+Testes da ingestão incremental: VectorDB.sync_source e prune_sources (backend NumPy)
+"""
+
+import numpy as np
+import pytest
+
+from shared.ingest import make_document_id
+from shared.vectordb import VectorDB, ReadOnlyIndexError
+
+SOURCE = "/docs/manual.txt"
+DIRECTORY = "/docs"
+
+
+def chunks(texts, source=SOURCE, **extra):
+    """IDs e metadados como a ingestão gera para uma fonte"""
+    ids = [make_document_id(source, text) for text in texts]
+    metadatas = [
+        {"source": "manual.txt", "path": source, "directory": DIRECTORY, "chunk_index": i, **extra}
+        for i in range(len(texts))
+    ]
+    return ids, metadatas
+
+
+def index(db: VectorDB, texts, source=SOURCE, **extra):
+    """Sincroniza a fonte e grava só os chunks ausentes, como a ingestão faz"""
+    ids, metadatas = chunks(texts, source, **extra)
+    result = db.sync_source(source, ids, metadatas)
+    missing = result["missing"]
+    if missing:
+        embeddings = np.random.default_rng(0).random((len(missing), 4), dtype=np.float32)
+        db.add_documents([texts[i] for i in missing], embeddings,
+                         [metadatas[i] for i in missing], [ids[i] for i in missing])
+    return result
+
+
+@pytest.fixture
+def db(tmp_path):
+    return VectorDB(str(tmp_path / "store"), backend="numpy")
+
+
+def test_new_source_is_all_missing(db):
+    result = index(db, ["a", "b", "c"])
+    
+    assert result == {"missing": [0, 1, 2], "updated": 0, "unchanged": 0, "deleted": 0}
+    assert db.get_document_count() == 3
+
+
+def test_unchanged_source_writes_nothing(db):
+    index(db, ["a", "b", "c"])
+    
+    result = index(db, ["a", "b", "c"])
+    
+    assert result == {"missing": [], "updated": 0, "unchanged": 3, "deleted": 0}
+    assert db.get_document_count() == 3
+
+
+def test_edited_source_adds_and_deletes_chunks(db):
+    index(db, ["a", "b", "c"])
+    
+    # "b" mudou de conteúdo (novo ID) e "c" saiu do arquivo
+    result = index(db, ["a", "b2"])
+    
+    assert result["missing"] == [1]
+    assert result["deleted"] == 2
+    assert result["unchanged"] == 1 and result["updated"] == 0
+    assert db.get_document_count() == 2
+    stored = db.backend.get_metadatas("path", SOURCE)
+    assert set(stored) == set(chunks(["a", "b2"])[0])
+
+
+def test_moved_chunk_is_updated_not_rewritten(db):
+    index(db, ["a", "b"])
+    
+    # Chunk novo no início: "a" e "b" mantêm o ID, mas mudam de chunk_index
+    result = index(db, ["novo", "a", "b"])
+    
+    assert result == {"missing": [0], "updated": 2, "unchanged": 0, "deleted": 0}
+    assert db.get_document_count() == 3
+
+
+def test_changed_metadata_is_updated_in_place(db):
+    index(db, ["a", "b"], modified="1")
+    
+    result = index(db, ["a", "b"], modified="2")
+    
+    assert result == {"missing": [], "updated": 2, "unchanged": 0, "deleted": 0}
+    stored = db.backend.get_metadatas("path", SOURCE)
+    assert {metadata["modified"] for metadata in stored.values()} == {"2"}
+
+
+def test_metadata_compared_as_strings(db):
+    index(db, ["a"], size=10)
+    
+    result = index(db, ["a"], size="10")
+    
+    assert result["unchanged"] == 1 and result["updated"] == 0
+
+
+def test_sync_only_touches_its_source(db):
+    index(db, ["a", "b"])
+    index(db, ["x"], source="/docs/outro.txt")
+    
+    result = index(db, ["a"])
+    
+    assert result["deleted"] == 1
+    assert db.get_document_count() == 2
+    assert len(db.backend.get_metadatas("path", "/docs/outro.txt")) == 1
+
+
+def test_prune_removes_sources_no_longer_on_disk(db):
+    index(db, ["a", "b"])
+    index(db, ["x"], source="/docs/outro.txt")
+    
+    removed = db.prune_sources(DIRECTORY, [SOURCE])
+    
+    assert removed == 1
+    assert db.get_document_count() == 2
+    assert db.backend.get_metadatas("path", "/docs/outro.txt") == {}
+
+
+def test_read_only_db_refuses_sync(db, tmp_path):
+    index(db, ["a"])
+    reader = VectorDB(str(tmp_path / "store"), backend="numpy", read_only=True)
+    
+    ids, metadatas = chunks(["a"])
+    with pytest.raises(ReadOnlyIndexError):
+        reader.sync_source(SOURCE, ids, metadatas)